@@ -0,0 +1,209 @@
+import hmac
+import json
+import math
+import ipaddress
+import time
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import UPLOADS_IN_FLIGHT, UPLOADS_REJECTED_TOTAL
+from app.core.queue_stats import QueueStats
+from app.core.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket atómico (compartido entre réplicas de la API):
+# KEYS[1] = bucket del cliente; ARGV = tasa (tokens/s), capacidad, ahora (epoch), costo, TTL
+# Retorna {1, "0"} si se admite, o {0, segundos_hasta_tener_tokens}.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return {allowed, tostring(retry)}
+"""
+
+class AdmissionControl:
+    """
+    Control de admisión de scanDocument/scanBundle:
+    - Token bucket por cliente (API key configurada del header ADMISSION_API_KEY_HEADER o, si no, IP) en Redis.
+      Límites por cliente con ADMISSION_CLIENT_LIMITS; el resto usa ADMISSION_RATE_PER_S/ADMISSION_BURST.
+    - Techo de profundidad por cola (la del modo pedido): por encima de ADMISSION_MAX_QUEUE_DEPTH se responde BUSY con
+      el tiempo estimado para drenar el excedente.
+    Si Redis no responde se opera en modo abierto (se admite), igual que SingleFlight.
+    """
+
+    PREFIX = "avanza:rl"
+    # Último snapshot de colas por proceso ({cola: stat}): evita un round-trip extra a Redis por cada upload
+    _depth_cache: Tuple[float, Optional[dict]] = (0.0, None)
+
+    @staticmethod
+    def _trusted_proxy(host: Optional[str]) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except (TypeError, ValueError):
+            return False
+        for network in settings.ADMISSION_TRUSTED_PROXIES:
+            try:
+                if address in ipaddress.ip_network(network, strict=False):
+                    return True
+            except ValueError:
+                logger.warning(f"AdmissionControl: proxy de confianza inválido: {network!r}")
+        return False
+
+    @staticmethod
+    def client_ip(request) -> str:
+        """
+        IP del cliente. Si la conexión llega de un proxy de confianza, se recorre X-Forwarded-For de derecha
+        a izquierda saltando los proxies de confianza: la primera IP restante es la que agregó nuestro ingress
+        (las de más a la izquierda las escribe el cliente y no son confiables).
+        """
+        host = request.client.host if request is not None and request.client else None
+        if not host:
+            return "unknown"
+        if not AdmissionControl._trusted_proxy(host):
+            return host
+        forwarded = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        for hop in reversed(forwarded):
+            if not AdmissionControl._trusted_proxy(hop):
+                return hop
+        return forwarded[0] if forwarded else host
+
+    @staticmethod
+    def client_id(request) -> str:
+        """
+        Identidad del cliente para el token bucket. El header de API key no está autenticado: sólo se
+        respeta si la key está configurada en ADMISSION_CLIENT_LIMITS. Cualquier otro valor se trata como
+        anónimo (por IP), de modo que rotar keys inventadas no abre buckets nuevos.
+        """
+        api_key = request.headers.get(settings.ADMISSION_API_KEY_HEADER) if request is not None else None
+        if api_key and any(hmac.compare_digest(api_key.encode(), known.encode())
+                           for known in settings.ADMISSION_CLIENT_LIMITS):
+            return f"key:{api_key}"
+        return f"ip:{AdmissionControl.client_ip(request)}"
+
+    @staticmethod
+    def limits_for(client_id: str) -> Tuple[float, float]:
+        """(tokens por segundo, capacidad) del cliente."""
+        kind, _, name = client_id.partition(':')
+        default = (settings.ADMISSION_RATE_PER_S, settings.ADMISSION_BURST)
+        return settings.ADMISSION_CLIENT_LIMITS.get(name, default) if kind == 'key' else default
+
+    @staticmethod
+    def _bucket_key(client_id: str) -> str:
+        # Las API keys no se guardan en claro en Redis
+        return f"{AdmissionControl.PREFIX}:{hashlib.sha256(client_id.encode()).hexdigest()[:32]}"
+
+    @staticmethod
+    async def take(client_id: str, cost: int = 1) -> Optional[float]:
+        """Consume `cost` tokens. Retorna None si se admite o los segundos a esperar antes de reintentar."""
+        rate, burst = AdmissionControl.limits_for(client_id)
+        if rate <= 0:
+            return None
+        # Un envío nunca cuesta más que la capacidad (si no, un bundle nunca sería admitido)
+        cost = min(cost, burst)
+        ttl = math.ceil(burst / rate) + 60
+        try:
+            allowed, retry = await get_async_redis().eval(
+                _TOKEN_BUCKET_SCRIPT, 1, AdmissionControl._bucket_key(client_id),
+                rate, burst, time.time(), cost, ttl
+            )
+        except Exception as e:
+            logger.warning(f"AdmissionControl no disponible, se admite sin límite: {e}")
+            return None
+        if int(allowed):
+            return None
+        return round(max(float(retry), settings.ADMISSION_MIN_RETRY_S), 1)
+
+    @staticmethod
+    async def _queue_stat(queue: str) -> Optional[dict]:
+        cached_at, stats = AdmissionControl._depth_cache
+        if time.time() - cached_at > settings.ADMISSION_DEPTH_CACHE_S:
+            stats = {s['queue']: s for s in await QueueStats.snapshot_async()}
+            AdmissionControl._depth_cache = (time.time(), stats)
+        return (stats or {}).get(queue)
+
+    @staticmethod
+    async def queue_busy(queue: Optional[str] = None) -> Optional[float]:
+        """Segundos sugeridos de espera si la cola (por defecto la principal) supera el techo; None si hay espacio."""
+        if settings.ADMISSION_MAX_QUEUE_DEPTH <= 0:
+            return None
+        try:
+            stat = await AdmissionControl._queue_stat(queue or settings.CELERY_DEFAULT_QUEUE)
+        except Exception as e:
+            logger.warning(f"AdmissionControl: profundidad de cola no disponible: {e}")
+            return None
+        if not stat or stat['depth'] < settings.ADMISSION_MAX_QUEUE_DEPTH:
+            return None
+        if stat['avg_service_s'] is None:
+            return settings.ADMISSION_BUSY_RETRY_S
+        # Tiempo para que el excedente sobre el techo se drene con los slots disponibles
+        excess = stat['depth'] - settings.ADMISSION_MAX_QUEUE_DEPTH + 1
+        drain = excess / max(stat['slots'], 1) * stat['avg_service_s']
+        return round(max(drain, settings.ADMISSION_MIN_RETRY_S), 1)
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI: limita los uploads multipart simultáneos por proceso y su tamaño declarado.
+    Rechaza antes de leer el cuerpo, de modo que el pod no bufferiza uploads cuando los workers
+    están saturados (Starlette parsea el multipart completo antes de llegar al resolver).
+    """
+
+    def __init__(self, app, max_concurrent: int, max_bytes: int, retry_after: float):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after
+        self.active = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        if not headers.get(b'content-type', b'').startswith(b'multipart/form-data'):
+            return await self.app(scope, receive, send)
+
+        length = headers.get(b'content-length')
+        if self.max_bytes and length is None:
+            return await self._reject(send, 411, 'LENGTH_REQUIRED', "Content-Length requerido para uploads")
+        # RFC 9110: sólo dígitos (int() aceptaría signos, espacios y "_")
+        if length is not None and not length.isdigit():
+            return await self._reject(send, 400, 'BAD_REQUEST', "Content-Length inválido")
+        if self.max_bytes and int(length) > self.max_bytes:
+            return await self._reject(send, 413, 'TOO_LARGE', f"El upload excede {self.max_bytes} bytes")
+        if self.max_concurrent and self.active >= self.max_concurrent:
+            return await self._reject(send, 503, 'BUSY', "Servicio saturado, reintente en unos segundos",
+                                      self.retry_after)
+
+        self.active += 1
+        UPLOADS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+            UPLOADS_IN_FLIGHT.dec()
+
+    async def _reject(self, send, status: int, code: str, message: str, retry_after: Optional[float] = None):
+        UPLOADS_REJECTED_TOTAL.labels(code).inc()
+        body = json.dumps({'errors': [{'message': message, 'extensions': {'code': code, 'retryAfter': retry_after}}]}).encode()
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if retry_after is not None:
+            headers.append((b'retry-after', str(math.ceil(retry_after)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
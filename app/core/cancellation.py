@@ -0,0 +1,110 @@
+import json
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+class TaskCancelled(BaseException):
+    """
+    Interrumpe el pipeline en un punto de control. Hereda de BaseException (como asyncio.CancelledError)
+    para atravesar los `except Exception` del pipeline, que convertirían la cancelación en un error OCR.
+    status: CANCELLED (cancelOcrTask) o EXPIRED (venció el deadline del cliente o el SLA del doc_type).
+    """
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class CancellationToken:
+    """
+    Estado de cancelación de una tarea del worker: deadline (epoch) y bandera de cancelación en Redis.
+    La bandera se consulta como máximo cada CANCEL_POLL_INTERVAL_S (los puntos de control son baratos).
+    Si Redis no responde se continúa (fail-open), igual que SingleFlight.
+    """
+
+    PREFIX = "avanza:cancel"
+    # Tareas encoladas por la API (cancelOcrTask distingue ids inexistentes) y sus subtareas (header de un bundle)
+    TASKS_PREFIX = "avanza:tasks"
+
+    def __init__(self, task_id: str, deadline: Optional[float] = None):
+        self.task_id = task_id
+        self.deadline = deadline
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"{CancellationToken.PREFIX}:{task_id}"
+
+    @staticmethod
+    def _task_key(task_id: str) -> str:
+        return f"{CancellationToken.TASKS_PREFIX}:{task_id}"
+
+    @staticmethod
+    async def register_async(task_id: str, members: Sequence[str] = ()) -> None:
+        """
+        Registra una tarea encolada (API) y sus subtareas, que también quedan cancelables por separado.
+        Vive lo mismo que un resultado. Un error no impide el encolado: la tarea sólo no será cancelable.
+        """
+        try:
+            pipe = get_async_redis().pipeline(transaction=False)
+            pipe.set(CancellationToken._task_key(task_id), json.dumps(list(members)), ex=settings.RESULT_TTL_DEFAULT_S)
+            for member in members:
+                pipe.set(CancellationToken._task_key(member), "[]", ex=settings.RESULT_TTL_DEFAULT_S)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"CancellationToken: no se pudo registrar {task_id}: {e}")
+
+    @staticmethod
+    async def members_async(task_id: str) -> Optional[List[str]]:
+        """Subtareas de una tarea registrada ([] si no tiene); None si la API no la encoló o ya expiró."""
+        raw = await get_async_redis().get(CancellationToken._task_key(task_id))
+        return None if raw is None else json.loads(raw)
+
+    @staticmethod
+    async def request_async(task_id: str, members: Sequence[str] = ()) -> None:
+        """Marca la tarea y sus subtareas como canceladas (API). La bandera vive lo mismo que un resultado."""
+        pipe = get_async_redis().pipeline(transaction=False)
+        for key in (task_id, *members):
+            pipe.set(CancellationToken._key(key), "1", ex=settings.RESULT_TTL_DEFAULT_S)
+        await pipe.execute()
+
+    def _cancel_requested(self) -> bool:
+        try:
+            return bool(get_redis().exists(self._key(self.task_id)))
+        except Exception as e:
+            logger.warning(f"CancellationToken: estado de cancelación no disponible: {e}")
+            return False
+
+    def check(self, force: bool = False) -> None:
+        """Punto de control: lanza TaskCancelled si la tarea venció o fue cancelada."""
+        now = time.time()
+        if self.deadline is not None and now > self.deadline:
+            raise TaskCancelled('EXPIRED', f"Deadline vencido hace {now - self.deadline:.1f}s")
+        if force or now - self._checked_at >= settings.CANCEL_POLL_INTERVAL_S:
+            self._checked_at = now
+            if self._cancel_requested():
+                raise TaskCancelled('CANCELLED', "Tarea cancelada por el cliente")
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar("cancellation_token", default=None)
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    """Activa el token para los puntos de control del documento en curso."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+def checkpoint() -> None:
+    """Punto de control entre etapas del pipeline. Sin token activo (bulk, benchmarks) no hace nada."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
@@ -4,20 +4,230 @@ from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
 
+def _env_bool(name: str, default: bool) -> bool:
+    """Interpreta variables de entorno tipo bandera (1/true/yes/on)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _env_int_map(name: str, default: str) -> dict:
+    """Interpreta pares CLAVE=entero separados por coma."""
+    result = {}
+    for item in os.getenv(name, default).split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            result[key.strip()] = int(value)
+    return result
+
+def _env_list(name: str, default: str) -> list:
+    """Interpreta valores separados por coma."""
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+def _env_rate_map(name: str, default: str) -> dict:
+    """Interpreta pares CLAVE=tasa:capacidad separados por coma (ej. "bulk=0.5:5,movil=5:50")."""
+    result = {}
+    for item in os.getenv(name, default).split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            rate, _, burst = value.partition(":")
+            result[key.strip()] = (float(rate), float(burst or rate))
+    return result
+
 class Settings:
     """
     Configuración centralizada del microservicio.
     """
     PROJECT_NAME: str = "AvanzaOCR GraphQL Service"
     VERSION: str = "1.0.0"
-    
+
     # Configuración de Redis
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+    # Redis de la aplicación (single-flight, consultas directas al backend)
+    REDIS_URL: str = os.getenv("REDIS_URL", CELERY_RESULT_BACKEND)
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+    # Coalescencia de envíos duplicados
+    SINGLE_FLIGHT_TTL_S: int = int(os.getenv("SINGLE_FLIGHT_TTL_S", "900"))
+    IDEMPOTENCY_TTL_S: int = int(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+    # Un envío no reutiliza una tarea en vuelo cuyo deadline vence más de esta holgura antes que el suyo
+    SINGLE_FLIGHT_DEADLINE_SLACK_S: float = float(os.getenv("SINGLE_FLIGHT_DEADLINE_SLACK_S", "5"))
+
+    # Control de admisión de scanDocument/scanBundle
+    ADMISSION_API_KEY_HEADER: str = os.getenv("ADMISSION_API_KEY_HEADER", "x-api-key")
+    ADMISSION_RATE_PER_S: float = float(os.getenv("ADMISSION_RATE_PER_S", "1"))  # Token bucket por cliente (0 = sin límite)
+    ADMISSION_BURST: float = float(os.getenv("ADMISSION_BURST", "20"))
+    ADMISSION_CLIENT_LIMITS: dict = _env_rate_map("ADMISSION_CLIENT_LIMITS", "")  # "api_key=tasa:capacidad,..."
+    # Proxies/ingress de confianza (IPs o CIDR): sólo detrás de ellos se usa X-Forwarded-For para identificar al cliente
+    ADMISSION_TRUSTED_PROXIES: list = _env_list("ADMISSION_TRUSTED_PROXIES", "")
+    ADMISSION_MAX_QUEUE_DEPTH: int = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "500"))  # Techo global (0 = sin techo)
+    ADMISSION_DEPTH_CACHE_S: float = float(os.getenv("ADMISSION_DEPTH_CACHE_S", "1"))
+    ADMISSION_BUSY_RETRY_S: float = float(os.getenv("ADMISSION_BUSY_RETRY_S", "5"))  # Sin datos para estimar el drenaje
+    ADMISSION_MIN_RETRY_S: float = float(os.getenv("ADMISSION_MIN_RETRY_S", "1"))
+    ADMISSION_MAX_CONCURRENT_UPLOADS: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_UPLOADS", "32"))  # Por proceso de API
+    ADMISSION_MAX_UPLOAD_MB: int = int(os.getenv("ADMISSION_MAX_UPLOAD_MB", "60"))  # Por request (bundle incluido)
+
+    # Índice de casi-duplicados por pHash (misma tarjeta fotografiada varias veces)
+    PHASH_INDEX_ENABLED: bool = _env_bool("PHASH_INDEX_ENABLED", True)
+    PHASH_MAX_DISTANCE: int = int(os.getenv("PHASH_MAX_DISTANCE", "7"))  # Hamming (de 64 bits) para marcar repetición
+    # Capturas parecidas del mismo titular (CUI, NIT, registro) para revisión de fraude
+    PHASH_REVIEW_THRESHOLD: int = int(os.getenv("PHASH_REVIEW_THRESHOLD", "3"))
+    PHASH_TTL_S: int = int(os.getenv("PHASH_TTL_S", str(30 * 86400)))
+
+    # Colas de Celery e introspección de carga (profundidad, tareas activas, ETA)
+    CELERY_DEFAULT_QUEUE: str = os.getenv("CELERY_DEFAULT_QUEUE", "avanza_ocr_queue")
+    CELERY_DEFAULT_ROUTING_KEY: str = os.getenv("CELERY_DEFAULT_ROUTING_KEY", "avanza_ocr_key")
+    CELERY_WORKER_POOL: str = os.getenv("CELERY_WORKER_POOL", "prefork")  # prefork | threads
+    CELERY_WORKER_CONCURRENCY: int | None = int(os.getenv("CELERY_WORKER_CONCURRENCY", "0")) or None
+    # Una cola por modo de scanDocument (BALANCED usa la cola por defecto); workers dedicados con -Q <cola>
+    CELERY_FAST_QUEUE: str = os.getenv("CELERY_FAST_QUEUE", "avanza_ocr_fast_queue")
+    CELERY_FAST_ROUTING_KEY: str = os.getenv("CELERY_FAST_ROUTING_KEY", "avanza_ocr_fast_key")
+    CELERY_ACCURATE_QUEUE: str = os.getenv("CELERY_ACCURATE_QUEUE", "avanza_ocr_accurate_queue")
+    CELERY_ACCURATE_ROUTING_KEY: str = os.getenv("CELERY_ACCURATE_ROUTING_KEY", "avanza_ocr_accurate_key")
+    QUEUE_STATS_WINDOW: int = int(os.getenv("QUEUE_STATS_WINDOW", "100"))  # Muestras del promedio móvil
+    ACTIVE_TASK_STALE_S: int = int(os.getenv("ACTIVE_TASK_STALE_S", "1800"))
+    WORKER_HEARTBEAT_STALE_S: int = int(os.getenv("WORKER_HEARTBEAT_STALE_S", "600"))
+    # Métricas avanza_ocr_queue_*: refresco en segundo plano (el scrape no consulta Redis) y antigüedad máxima exportada
+    QUEUE_STATS_REFRESH_S: float = float(os.getenv("QUEUE_STATS_REFRESH_S", "5"))
+    QUEUE_STATS_MAX_AGE_S: float = float(os.getenv("QUEUE_STATS_MAX_AGE_S", "30"))
+
     # Rutas de archivos
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    TEMP_DIR = os.path.join(BASE_DIR, "media", "temp")
+    # Almacenamiento temporal: TEMP_USE_TMPFS lo ubica en RAM (/dev/shm) salvo que TEMP_DIR sea explícito
+    TEMP_USE_TMPFS: bool = _env_bool("TEMP_USE_TMPFS", False)
+    TEMP_DIR = os.getenv("TEMP_DIR") or (
+        "/dev/shm/avanza_ocr" if TEMP_USE_TMPFS else os.path.join(BASE_DIR, "media", "temp")
+    )
+    TEMP_QUOTA_MB: int = int(os.getenv("TEMP_QUOTA_MB", "2048"))  # 0 = sin cuota
+    TEMP_ORPHAN_MAX_AGE_S: int = int(os.getenv("TEMP_ORPHAN_MAX_AGE_S", "3600"))
+    # Un upload pendiente (tarea en cola o en ejecución) se protege del janitor hasta este máximo (tareas perdidas)
+    TEMP_PENDING_UPLOAD_MAX_S: int = int(os.getenv("TEMP_PENDING_UPLOAD_MAX_S", "86400"))
+    TEMP_JANITOR_INTERVAL_S: int = int(os.getenv("TEMP_JANITOR_INTERVAL_S", "600"))
+
+    # Índice local del Registro Mercantil (validación de patentes sin depender del sitio en línea)
+    REGISTRY_INDEX_ENABLED: bool = _env_bool("REGISTRY_INDEX_ENABLED", True)
+    REGISTRY_INDEX_PATH: str = os.getenv("REGISTRY_INDEX_PATH", os.path.join(BASE_DIR, "media", "registry", "registry.sqlite3"))
+    REGISTRY_INDEX_MAX_AGE_S: int = int(os.getenv("REGISTRY_INDEX_MAX_AGE_S", str(30 * 86400)))
+
+    # Configuración de inferencia OCR (ajustable por tipo de nodo sin tocar código)
+    # Backends soportados:
+    #   - "paddle":        Paddle Inference nativo
+    #   - "paddle_mkldnn": Paddle Inference nativo + MKL-DNN (oneDNN) en CPUs Intel
+    #   - "onnx":          ONNX Runtime sobre modelos exportados (.onnx)
+    OCR_BACKEND: str = os.getenv("OCR_BACKEND", "paddle").strip().lower()
+    OCR_CPU_THREADS: int = int(os.getenv("OCR_CPU_THREADS", "4"))
+    OCR_DET_LIMIT_SIDE_LEN: int = int(os.getenv("OCR_DET_LIMIT_SIDE_LEN", "960"))
+    OCR_DET_LIMIT_TYPE: str = os.getenv("OCR_DET_LIMIT_TYPE", "max")
+    OCR_REC_BATCH_NUM: int = int(os.getenv("OCR_REC_BATCH_NUM", "6"))
+    OCR_USE_ANGLE_CLS: bool = _env_bool("OCR_USE_ANGLE_CLS", True)
+
+    # Pool de predictores en proceso: N predictores con una sola copia de pesos.
+    # Usar con `celery worker --pool threads --concurrency N` y OCR_CPU_THREADS ~= núcleos / N.
+    OCR_PREDICTOR_POOL_SIZE: int = int(os.getenv("OCR_PREDICTOR_POOL_SIZE", "1"))
+
+    # Motor simulado para pruebas de carga (benchmarks.loadtest): el worker duerme en lugar de ejecutar OCR
+    OCR_FAKE_ENGINE: bool = _env_bool("OCR_FAKE_ENGINE", False)
+    OCR_FAKE_LATENCY_MS: float = float(os.getenv("OCR_FAKE_LATENCY_MS", "500"))
+    OCR_FAKE_LATENCY_JITTER_MS: float = float(os.getenv("OCR_FAKE_LATENCY_JITTER_MS", "0"))
+    OCR_FAKE_FAILURE_RATE: float = float(os.getenv("OCR_FAKE_FAILURE_RATE", "0"))
+
+    # Modos por request (scanDocument `mode`): FAST (kiosco, respuesta aproximada en ~2 s),
+    # BALANCED (cascada, por defecto) y ACCURATE (cumplimiento: máxima precisión, sin importar latencia)
+    OCR_MODES = ('FAST', 'BALANCED', 'ACCURATE')
+    OCR_MODE_DEFAULT: str = os.getenv("OCR_MODE_DEFAULT", "BALANCED").strip().upper()
+    OCR_FAST_MODE_MAX_SIDE: int = int(os.getenv("OCR_FAST_MODE_MAX_SIDE", "1280"))  # Resolución objetivo en FAST
+    OCR_ACCURATE_DET_LIMIT_SIDE_LEN: int = int(os.getenv("OCR_ACCURATE_DET_LIMIT_SIDE_LEN", "1600"))
+    OCR_ACCURATE_REC_MODEL_DIR: str | None = os.getenv("OCR_ACCURATE_REC_MODEL_DIR") or None  # Reconocedor server opcional
+
+    # Cascada OCR: pasada rápida en baja resolución y escalamiento por baja confianza o campos faltantes
+    # (carga un segundo predictor en memoria)
+    OCR_CASCADE_ENABLED: bool = _env_bool("OCR_CASCADE_ENABLED", True)
+    OCR_FAST_MAX_SIDE: int = int(os.getenv("OCR_FAST_MAX_SIDE", "1280"))
+    OCR_FAST_DET_LIMIT_SIDE_LEN: int = int(os.getenv("OCR_FAST_DET_LIMIT_SIDE_LEN", "640"))
+    OCR_FAST_REC_MODEL_DIR: str | None = os.getenv("OCR_FAST_REC_MODEL_DIR") or None  # Reconocedor liviano opcional
+    OCR_CASCADE_MIN_CONFIDENCE: float = float(os.getenv("OCR_CASCADE_MIN_CONFIDENCE", "0.85"))
+    OCR_CASCADE_MAX_REGIONS: int = int(os.getenv("OCR_CASCADE_MAX_REGIONS", "8"))
+
+    # OCR por mosaicos de páginas grandes (scans a 300 dpi): mosaicos del tamaño del límite del detector
+    # (sin reducción de la página) procesados en paralelo sobre el pool de predictores
+    OCR_TILING_ENABLED: bool = _env_bool("OCR_TILING_ENABLED", True)
+    # Sólo páginas de documentos carta (las fotos de DPI no ganan nada con mosaicos y pagarían varias inferencias)
+    OCR_TILE_DOC_TYPES: list = _env_list("OCR_TILE_DOC_TYPES", "RTU,PATENTE")
+    OCR_TILE_MIN_SIDE: int = int(os.getenv("OCR_TILE_MIN_SIDE", "2000"))  # Lado mayor a partir del cual se usan mosaicos
+    OCR_TILE_SIZE: int = int(os.getenv("OCR_TILE_SIZE") or 0)  # 0 = límite del detector del predictor usado
+    OCR_TILE_OVERLAP: int = int(os.getenv("OCR_TILE_OVERLAP", "128"))  # Mayor que la altura de una línea de texto
+
+    # Modelos cuantizados INT8: onnx_int8 con `python -m app.services.model_export` (quantize_dynamic);
+    # paddle_int8 con modelos PP-OCR slim (ver README)
+    OCR_QUANTIZED: bool = _env_bool("OCR_QUANTIZED", False)
+    OCR_MODELS_DIR: str = os.getenv("OCR_MODELS_DIR", os.path.join(BASE_DIR, "models"))
+
+    # Rutas explícitas de modelos (tienen prioridad sobre OCR_MODELS_DIR)
+    OCR_DET_MODEL_DIR: str | None = os.getenv("OCR_DET_MODEL_DIR") or None
+    OCR_REC_MODEL_DIR: str | None = os.getenv("OCR_REC_MODEL_DIR") or None
+    OCR_CLS_MODEL_DIR: str | None = os.getenv("OCR_CLS_MODEL_DIR") or None
+
+    # Almacenamiento de resultados (backend de Celery)
+    RESULT_SERIALIZER: str = os.getenv("RESULT_SERIALIZER", "msgpack_zstd")  # msgpack_zstd | json_zstd
+    RESULT_ZSTD_LEVEL: int = int(os.getenv("RESULT_ZSTD_LEVEL", "3"))
+    RESULT_TTL_DEFAULT_S: int = int(os.getenv("RESULT_TTL_DEFAULT_S", "86400"))
+    # TTL por doc_type, formato "RTU=604800,DPI_FRONT=3600" (vacío = todos con RESULT_TTL_DEFAULT_S)
+    RESULT_TTLS: dict = _env_int_map("RESULT_TTLS", "")
+    # Payloads comprimidos mayores a este tamaño se guardan en el blob store (en Redis sólo la referencia)
+    RESULT_INLINE_MAX_BYTES: int = int(os.getenv("RESULT_INLINE_MAX_BYTES", "16384"))
+    # Debe ser el mismo volumen en la API y en todos los workers: el worker escribe el payload y la API lo lee
+    RESULT_BLOB_DIR: str = os.getenv("RESULT_BLOB_DIR", os.path.join(BASE_DIR, "media", "results"))
+
+    # Cancelación y deadlines: SLA por doc_type en segundos desde el encolado ("DPI_FRONT=60,RTU=600"; vacío = sin SLA).
+    # Un deadline del cliente (scanDocument deadlineSeconds) tiene prioridad sobre el SLA.
+    TASK_SLA_S: dict = _env_int_map("TASK_SLA_S", "")
+    CANCEL_POLL_INTERVAL_S: float = float(os.getenv("CANCEL_POLL_INTERVAL_S", "1"))
+
+    # Capturas crudas (texto nativo o layout OCR) por hash de contenido para reparseDocument.
+    # Contienen datos personales: LAYOUT_RETENTION_DAYS acota su vida (0 = sin expiración)
+    LAYOUT_STORE_ENABLED: bool = _env_bool("LAYOUT_STORE_ENABLED", True)
+    LAYOUT_STORE_DIR: str = os.getenv("LAYOUT_STORE_DIR", os.path.join(BASE_DIR, "media", "layouts"))
+    LAYOUT_RETENTION_DAYS: int = int(os.getenv("LAYOUT_RETENTION_DAYS", "30"))
+
+    # Perfilado bajo demanda (flag `profile` de scanDocument); PROFILE_TASKS perfila todas las tareas del worker
+    PROFILE_TASKS: bool = _env_bool("PROFILE_TASKS", False)
+    # El flag `profile` de scanDocument sólo se acepta si está habilitado o con una API key de la lista
+    PROFILE_REQUESTS_ENABLED: bool = _env_bool("PROFILE_REQUESTS_ENABLED", False)
+    PROFILE_API_KEYS: list = _env_list("PROFILE_API_KEYS", "")
+    PROFILE_TOP_N: int = int(os.getenv("PROFILE_TOP_N", "20"))
+    PROFILE_TRACEMALLOC_FRAMES: int = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+    PROFILE_TTL_S: int = int(os.getenv("PROFILE_TTL_S", str(7 * 24 * 3600)))
+
+    # PDFs escaneados: máximo de páginas a rasterizar/OCR (el corte temprano por doc_type suele detenerse antes)
+    PDF_OCR_MAX_PAGES: int = int(os.getenv("PDF_OCR_MAX_PAGES", "6"))
+
+    # Presupuesto de decodificación de imágenes (protección contra decompression bombs)
+    # Por encima de IMAGE_MAX_PIXELS se rechaza; por encima de IMAGE_TARGET_PIXELS se decodifica reducida
+    IMAGE_MAX_PIXELS: int = int(os.getenv("IMAGE_MAX_PIXELS", "150000000"))
+    IMAGE_TARGET_PIXELS: int = int(os.getenv("IMAGE_TARGET_PIXELS", "12000000"))
+
+    # Control de calidad de fotos antes del OCR (nitidez, exposición, reflejos, resolución de la tarjeta)
+    QUALITY_GATE_ENABLED: bool = _env_bool("QUALITY_GATE_ENABLED", True)
+    # También en scanDocument, antes de encolar: carga OpenCV en el proceso de la API (el worker siempre lo aplica)
+    QUALITY_GATE_SYNC: bool = _env_bool("QUALITY_GATE_SYNC", False)
+    # Varianza del Laplaciano / varianza de intensidad de la tarjeta (lado 800 px): no depende del contraste.
+    # benchmarks/calibrate_quality.py (5 DPI sintéticos por cara, desenfoque gaussiano, JPEG q90), mínimo-máximo:
+    #   k=1  (sin desenfoque): 0.87-1.48 con contraste 1.0 y 0.88-1.48 con contraste 0.4
+    #   k=21 (σ 3.5):          0.13-0.25 (trazos de ~4 px fundidos, posible límite de lectura)
+    #   k=25 (σ 4.1):          0.08-0.17
+    #   k=31 (σ 5.0):          0.01-0.10
+    # Valor conservador: sólo rechaza desenfoque severo (σ ≥ 5) hasta validar un umbral más alto con
+    # `calibrate_quality --ocr` o capturas reales (el punto medio del proxy sin OCR sería ~0.22).
+    QUALITY_MIN_SHARPNESS: float = float(os.getenv("QUALITY_MIN_SHARPNESS", "0.08"))
+    QUALITY_MIN_BRIGHTNESS: float = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "45"))
+    QUALITY_MAX_BRIGHTNESS: float = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "215"))
+    QUALITY_MAX_GLARE: float = float(os.getenv("QUALITY_MAX_GLARE", "0.08"))
+    QUALITY_MIN_CARD_PX: int = int(os.getenv("QUALITY_MIN_CARD_PX", "640"))
+
+    # Métricas Prometheus (la API expone /metrics; el worker levanta su propio exportador)
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", "9808"))
 
 settings = Settings()
 
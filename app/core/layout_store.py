@@ -0,0 +1,112 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.result_store import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+class LayoutStore:
+    """
+    Capturas crudas por hash de contenido (sha256 del archivo): el texto nativo del PDF o el layout OCR
+    por página, más lo que el scoring necesita (URL del QR, pasadas OCR).
+    Permite volver a ejecutar sólo parsers y scoring (reparseDocument) tras mejorar un parser, sin repetir el OCR.
+    - Un archivo msgpack+zstd por hash en LAYOUT_STORE_DIR (compartido entre API y worker), en subdirectorios
+      por prefijo para no acumular cientos de miles de archivos en un solo directorio.
+    - Retención por antigüedad (LAYOUT_RETENTION_DAYS) aplicada por el janitor.
+    - Una captura por contenido: la de mayor precisión (modo) se conserva.
+    """
+
+    VERSION = 1
+    HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def content_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def is_valid_hash(content_hash: Optional[str]) -> bool:
+        return bool(content_hash) and bool(LayoutStore.HASH_PATTERN.match(content_hash))
+
+    def _path(self, content_hash: str) -> str:
+        # El hash llega desde la API: sólo hex de 64 caracteres (sin rutas)
+        if not self.is_valid_hash(content_hash):
+            raise ValueError(f"Hash de contenido inválido: {content_hash!r}")
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}.bin")
+
+    @staticmethod
+    def compact(page_layouts) -> List[Dict[str, Any]]:
+        """Layout PaddleOCR por página -> forma compacta (coordenadas enteras, confianza a 4 decimales)."""
+        return [{
+            'height': int(height),
+            'lines': [[[[int(round(x)), int(round(y))] for x, y in coords], text, round(float(confidence), 4)]
+                      for coords, (text, confidence) in layout],
+        } for layout, height in page_layouts]
+
+    @staticmethod
+    def expand(pages: List[Dict[str, Any]]) -> list:
+        """Inverso de `compact`: [(layout en formato PaddleOCR, altura de la página)]."""
+        return [([[coords, (text, confidence)] for coords, text, confidence in page['lines']], page['height'])
+                for page in pages]
+
+    @staticmethod
+    def _mode_rank(mode: Optional[str]) -> int:
+        return settings.OCR_MODES.index(mode) if mode in settings.OCR_MODES else -1
+
+    def put(self, content_hash: str, capture: Dict[str, Any]) -> None:
+        """
+        Guarda la captura (reemplaza la anterior del mismo contenido). Una captura de un modo más preciso
+        (ej. ACCURATE) no se reemplaza por la de uno menos preciso. Un error no afecta la extracción.
+        """
+        try:
+            previous = self.get(content_hash)
+            if previous and self._mode_rank(previous.get('mode')) > self._mode_rank(capture.get('mode')):
+                return
+            path = self._path(content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(dumps({**capture, 'v': self.VERSION, 'stored_at': time.time()}))
+            os.replace(tmp_path, path)  # Escritura atómica
+        except Exception as e:
+            logger.warning(f"LayoutStore: no se pudo guardar {content_hash}: {e}")
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(content_hash), 'rb') as f:
+                return loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def exists(self, content_hash: str) -> bool:
+        return self.is_valid_hash(content_hash) and os.path.exists(self._path(content_hash))
+
+    def sweep_expired(self, max_age_seconds: int) -> int:
+        """Elimina capturas más antiguas que `max_age_seconds` (0 = sin expiración)."""
+        if max_age_seconds <= 0:
+            return 0
+        cutoff, removed = time.time() - max_age_seconds, 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+layout_store = LayoutStore(settings.LAYOUT_STORE_DIR)
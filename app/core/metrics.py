@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import resource
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, start_http_server, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Instrumentación del pipeline:
+# - Cada etapa (texto PDF, rasterizado, preprocesamiento, QR, OCR, parsing, registro web) se mide con
+#   `stage(...)` o el decorador `timed_stage(...)`.
+# - Los tiempos se acumulan en el `StageTimings` activo (contextvar) para devolverlos en `meta.timings_ms`
+#   y a la vez se exportan como histogramas de Prometheus.
+# - Con varios procesos (prefork de Celery, varios workers de uvicorn) definir PROMETHEUS_MULTIPROC_DIR.
+
+# Buckets pensados para etapas que van de milisegundos (parsing) a decenas de segundos (OCR en CPU)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+STAGE_SECONDS = Histogram(
+    "avanza_ocr_stage_seconds", "Duración de cada etapa del pipeline de documentos",
+    ["stage", "doc_type"], buckets=LATENCY_BUCKETS
+)
+DOCUMENT_SECONDS = Histogram(
+    "avanza_ocr_document_seconds", "Duración total de OCREngine.process_document",
+    ["doc_type", "method"], buckets=LATENCY_BUCKETS
+)
+DOCUMENTS_TOTAL = Counter(
+    "avanza_ocr_documents_total", "Documentos procesados por estado final",
+    ["doc_type", "status", "method"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "avanza_ocr_queue_wait_seconds", "Tiempo entre el encolado en la API y el inicio en el worker",
+    ["doc_type"], buckets=LATENCY_BUCKETS + (160, 320, 640)
+)
+TASK_PEAK_RSS_BYTES = Histogram(
+    "avanza_ocr_task_peak_rss_bytes", "Pico de memoria residente del proceso durante cada tarea",
+    ["doc_type"], buckets=tuple(mb * 1024 * 1024 for mb in (256, 512, 768, 1024, 1536, 2048, 3072, 4096, 6144, 8192))
+)
+TEMP_STORAGE_BYTES = Gauge(
+    "avanza_ocr_temp_storage_bytes", "Bytes ocupados en el almacenamiento temporal", multiprocess_mode="max"
+)
+SUBMISSIONS_TOTAL = Counter(
+    "avanza_ocr_submissions_total", "Documentos recibidos por scanDocument",
+    ["doc_type", "status"]
+)
+UPLOADS_IN_FLIGHT = Gauge(
+    "avanza_ocr_uploads_in_flight", "Uploads multipart en curso en la API", multiprocess_mode="livesum"
+)
+UPLOADS_REJECTED_TOTAL = Counter(
+    "avanza_ocr_uploads_rejected_total", "Uploads rechazados antes de leer el cuerpo", ["reason"]
+)
+TASKS_DROPPED_TOTAL = Counter(
+    "avanza_ocr_tasks_dropped_total", "Tareas canceladas o vencidas (al tomarlas o entre etapas)",
+    ["doc_type", "reason", "phase"]
+)
+NEAR_DUPLICATES_TOTAL = Counter(
+    "avanza_ocr_near_duplicates_total", "Capturas casi idénticas detectadas por pHash",
+    ["doc_type", "action"]
+)
+
+_current_timings: contextvars.ContextVar[Optional["StageTimings"]] = contextvars.ContextVar("stage_timings", default=None)
+
+class StageTimings:
+    """Acumulador de tiempos por etapa para un documento."""
+
+    def __init__(self, doc_type: str):
+        self.doc_type = doc_type
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def record(self, stage_name: str, seconds: float) -> None:
+        # Una etapa puede ejecutarse varias veces (ej. QR en PDF e imagen): se acumula
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds * 1000
+        STAGE_SECONDS.labels(stage_name, self.doc_type).observe(seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def as_dict(self) -> Dict[str, float]:
+        data = {name: round(ms, 2) for name, ms in self.stages.items()}
+        data['total'] = round(self.elapsed * 1000, 2)
+        return data
+
+@contextmanager
+def collect_timings(doc_type: str):
+    """Activa un acumulador de tiempos para el documento en curso."""
+    timings = StageTimings(doc_type)
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+@contextmanager
+def stage(name: str):
+    """Mide un bloque como etapa del documento activo. Sin acumulador activo no hace nada."""
+    timings = _current_timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.record(name, time.perf_counter() - start)
+
+def timed_stage(name: str):
+    """Decorador equivalente a `stage(name)` para métodos de servicios."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def reset_peak_rss() -> bool:
+    """
+    Reinicia el pico de RSS (VmHWM) del proceso para medirlo por tarea. Sólo Linux (/proc/self/clear_refs).
+    Retorna False si no es posible: el pico reportado será entonces el histórico del proceso.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_bytes() -> int:
+    """Pico de RSS desde el último reset (VmHWM) o, en su defecto, desde el inicio del proceso."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def metrics_registry() -> CollectorRegistry:
+    """Registro a exponer: agregado multiproceso si PROMETHEUS_MULTIPROC_DIR está definido."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def start_exporter(port: int) -> None:
+    """Levanta el servidor HTTP de métricas (usado por el worker de Celery)."""
+    start_http_server(port, registry=metrics_registry())
+    logger.info(f"Exportador Prometheus escuchando en :{port}")
+
+def mark_process_dead(pid: int) -> None:
+    """Limpia los archivos de métricas de un proceso hijo terminado (modo multiproceso)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,132 @@
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+class NearDuplicateIndex:
+    """
+    Índice de pHash (64 bits) por doc_type con búsqueda por distancia de Hamming (multi-index hashing).
+    - El hash se divide en 8 bloques de 8 bits; cada bloque indexa un SET en Redis.
+      Por el principio del palomar, dos hashes a distancia <= 7 coinciden exactamente en al menos un bloque,
+      así que la unión de esos 8 SETs contiene todos los candidatos (PHASH_MAX_DISTANCE > 7 no está garantizado).
+    - Cada entrada guarda la fecha de la primera captura. El pHash sólo MARCA parecido: tarjetas de personas
+      distintas con la misma plantilla quedan a 0-4 bits, así que no decide reutilizar una extracción ni
+      cuenta repeticiones. Las repeticiones (revisión de fraude) se cuentan por identidad extraída
+      (CUI, NIT, registro), guardada como sha256.
+    - La extracción reutilizable se guarda aparte, por sha256 del archivo: sólo se reutiliza ante el mismo
+      contenido exacto (reenvío del mismo archivo).
+    - Compartido entre workers vía Redis; ante cualquier error se procesa normalmente (fail-open).
+    """
+
+    PREFIX = "avanza:phash"
+    CHUNKS = 8
+    CHUNK_BITS = 8
+
+    @staticmethod
+    def _chunk_keys(doc_type: str, phash: int):
+        mask = (1 << NearDuplicateIndex.CHUNK_BITS) - 1
+        return [
+            f"{NearDuplicateIndex.PREFIX}:{doc_type}:b{i}:{(phash >> (i * NearDuplicateIndex.CHUNK_BITS)) & mask:02x}"
+            for i in range(NearDuplicateIndex.CHUNKS)
+        ]
+
+    @staticmethod
+    def _entry_key(doc_type: str, hex_hash: str) -> str:
+        return f"{NearDuplicateIndex.PREFIX}:{doc_type}:e:{hex_hash}"
+
+    @staticmethod
+    def lookup(doc_type: str, phash: int) -> Optional[Dict[str, Any]]:
+        """
+        Retorna la captura previa más cercana dentro de PHASH_MAX_DISTANCE: {'hash', 'distance', 'first_seen'}.
+        """
+        try:
+            r = get_redis()
+            pipe = r.pipeline(transaction=False)
+            for key in NearDuplicateIndex._chunk_keys(doc_type, phash):
+                pipe.smembers(key)
+            candidates = set().union(*pipe.execute())
+
+            scored = []
+            for raw in candidates:
+                hex_hash = raw.decode() if isinstance(raw, bytes) else raw
+                distance = (int(hex_hash, 16) ^ phash).bit_count()
+                if distance <= settings.PHASH_MAX_DISTANCE:
+                    scored.append((distance, hex_hash))
+
+            # La entrada puede haber expirado aunque siga en los SETs de bloques: probar en orden de cercanía
+            for distance, hex_hash in sorted(scored):
+                entry_key = NearDuplicateIndex._entry_key(doc_type, hex_hash)
+                first_seen = r.hget(entry_key, "first_seen")
+                if first_seen is None:
+                    continue
+                return {
+                    'hash': hex_hash,
+                    'distance': distance,
+                    'first_seen': float(first_seen),
+                }
+        except Exception as e:
+            logger.warning(f"NearDuplicateIndex: búsqueda no disponible: {e}")
+        return None
+
+    @staticmethod
+    def _identity_key(doc_type: str, identity: str) -> str:
+        digest = hashlib.sha256(identity.encode('utf-8')).hexdigest()
+        return f"{NearDuplicateIndex.PREFIX}:{doc_type}:id:{digest}"
+
+    @staticmethod
+    def count_identity(doc_type: str, identity: str) -> Optional[int]:
+        """Cuenta una captura más del mismo documento (CUI, NIT...) en la ventana PHASH_TTL_S. None si Redis no responde."""
+        try:
+            r = get_redis()
+            key = NearDuplicateIndex._identity_key(doc_type, identity)
+            seen = r.incr(key)
+            if seen == 1:
+                r.expire(key, settings.PHASH_TTL_S)  # Ventana fija desde la primera captura
+            return seen
+        except Exception as e:
+            logger.warning(f"NearDuplicateIndex: conteo por identidad no disponible: {e}")
+            return None
+
+    @staticmethod
+    def _exact_key(doc_type: str, content_hash: str) -> str:
+        return f"{NearDuplicateIndex.PREFIX}:{doc_type}:sha:{content_hash}"
+
+    @staticmethod
+    def exact(doc_type: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Extracción reutilizable de un archivo con el mismo sha256 (None si no hay o Redis no responde)."""
+        try:
+            raw = get_redis().get(NearDuplicateIndex._exact_key(doc_type, content_hash))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"NearDuplicateIndex: búsqueda exacta no disponible: {e}")
+            return None
+
+    @staticmethod
+    def add(doc_type: str, phash: int, content_hash: Optional[str] = None,
+            result: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Registra la captura en el índice de pHash. `result` (status/data/meta resumido) se guarda
+        bajo el sha256 del archivo para reutilizarlo sólo ante el mismo contenido.
+        """
+        hex_hash = f"{phash:016x}"
+        entry_key = NearDuplicateIndex._entry_key(doc_type, hex_hash)
+        ttl = settings.PHASH_TTL_S
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hsetnx(entry_key, "first_seen", time.time())
+            pipe.expire(entry_key, ttl)
+            if result is not None and content_hash:
+                pipe.set(NearDuplicateIndex._exact_key(doc_type, content_hash),
+                         json.dumps(result, ensure_ascii=False, default=str), ex=ttl)
+            for key in NearDuplicateIndex._chunk_keys(doc_type, phash):
+                pipe.sadd(key, hex_hash)
+                pipe.expire(key, ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"NearDuplicateIndex: no se pudo registrar {hex_hash}: {e}")
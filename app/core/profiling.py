@@ -0,0 +1,112 @@
+import os
+import time
+import marshal
+import sysconfig
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.result_store import ResultStore
+
+logger = logging.getLogger(__name__)
+
+_STDLIB_DIR = sysconfig.get_paths()['stdlib']
+
+class DocumentProfiler:
+    """
+    Perfilado bajo demanda de una tarea (flag `profile` de scanDocument o PROFILE_TASKS en el worker):
+    - cProfile (determinista) sobre el hilo de la tarea; el .pstats completo se guarda en el BlobStore,
+      junto al resultado, para abrirlo con `python -m pstats`, snakeviz o flameprof (flamegraph).
+    - tracemalloc: pico y líneas con memoria retenida de Python/NumPy (la memoria interna de
+      Paddle no pasa por el allocator de Python; para eso está meta.peak_rss_mb).
+    Con el pool `threads`, tracemalloc es global al proceso e incluye a las tareas concurrentes.
+    """
+
+    _lock = threading.Lock()
+    _tracemalloc_users = 0
+
+    def __init__(self, task_id: str, top_n: Optional[int] = None):
+        self.task_id = task_id
+        self.top_n = top_n or settings.PROFILE_TOP_N
+        self.profiler = cProfile.Profile()
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak = 0
+        self._wall = 0.0
+
+    def __enter__(self) -> "DocumentProfiler":
+        with DocumentProfiler._lock:
+            if DocumentProfiler._tracemalloc_users == 0:
+                tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+            else:
+                tracemalloc.reset_peak()
+            DocumentProfiler._tracemalloc_users += 1
+        self._start = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.disable()
+        self._wall = time.perf_counter() - self._start
+        with DocumentProfiler._lock:
+            self._peak = tracemalloc.get_traced_memory()[1]
+            self._snapshot = tracemalloc.take_snapshot()
+            DocumentProfiler._tracemalloc_users -= 1
+            if DocumentProfiler._tracemalloc_users == 0:
+                tracemalloc.stop()
+
+    @staticmethod
+    def _display_path(filename: str) -> str:
+        """Ruta sin el layout del servidor: relativa al repo, a la stdlib, a site-packages o sólo el nombre del archivo."""
+        for root in (settings.BASE_DIR, _STDLIB_DIR):
+            if filename.startswith(root + os.sep):
+                return os.path.relpath(filename, root)
+        marker = f"site-packages{os.sep}"
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+        return os.path.basename(filename) if os.path.isabs(filename) else filename
+
+    def _top_functions(self, stats: pstats.Stats) -> List[Dict[str, Any]]:
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]
+        return [{
+            'function': f"{self._display_path(filename)}:{line}({name})",
+            'calls': nc,
+            'self_ms': round(tt * 1000, 2),
+            'cumulative_ms': round(ct * 1000, 2),
+        } for (filename, line, name), (_, nc, tt, ct, _) in rows]
+
+    def _top_allocations(self) -> List[Dict[str, Any]]:
+        """Líneas con más memoria aún asignada al terminar la tarea (cachés, referencias retenidas)."""
+        snapshot = self._snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        return [{
+            'location': f"{self._display_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        } for stat in snapshot.statistics('lineno')[:self.top_n]]
+
+    def report(self, ttl_seconds: int) -> Dict[str, Any]:
+        """
+        Guarda el .pstats en el BlobStore y retorna el resumen para meta.profile.
+        El resultado llega al cliente: sólo la referencia del blob, sin rutas del servidor.
+        """
+        stats = pstats.Stats(self.profiler)
+        # Mismo formato que Stats.dump_stats: se puede cargar con pstats.Stats(<archivo>)
+        ref = ResultStore.blobs.put(f"{self.task_id}.pstats", marshal.dumps(stats.stats), ttl_seconds)
+        logger.info(f"Perfil de {self.task_id} guardado en {ref}")
+        return {
+            'profiler': 'cProfile',
+            'wall_ms': round(self._wall * 1000, 2),
+            'pstats_ref': ref,
+            'top_functions': self._top_functions(stats),
+            'memory': {
+                'traced_peak_mb': round(self._peak / (1024 * 1024), 2),
+                'top_retained': self._top_allocations(),
+            },
+        }
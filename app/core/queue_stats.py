@@ -0,0 +1,234 @@
+import json
+import time
+import asyncio
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+class QueueStats:
+    """
+    Presión de colas para autoscaling y ETA:
+    - depth: mensajes pendientes en el broker (LLEN de la lista de kombu, incluye prioridades).
+    - active: tareas en ejecución (ZSET alimentado por task_prerun/task_postrun).
+    - avg_service_s: promedio móvil de las últimas QUEUE_STATS_WINDOW duraciones.
+    - slots: capacidad de los workers vivos que consumen la cola (heartbeat en cada tarea).
+    """
+
+    PREFIX = "avanza:q"
+    WORKERS_KEY = "avanza:workers"
+    # kombu (transporte Redis) guarda cada prioridad en "<cola>\x06\x16<paso>"
+    PRIORITY_SEP = "\x06\x16"
+    PRIORITY_STEPS = (3, 6, 9)
+
+    @staticmethod
+    def mode_routes() -> Dict[str, Tuple[str, str]]:
+        """Modo de scanDocument -> (cola, routing_key). BALANCED usa la cola por defecto."""
+        return {
+            'FAST': (settings.CELERY_FAST_QUEUE, settings.CELERY_FAST_ROUTING_KEY),
+            'BALANCED': (settings.CELERY_DEFAULT_QUEUE, settings.CELERY_DEFAULT_ROUTING_KEY),
+            'ACCURATE': (settings.CELERY_ACCURATE_QUEUE, settings.CELERY_ACCURATE_ROUTING_KEY),
+        }
+
+    @staticmethod
+    def queues() -> Dict[str, str]:
+        """routing_key -> nombre de cola."""
+        return {routing_key: queue for queue, routing_key in QueueStats.mode_routes().values()}
+
+    @staticmethod
+    def queue_for(delivery_info: Optional[dict]) -> str:
+        routing_key = (delivery_info or {}).get('routing_key') or settings.CELERY_DEFAULT_ROUTING_KEY
+        return QueueStats.queues().get(routing_key, routing_key)
+
+    @staticmethod
+    def _active_key(queue: str) -> str:
+        return f"{QueueStats.PREFIX}:{queue}:active"
+
+    @staticmethod
+    def _service_key(queue: str) -> str:
+        return f"{QueueStats.PREFIX}:{queue}:service"
+
+    @staticmethod
+    def _depth_keys(queue: str) -> List[str]:
+        return [queue] + [f"{queue}{QueueStats.PRIORITY_SEP}{step}" for step in QueueStats.PRIORITY_STEPS]
+
+    # ==========================================================
+    # Escritura (worker)
+    # ==========================================================
+    @staticmethod
+    def record_start(queue: str, task_id: str, hostname: str, concurrency: int, queues: List[str]) -> None:
+        now = time.time()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.zadd(QueueStats._active_key(queue), {task_id: now})
+            pipe.hset(QueueStats.WORKERS_KEY, hostname, json.dumps({'concurrency': concurrency, 'queues': queues, 'ts': now}))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"QueueStats: no se pudo registrar inicio de {task_id}: {e}")
+
+    @staticmethod
+    def record_finish(queue: str, task_id: str, duration: float) -> None:
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.zrem(QueueStats._active_key(queue), task_id)
+            pipe.lpush(QueueStats._service_key(queue), round(duration, 3))
+            pipe.ltrim(QueueStats._service_key(queue), 0, settings.QUEUE_STATS_WINDOW - 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"QueueStats: no se pudo registrar fin de {task_id}: {e}")
+
+    # ==========================================================
+    # Lectura (API, métricas)
+    # ==========================================================
+    @staticmethod
+    def _broker_commands(pipe, queue_names: List[str]) -> None:
+        for queue in queue_names:
+            for key in QueueStats._depth_keys(queue):
+                pipe.llen(key)
+
+    @staticmethod
+    def _app_commands(pipe, queue_names: List[str], now: float) -> None:
+        for queue in queue_names:
+            # Entradas más viejas que el umbral son tareas de workers caídos: no cuentan como activas
+            pipe.zcount(QueueStats._active_key(queue), now - settings.ACTIVE_TASK_STALE_S, "+inf")
+            pipe.lrange(QueueStats._service_key(queue), 0, -1)
+        pipe.hgetall(QueueStats.WORKERS_KEY)
+
+    @staticmethod
+    def _build(queue_names: List[str], broker_raw: list, app_raw: list, now: float) -> List[Dict[str, Any]]:
+        depth_per_queue = len(QueueStats.PRIORITY_STEPS) + 1
+        workers = []
+        for raw in (app_raw[-1] or {}).values():
+            try:
+                info = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            if now - info.get('ts', 0) <= settings.WORKER_HEARTBEAT_STALE_S:
+                workers.append(info)
+
+        stats = []
+        for i, queue in enumerate(queue_names):
+            depth = sum(int(v or 0) for v in broker_raw[i * depth_per_queue:(i + 1) * depth_per_queue])
+            active = int(app_raw[i * 2] or 0)
+            samples = [float(v) for v in app_raw[i * 2 + 1] or []]
+            avg_service = sum(samples) / len(samples) if samples else None
+
+            consumers = [w for w in workers if not w.get('queues') or queue in w['queues']]
+            slots = sum(int(w.get('concurrency') or 1) for w in consumers)
+
+            # Espera estimada para un envío nuevo: la cola se drena en paralelo por los slots disponibles
+            estimated_wait = None
+            if avg_service is not None:
+                estimated_wait = round(depth / max(slots, 1) * avg_service, 2)
+
+            stats.append({
+                'queue': queue,
+                'depth': depth,
+                'active': active,
+                'workers': len(consumers),
+                'slots': slots,
+                'avg_service_s': round(avg_service, 3) if avg_service is not None else None,
+                'estimated_wait_s': estimated_wait,
+            })
+        return stats
+
+    @staticmethod
+    def snapshot() -> List[Dict[str, Any]]:
+        """Versión síncrona (colector de Prometheus)."""
+        queue_names = list(QueueStats.queues().values())
+        now = time.time()
+        broker_pipe = get_redis(settings.CELERY_BROKER_URL).pipeline(transaction=False)
+        QueueStats._broker_commands(broker_pipe, queue_names)
+        app_pipe = get_redis().pipeline(transaction=False)
+        QueueStats._app_commands(app_pipe, queue_names, now)
+        return QueueStats._build(queue_names, broker_pipe.execute(), app_pipe.execute(), now)
+
+    @staticmethod
+    async def snapshot_async() -> List[Dict[str, Any]]:
+        """Versión asyncio (resolvers GraphQL): dos pipelines en paralelo, un round-trip cada uno."""
+        queue_names = list(QueueStats.queues().values())
+        now = time.time()
+        broker_pipe = get_async_redis(settings.CELERY_BROKER_URL).pipeline(transaction=False)
+        QueueStats._broker_commands(broker_pipe, queue_names)
+        app_pipe = get_async_redis().pipeline(transaction=False)
+        QueueStats._app_commands(app_pipe, queue_names, now)
+        broker_raw, app_raw = await asyncio.gather(broker_pipe.execute(), app_pipe.execute())
+        return QueueStats._build(queue_names, broker_raw, app_raw, now)
+
+    @staticmethod
+    async def estimate_completion(queue: Optional[str] = None) -> Optional[float]:
+        """Segundos estimados hasta completar un documento encolado ahora (espera + servicio)."""
+        queue = queue or settings.CELERY_DEFAULT_QUEUE
+        try:
+            stats = await QueueStats.snapshot_async()
+        except Exception as e:
+            logger.warning(f"QueueStats no disponible: {e}")
+            return None
+        stat = next((s for s in stats if s['queue'] == queue), None)
+        if not stat or stat['avg_service_s'] is None:
+            return None
+        return round(stat['estimated_wait_s'] + stat['avg_service_s'], 2)
+
+class QueueStatsCollector:
+    """
+    Colector Prometheus de presión de colas (apto para KEDA / HPA con métricas externas).
+    El scrape de /metrics corre en el event loop de la API: no consulta Redis, sirve la última foto que un
+    hilo de fondo refresca cada QUEUE_STATS_REFRESH_S. Una foto más vieja que QUEUE_STATS_MAX_AGE_S
+    (Redis caído) no se exporta, para que el autoscaler no escale con datos congelados.
+    """
+
+    def __init__(self):
+        self._stats: List[Dict[str, Any]] = []
+        self._taken_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def describe(self):
+        # Evita que el registro llame a collect() (y arranque el hilo) al registrarse
+        return []
+
+    def _refresh(self) -> None:
+        try:
+            stats = QueueStats.snapshot()
+        except Exception as e:
+            logger.warning(f"QueueStatsCollector: Redis no disponible: {e}")
+            return
+        self._stats, self._taken_at = stats, time.time()
+
+    def _run(self) -> None:
+        while True:
+            self._refresh()
+            time.sleep(settings.QUEUE_STATS_REFRESH_S)
+
+    def _ensure_started(self) -> None:
+        # Arranque perezoso en el primer scrape: importar app.main no levanta hilos ni toca Redis
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='queue-stats', daemon=True)
+                self._thread.start()
+
+    def collect(self):
+        self._ensure_started()
+        age = time.time() - self._taken_at
+        if age > settings.QUEUE_STATS_MAX_AGE_S:
+            return
+
+        families = {
+            'depth': GaugeMetricFamily("avanza_ocr_queue_depth", "Mensajes pendientes en la cola", labels=["queue"]),
+            'active': GaugeMetricFamily("avanza_ocr_queue_active_tasks", "Tareas en ejecución", labels=["queue"]),
+            'slots': GaugeMetricFamily("avanza_ocr_queue_worker_slots", "Slots de workers vivos", labels=["queue"]),
+            'avg_service_s': GaugeMetricFamily("avanza_ocr_queue_avg_service_seconds", "Tiempo de servicio promedio (ventana móvil)", labels=["queue"]),
+            'estimated_wait_s': GaugeMetricFamily("avanza_ocr_queue_estimated_wait_seconds", "Espera estimada para un envío nuevo", labels=["queue"]),
+        }
+        for stat in self._stats:
+            for field, family in families.items():
+                if stat[field] is not None:
+                    family.add_metric([stat['queue']], stat[field])
+        yield from families.values()
+        yield GaugeMetricFamily("avanza_ocr_queue_stats_age_seconds", "Antigüedad de la foto de colas exportada", value=round(age, 3))
@@ -0,0 +1,22 @@
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+# Clientes con pool de conexiones compartido por proceso, uno por URL (se crean bajo demanda)
+_sync_clients: dict[str, redis.Redis] = {}
+_async_clients: dict[str, aioredis.Redis] = {}
+
+def get_redis(url: str | None = None) -> redis.Redis:
+    """Cliente síncrono (worker, tareas periódicas, colectores de métricas)."""
+    url = url or settings.REDIS_URL
+    if url not in _sync_clients:
+        _sync_clients[url] = redis.Redis.from_url(url, max_connections=settings.REDIS_MAX_CONNECTIONS)
+    return _sync_clients[url]
+
+def get_async_redis(url: str | None = None) -> aioredis.Redis:
+    """Cliente asyncio para los resolvers de la API (no bloquea el event loop)."""
+    url = url or settings.REDIS_URL
+    if url not in _async_clients:
+        _async_clients[url] = aioredis.Redis.from_url(url, max_connections=settings.REDIS_MAX_CONNECTIONS)
+    return _async_clients[url]
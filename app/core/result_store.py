@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import msgpack
+import zstandard
+from celery import states
+from kombu.serialization import register
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Serializadores compactos para el backend de resultados de Celery.
+# Se registran en kombu al importar el módulo (API y worker deben importarlo antes de usar resultados).
+SERIALIZERS = {
+    "msgpack_zstd": "application/x-avanza-msgpack-zstd",
+    "json_zstd": "application/x-avanza-json-zstd",
+}
+
+_compressor = zstandard.ZstdCompressor(level=settings.RESULT_ZSTD_LEVEL)
+_decompressor = zstandard.ZstdDecompressor()
+
+def _msgpack_dumps(obj: Any) -> bytes:
+    return _compressor.compress(msgpack.packb(obj, use_bin_type=True, default=str))
+
+def _msgpack_loads(payload: bytes) -> Any:
+    return msgpack.unpackb(_decompressor.decompress(payload), raw=False)
+
+def _json_dumps(obj: Any) -> bytes:
+    return _compressor.compress(json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+def _json_loads(payload: bytes) -> Any:
+    return json.loads(_decompressor.decompress(payload))
+
+register("msgpack_zstd", _msgpack_dumps, _msgpack_loads,
+         content_type=SERIALIZERS["msgpack_zstd"], content_encoding="binary")
+register("json_zstd", _json_dumps, _json_loads,
+         content_type=SERIALIZERS["json_zstd"], content_encoding="binary")
+
+def dumps(obj: Any) -> bytes:
+    """Codifica con el serializador configurado (RESULT_SERIALIZER)."""
+    return _json_dumps(obj) if settings.RESULT_SERIALIZER == "json_zstd" else _msgpack_dumps(obj)
+
+def loads(payload: bytes) -> Any:
+    """Decodifica msgpack o JSON (se detecta por el primer byte: un objeto JSON empieza con '{')."""
+    raw = _decompressor.decompress(payload)
+    if raw[:1] == b"{":
+        return json.loads(raw)
+    return msgpack.unpackb(raw, raw=False)
+
+def loads_backend(payload: bytes) -> Any:
+    """Decodifica un valor del backend de Celery con cualquiera de los serializadores aceptados (incluido json plano)."""
+    if payload[:1] == b"{":
+        return json.loads(payload)
+    return loads(payload)
+
+class BlobStore:
+    """
+    Almacén de payloads grandes fuera de Redis (directorio compartido entre API y worker).
+    La referencia incluye la expiración (`<task_id>.<epoch>`) para que el janitor no tenga que abrir archivos.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        # La referencia viaja por Redis: evitar rutas fuera del directorio
+        return os.path.join(self.root, os.path.basename(ref) + ".bin")
+
+    def path(self, ref: str) -> str:
+        """Ruta del blob en el directorio compartido (para artefactos que se abren con otras herramientas)."""
+        return self._path(ref)
+
+    def put(self, key: str, payload: bytes, ttl_seconds: int) -> str:
+        ref = f"{key}.{int(time.time()) + ttl_seconds}"
+        tmp_path = self._path(ref) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._path(ref))  # Escritura atómica
+        return ref
+
+    def get(self, ref: str) -> Optional[bytes]:
+        try:
+            with open(self._path(ref), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def sweep_expired(self) -> int:
+        """Elimina blobs cuya expiración (codificada en el nombre) ya pasó."""
+        now, removed = time.time(), 0
+        for name in os.listdir(self.root):
+            try:
+                expires_at = int(name.rsplit(".", 2)[-2])
+            except (ValueError, IndexError):
+                continue
+            if expires_at < now:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class ResultStore:
+    """
+    Capa de almacenamiento de resultados:
+    - TTL por doc_type (RESULT_TTLS) sobre la clave del backend.
+    - Payloads mayores a RESULT_INLINE_MAX_BYTES se mueven al BlobStore y en Redis queda sólo `data_ref`.
+    """
+
+    blobs = BlobStore(settings.RESULT_BLOB_DIR)
+    # Misma clave que usa el backend Redis de Celery (RedisBackend.get_key_for_task)
+    BACKEND_KEY_PREFIX = "celery-task-meta-"
+
+    @staticmethod
+    def ttl_for(doc_type: Optional[str]) -> int:
+        return settings.RESULT_TTLS.get(doc_type or "", settings.RESULT_TTL_DEFAULT_S)
+
+    @staticmethod
+    def pack(task_id: str, result: Dict[str, Any], doc_type: Optional[str] = None) -> Dict[str, Any]:
+        """Prepara el resultado del worker: si `data` es grande, lo descarga al BlobStore."""
+        data = result.get("data")
+        if not data:
+            return result
+
+        payload = dumps(data)
+        if len(payload) <= settings.RESULT_INLINE_MAX_BYTES:
+            return result
+
+        ref = ResultStore.blobs.put(task_id, payload, ResultStore.ttl_for(doc_type))
+        logger.info(f"Resultado {task_id} descargado a blob ({len(payload)} bytes comprimidos)")
+        return {**result, "data": {}, "data_ref": ref}
+
+    @staticmethod
+    def unpack(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Inverso de `pack`: resuelve `data_ref` de forma transparente para el resolver GraphQL."""
+        ref = result.get("data_ref")
+        if not ref:
+            return result
+
+        payload = ResultStore.blobs.get(ref)
+        if payload is None:
+            meta = {**result.get("meta", {}), "message": "El resultado expiró o no está disponible"}
+            return {"status": "EXPIRED", "meta": meta, "data": {}}
+
+        unpacked = {k: v for k, v in result.items() if k != "data_ref"}
+        unpacked["data"] = loads(payload)
+        return unpacked
+
+    @staticmethod
+    async def fetch_async(task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lee el estado de una tarea directamente del backend: un GET con el cliente asyncio (pool compartido)
+        y una sola decodificación, sin AsyncResult ni hilos del threadpool.
+        Retorna el meta de Celery ({'status', 'result', ...}) o None si aún no hay resultado (PENDING).
+        """
+        raw = await get_async_redis(settings.CELERY_RESULT_BACKEND).get(ResultStore.BACKEND_KEY_PREFIX + task_id)
+        if raw is None:
+            return None
+        return loads_backend(raw)
+
+    @staticmethod
+    def is_ready(meta: Optional[Dict[str, Any]]) -> bool:
+        return bool(meta) and meta.get("status") in states.READY_STATES
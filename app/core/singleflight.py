@@ -0,0 +1,137 @@
+import hashlib
+import logging
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.cancellation import CancellationToken
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Reserva atómica (válida con varias réplicas de la API):
+# KEYS[1] = clave de contenido (hash + doc_type), KEYS[2] = clave de idempotencia del cliente (opcional)
+# ARGV[1] = task_id candidato, ARGV[2] = TTL de contenido, ARGV[3] = TTL de idempotencia,
+# ARGV[4] = prefijo de la bandera de cancelación, ARGV[5] = prefijo del registro por tarea,
+# ARGV[6] = deadline del candidato (epoch, "" = sin deadline), ARGV[7] = holgura de deadline (s)
+# Una tarea existente cancelada o con un deadline anterior al del candidato no se reutiliza: el candidato
+# toma las claves. Retorna el task_id existente si hay un duplicado reutilizable, o false si la reserva
+# quedó a nombre del candidato (y registra sus claves y deadline para cancelOcrTask).
+_ACQUIRE_SCRIPT = """
+local wanted = tonumber(ARGV[6])
+local function usable(task)
+    if redis.call('EXISTS', ARGV[4] .. task) == 1 then return false end
+    local deadline = tonumber(redis.call('HGET', ARGV[5] .. task, 'deadline'))
+    if deadline and (not wanted or deadline + tonumber(ARGV[7]) < wanted) then return false end
+    return true
+end
+if KEYS[2] then
+    local idem = redis.call('GET', KEYS[2])
+    if idem and usable(idem) then return idem end
+end
+local existing = redis.call('GET', KEYS[1])
+if existing and usable(existing) then
+    if KEYS[2] then redis.call('SET', KEYS[2], existing, 'EX', ARGV[3]) end
+    return existing
+end
+local record = ARGV[5] .. ARGV[1]
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('HSET', record, 'content', KEYS[1])
+if KEYS[2] then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+    redis.call('HSET', record, 'idem', KEYS[2])
+end
+if wanted then redis.call('HSET', record, 'deadline', ARGV[6]) end
+redis.call('EXPIRE', record, math.max(tonumber(ARGV[2]), KEYS[2] and tonumber(ARGV[3]) or 0))
+return false
+"""
+
+# Libera sólo si la clave sigue perteneciendo a la tarea (evita borrar la reserva de otra)
+_RELEASE_SCRIPT = """
+local released = 0
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        released = released + redis.call('DEL', key)
+    end
+end
+return released
+"""
+
+# Libera todas las claves registradas para la tarea (cancelOcrTask): KEYS[1] = registro, ARGV[1] = task_id
+_RELEASE_TASK_SCRIPT = """
+local released = 0
+for _, key in ipairs(redis.call('HVALS', KEYS[1])) do
+    if redis.call('GET', key) == ARGV[1] then
+        released = released + redis.call('DEL', key)
+    end
+end
+return released
+"""
+
+class SingleFlight:
+    """
+    Coalescencia de envíos idénticos en vuelo.
+    Un mismo archivo (sha256 + doc_type) o la misma clave de idempotencia del cliente
+    reutiliza la tarea existente mientras está en cola o ejecutándose.
+    Una tarea cancelada o con un deadline más corto que el del nuevo envío no se reutiliza.
+    Si Redis no responde se opera en modo abierto: se encola normalmente.
+    """
+
+    PREFIX = "avanza:sf"
+
+    @staticmethod
+    def content_key(content: bytes, doc_type: str) -> str:
+        return f"{SingleFlight.PREFIX}:content:{doc_type}:{hashlib.sha256(content).hexdigest()}"
+
+    @staticmethod
+    def idempotency_key(client_key: str, doc_type: str) -> str:
+        return f"{SingleFlight.PREFIX}:idem:{doc_type}:{client_key}"
+
+    @staticmethod
+    def _task_key(task_id: str) -> str:
+        return f"{SingleFlight.PREFIX}:task:{task_id}"
+
+    @staticmethod
+    async def acquire(content_key: str, task_id: str, idempotency_key: Optional[str] = None,
+                      deadline: Optional[float] = None) -> Optional[str]:
+        """Reserva las claves para `task_id`. Retorna el task_id existente si es un duplicado reutilizable."""
+        keys = [content_key] + ([idempotency_key] if idempotency_key else [])
+        try:
+            existing = await get_async_redis().eval(
+                _ACQUIRE_SCRIPT, len(keys), *keys,
+                task_id, settings.SINGLE_FLIGHT_TTL_S, settings.IDEMPOTENCY_TTL_S,
+                f"{CancellationToken.PREFIX}:", f"{SingleFlight.PREFIX}:task:",
+                "" if deadline is None else repr(deadline), settings.SINGLE_FLIGHT_DEADLINE_SLACK_S
+            )
+        except Exception as e:
+            logger.warning(f"SingleFlight no disponible, se encola sin coalescencia: {e}")
+            return None
+        if existing:
+            return existing.decode() if isinstance(existing, bytes) else existing
+        return None
+
+    @staticmethod
+    async def release_task_async(task_id: str) -> None:
+        """Libera todas las reservas de la tarea (cancelOcrTask): un reenvío del archivo encola una tarea nueva."""
+        try:
+            await get_async_redis().eval(_RELEASE_TASK_SCRIPT, 1, SingleFlight._task_key(task_id), task_id)
+        except Exception as e:
+            logger.warning(f"No se pudo liberar SingleFlight de la tarea {task_id}: {e}")
+
+    @staticmethod
+    async def release_async(keys: List[Optional[str]], task_id: str) -> None:
+        """Libera reservas desde la API (ej. archivo rechazado antes de encolar)."""
+        keys = [k for k in keys if k]
+        try:
+            await get_async_redis().eval(_RELEASE_SCRIPT, len(keys), *keys, task_id)
+        except Exception as e:
+            logger.warning(f"No se pudo liberar SingleFlight {keys}: {e}")
+
+    @staticmethod
+    def release(key: Optional[str], task_id: str) -> None:
+        """Libera la reserva de contenido al terminar la tarea (worker)."""
+        if not key:
+            return
+        try:
+            get_redis().eval(_RELEASE_SCRIPT, 1, key, task_id)
+        except Exception as e:
+            logger.warning(f"No se pudo liberar SingleFlight {key}: {e}")
@@ -0,0 +1,162 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+class TempStorage:
+    """
+    Almacenamiento temporal gestionado para uploads e intermedios.
+    - La raíz puede estar en RAM (tmpfs) con TEMP_USE_TMPFS o TEMP_DIR=/dev/shm/...
+      API y worker deben compartir el mismo directorio (mismo host o volumen compartido).
+    - uploads/: archivos subidos, viven desde la API hasta que la tarea termina. Mientras la tarea está en cola
+      o en ejecución el upload queda registrado como pendiente en Redis (`register_uploads_async`).
+    - work/<scope>/: copias de trabajo del procesamiento masivo, se eliminan al cerrar el scope.
+    - Cuota: `has_capacity` permite a la API rechazar uploads (backpressure) cuando está llena.
+    - `sweep_orphans` elimina por antigüedad lo que dejaron workers caídos a mitad de tarea, sin tocar
+      los uploads pendientes (una cola larga puede superar TEMP_ORPHAN_MAX_AGE_S).
+    """
+
+    PENDING_KEY = "avanza:uploads:pending"
+
+    # Evita recorrer el árbol en cada upload bajo carga
+    USAGE_CACHE_SECONDS = 2.0
+
+    def __init__(self, root: str, quota_bytes: int):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.uploads_dir = os.path.join(root, "uploads")
+        self.work_dir = os.path.join(root, "work")
+        self._usage_cache = (0.0, 0)
+
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def upload_path(self, ext: str) -> str:
+        """Ruta única para un archivo subido."""
+        return os.path.join(self.uploads_dir, f"{uuid.uuid4()}.{ext}")
+
+    async def register_uploads_async(self, *paths: str) -> None:
+        """Marca uploads como pendientes (encolados) para que el janitor no los elimine (API)."""
+        names = {os.path.basename(p): time.time() for p in paths if p}
+        if not names:
+            return
+        try:
+            await get_async_redis().zadd(self.PENDING_KEY, names)
+        except Exception as e:
+            logger.warning(f"TempStorage: no se pudieron registrar uploads pendientes: {e}")
+
+    def _release_uploads(self, *paths: str) -> None:
+        names = [os.path.basename(p) for p in paths if p]
+        if not names:
+            return
+        try:
+            get_redis().zrem(self.PENDING_KEY, *names)
+        except Exception as e:
+            logger.warning(f"TempStorage: no se pudieron liberar uploads pendientes: {e}")
+
+    def _pending_uploads(self) -> Optional[Set[str]]:
+        """Uploads de tareas en cola o en ejecución. None si Redis no responde (no se toca ningún upload)."""
+        try:
+            r = get_redis()
+            r.zremrangebyscore(self.PENDING_KEY, "-inf", time.time() - settings.TEMP_PENDING_UPLOAD_MAX_S)
+            return {m.decode() if isinstance(m, bytes) else m for m in r.zrange(self.PENDING_KEY, 0, -1)}
+        except Exception as e:
+            logger.warning(f"TempStorage: uploads pendientes no disponibles, el janitor omite uploads/: {e}")
+            return None
+
+    @contextmanager
+    def upload_scope(self, *owned_paths: str):
+        """Al salir (con o sin error) elimina los uploads que la tarea posee y los quita de pendientes (worker)."""
+        try:
+            yield
+        finally:
+            for path in owned_paths:
+                if path and os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._release_uploads(*owned_paths)
+
+    @contextmanager
+    def task_scope(self, task_id: Optional[str] = None):
+        """Directorio de trabajo exclusivo (copias de trabajo). Al salir (con o sin error) se elimina."""
+        scope_dir = os.path.join(self.work_dir, task_id or uuid.uuid4().hex)
+        os.makedirs(scope_dir, exist_ok=True)
+        try:
+            yield scope_dir
+        finally:
+            shutil.rmtree(scope_dir, ignore_errors=True)
+
+    def usage_bytes(self, fresh: bool = False) -> int:
+        """Bytes ocupados en la raíz (cacheado unos segundos)."""
+        cached_at, cached_value = self._usage_cache
+        if not fresh and time.monotonic() - cached_at < self.USAGE_CACHE_SECONDS:
+            return cached_value
+
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    total += os.stat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    # El archivo pudo ser eliminado por otra tarea durante el recorrido
+                    continue
+        self._usage_cache = (time.monotonic(), total)
+        return total
+
+    def has_capacity(self, incoming_bytes: int = 0) -> bool:
+        """
+        True si cabe un archivo de `incoming_bytes` sin exceder la cuota (0 = sin cuota).
+        Puede recorrer el árbol: desde código async llamarlo en un threadpool.
+        """
+        if self.quota_bytes <= 0:
+            return True
+        return self.usage_bytes() + incoming_bytes <= self.quota_bytes
+
+    def sweep_orphans(self, max_age_seconds: int) -> Dict[str, int]:
+        """
+        Elimina archivos y directorios de trabajo vacíos más antiguos que `max_age_seconds`.
+        Los uploads de tareas en cola o en ejecución (pendientes) se conservan.
+        """
+        cutoff = time.time() - max_age_seconds
+        removed, freed, kept = 0, 0, 0
+        protected = {self.root, self.uploads_dir, self.work_dir}
+        pending = self._pending_uploads()
+
+        for dirpath, _, filenames in os.walk(self.root, topdown=False):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if dirpath == self.uploads_dir and (pending is None or name in pending):
+                    kept += 1
+                    continue
+                try:
+                    st = os.stat(path)
+                    if st.st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                        freed += st.st_size
+                except OSError:
+                    continue
+
+            if dirpath not in protected:
+                try:
+                    if not os.listdir(dirpath) and os.stat(dirpath).st_mtime < cutoff:
+                        os.rmdir(dirpath)
+                except OSError:
+                    pass
+
+        self._usage_cache = (0.0, 0)
+        if removed:
+            logger.info(f"Janitor: {removed} huérfanos eliminados ({freed / (1024 * 1024):.1f} MB)")
+        return {"removed_files": removed, "freed_bytes": freed, "kept_uploads": kept}
+
+temp_storage = TempStorage(settings.TEMP_DIR, settings.TEMP_QUOTA_MB * 1024 * 1024)
@@ -1,13 +1,34 @@
 import strawberry
 from strawberry.file_uploads import Upload
-from typing import Optional, Any
-import uuid
+from strawberry.types import Info
+from typing import Optional, Any, List
 import os
+import hmac
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
 import aiofiles
-from celery.result import AsyncResult
-from app.core.config import settings
+from starlette.concurrency import run_in_threadpool
 from app.core.security import FileValidator
-from worker.tasks import process_document_ton
+from app.core.config import settings
+from app.core.storage import temp_storage
+from app.core.result_store import ResultStore
+from app.core.singleflight import SingleFlight
+from app.core.metrics import SUBMISSIONS_TOTAL
+from app.core.queue_stats import QueueStats
+from app.core.admission import AdmissionControl
+from app.core.layout_store import LayoutStore, layout_store
+from app.core.cancellation import CancellationToken
+# Sólo el cliente liviano: la API no importa worker.tasks (OCREngine, paddle, OpenCV)
+from worker.client import enqueue_document, enqueue_bundle, enqueue_reparse
+
+def _safe_ext(filename: Optional[str]) -> str:
+    """Extensión permitida para el guardado temporal (el tipo real se valida por magic bytes)."""
+    if filename:
+        ext = filename.split('.')[-1].lower()
+        if ext in ['pdf', 'jpg', 'jpeg', 'png']:
+            return ext
+    return "bin"
 
 @strawberry.scalar
 class JSON:
@@ -23,6 +44,45 @@ class OCRTaskResponse:
     task_id: str
     status: str
     message: str
+    # Estimación a partir de la profundidad de cola y el tiempo de servicio promedio (None si no hay datos)
+    estimated_seconds: Optional[float] = None
+    estimated_completion_at: Optional[str] = None
+    # Métricas y motivos del control de calidad cuando la foto se rechaza (status LOW_QUALITY)
+    quality: Optional[JSON] = None
+    # Respuestas reintentables (BUSY, RATE_LIMITED): segundos sugeridos antes de reintentar
+    retry_after_seconds: Optional[float] = None
+
+@strawberry.type
+class QueueStat:
+    queue: str
+    depth: int
+    active: int
+    workers: int
+    slots: int
+    avg_service_seconds: Optional[float]
+    estimated_wait_seconds: Optional[float]
+
+async def _estimate(queue: Optional[str] = None) -> dict:
+    """Campos de ETA para OCRTaskResponse; vacío si Redis no responde o aún no hay muestras."""
+    seconds = await QueueStats.estimate_completion(queue)
+    if seconds is None:
+        return {}
+    completion = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return {"estimated_seconds": seconds, "estimated_completion_at": completion.isoformat()}
+
+async def _admit(info: Info, label: str, cost: int = 1, queue: Optional[str] = None) -> Optional["OCRTaskResponse"]:
+    """Token bucket del cliente y techo global de cola. Retorna la respuesta de rechazo o None si se admite."""
+    retry_after = await AdmissionControl.take(AdmissionControl.client_id(info.context.get("request")), cost)
+    if retry_after is not None:
+        SUBMISSIONS_TOTAL.labels(label, "RATE_LIMITED").inc()
+        return OCRTaskResponse(task_id="", status="RATE_LIMITED", message="Límite de envíos excedido, reintente más tarde",
+                               retry_after_seconds=retry_after)
+    retry_after = await AdmissionControl.queue_busy(queue)
+    if retry_after is not None:
+        SUBMISSIONS_TOTAL.labels(label, "BUSY").inc()
+        return OCRTaskResponse(task_id="", status="BUSY", message="Servicio saturado, reintente en unos segundos",
+                               retry_after_seconds=retry_after)
+    return None
 
 @strawberry.type
 class OCRResult:
@@ -33,25 +93,31 @@ class OCRResult:
 @strawberry.type
 class Query:
     @strawberry.field
-    def get_ocr_result(self, task_id: str) -> Optional[OCRResult]:
-        """Consulta el resultado de Celery por ID."""
-        res = AsyncResult(task_id)
+    async def get_ocr_result(self, task_id: str) -> Optional[OCRResult]:
+        """
+        Consulta el resultado de Celery por ID.
+        Resolver asyncio: un GET al backend con el pool compartido (no ocupa el threadpool de Starlette).
+        """
+        meta = await ResultStore.fetch_async(task_id)
         
         # 1. Si la tarea ya terminó (Ready)
-        if res.ready():
+        if ResultStore.is_ready(meta):
             # Verificar si Celery falló a nivel infraestructura
-            if res.status == 'FAILURE':
+            if meta.get('status') != 'SUCCESS':
                 return OCRResult(
                     status="FAILED", 
                     meta={"message": "Error crítico en worker"}, 
                     data={}
                 )
             
-            result_data = res.result
+            result_data = meta.get('result')
             
             # Si el resultado es nulo (caso raro)
             if not result_data:
                 return OCRResult(status="FAILED", meta={}, data={})
+
+            # Resolver payloads descargados al blob store
+            result_data = ResultStore.unpack(result_data)
             
             # Retornamos el estado calculado por el worker (SUCCESS, INCORRECT, FAILED)
             return OCRResult(
@@ -67,28 +133,109 @@ class Query:
             data={}
         )
 
+    @strawberry.field
+    async def queue_stats(self) -> List[QueueStat]:
+        """Profundidad, tareas activas y tiempo de servicio por cola (insumo para autoscaling)."""
+        return [
+            QueueStat(
+                queue=s['queue'],
+                depth=s['depth'],
+                active=s['active'],
+                workers=s['workers'],
+                slots=s['slots'],
+                avg_service_seconds=s['avg_service_s'],
+                estimated_wait_seconds=s['estimated_wait_s'],
+            )
+            for s in await QueueStats.snapshot_async()
+        ]
+
+def _sync_quality(file_path: str, doc_type: str) -> Optional[dict]:
+    """
+    Control de calidad de fotos en la API (QUALITY_GATE_SYNC, desactivado por defecto). Importa OpenCV en el
+    proceso de la API con la primera foto: benchmarks.import_budget lo verifica con una foto de prueba.
+    """
+    if not (settings.QUALITY_GATE_ENABLED and settings.QUALITY_GATE_SYNC) or file_path.endswith('.pdf'):
+        return None
+    from app.services.quality_gate import ImageQualityGate
+    return ImageQualityGate.assess_file(file_path, doc_type)
+
+def _profiling_allowed(info: Info) -> bool:
+    """El perfilado expone detalles internos y cuesta CPU: sólo habilitado por config o con una API key de la lista."""
+    if settings.PROFILE_REQUESTS_ENABLED:
+        return True
+    request = info.context.get("request")
+    api_key = request.headers.get(settings.ADMISSION_API_KEY_HEADER) if request is not None else None
+    return bool(api_key) and any(hmac.compare_digest(api_key.encode(), known.encode())
+                                 for known in settings.PROFILE_API_KEYS)
+
+VALID_DOC_TYPES = ('DPI_FRONT', 'DPI_BACK', 'RTU', 'PATENTE', 'DPI_FRONT_REPRESENTANTE', 'DPI_BACK_REPRESENTANTE')
+
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    async def scan_document(self, file: Upload, doc_type: str) -> OCRTaskResponse:
-        """Sube archivo y dispara Celery."""
+    async def scan_document(self, info: Info, file: Upload, doc_type: str, idempotency_key: Optional[str] = None,
+                            profile: bool = False, mode: Optional[str] = None,
+                            deadline_seconds: Optional[float] = None) -> OCRTaskResponse:
+        """
+        Sube archivo y dispara Celery.
+        Si el mismo archivo (o la misma idempotency_key) ya está en cola o procesándose, retorna esa tarea.
+        Con profile=true (PROFILE_REQUESTS_ENABLED o API key en PROFILE_API_KEYS) el worker perfila la tarea
+        (cProfile + tracemalloc) y lo reporta en meta.profile.
+        mode: FAST (kiosco, respuesta aproximada), BALANCED (por defecto) o ACCURATE (cumplimiento);
+        cada modo tiene su propia cola y workers.
+        deadline_seconds: tiempo máximo que el cliente esperará (por defecto el SLA del doc_type, TASK_SLA_S);
+        vencido, el worker descarta la tarea (status EXPIRED) en lugar de procesarla.
+        """
         # Validación básica de tipo solicitado
-        valid_types = ['DPI_FRONT', 'DPI_BACK', 'RTU', 'PATENTE', 'DPI_FRONT_REPRESENTANTE', 'DPI_BACK_REPRESENTANTE']
-        if doc_type not in valid_types:
+        if doc_type not in VALID_DOC_TYPES:
+            SUBMISSIONS_TOTAL.labels("INVALID", "FAILED").inc()
             return OCRTaskResponse(task_id="", status="FAILED", message="Tipo de documento inválido")
 
+        mode = (mode or settings.OCR_MODE_DEFAULT).upper()
+        if mode not in settings.OCR_MODES:
+            SUBMISSIONS_TOTAL.labels(doc_type, "FAILED").inc()
+            return OCRTaskResponse(task_id="", status="FAILED",
+                                   message=f"Modo inválido. Opciones: {', '.join(settings.OCR_MODES)}")
+        queue = QueueStats.mode_routes()[mode][0]
+        if profile and not _profiling_allowed(info):
+            SUBMISSIONS_TOTAL.labels(doc_type, "FAILED").inc()
+            return OCRTaskResponse(task_id="", status="FAILED", message="Perfilado no habilitado para este cliente")
+
+        # Control de admisión: límite por cliente y techo de la cola del modo
+        rejection = await _admit(info, doc_type, queue=queue)
+        if rejection:
+            return rejection
+
+        # Backpressure: no aceptar más archivos si el almacenamiento temporal está lleno
+        if not await run_in_threadpool(temp_storage.has_capacity, getattr(file, "size", None) or 0):
+            SUBMISSIONS_TOTAL.labels(doc_type, "BUSY").inc()
+            return OCRTaskResponse(task_id="", status="BUSY", message="Servicio saturado, reintente en unos segundos",
+                                   retry_after_seconds=settings.ADMISSION_BUSY_RETRY_S)
+
         # Guardado temporal seguro
-        safe_ext = "bin"
-        if file.filename:
-            ext = file.filename.split('.')[-1].lower()
-            if ext in ['pdf', 'jpg', 'jpeg', 'png']:
-                safe_ext = ext
-        
-        temp_name = f"{uuid.uuid4()}.{safe_ext}"
-        file_path = os.path.join(settings.TEMP_DIR, temp_name)
+        file_path = temp_storage.upload_path(_safe_ext(file.filename))
+        task_id = str(uuid.uuid4())
+        content_key = idem_key = None
         
         try:
             content = await file.read()
+
+            # Single-flight: reutilizar la tarea si el envío es idéntico (doble click, reintentos móviles)
+            # El modo (y el perfilado) forman parte de la clave: un resultado FAST no responde a un envío ACCURATE
+            content_key = SingleFlight.content_key(content, f"{doc_type}:{mode}" + (":profile" if profile else ""))
+            idem_key = SingleFlight.idempotency_key(idempotency_key, doc_type) if idempotency_key else None
+            # Deadline desde el envío: una tarea en vuelo cancelada o que vence antes no se reutiliza
+            budget = deadline_seconds or settings.TASK_SLA_S.get(doc_type)
+            deadline = time.time() + budget if budget else None
+            existing_task_id = await SingleFlight.acquire(content_key, task_id, idem_key, deadline)
+            if existing_task_id:
+                SUBMISSIONS_TOTAL.labels(doc_type, "COALESCED").inc()
+                return OCRTaskResponse(
+                    task_id=existing_task_id,
+                    status="PROCESSING",
+                    message="Documento idéntico en proceso, se reutiliza la tarea existente."
+                )
+
             async with aiofiles.open(file_path, 'wb') as out_file:
                 await out_file.write(content)
             
@@ -96,20 +243,156 @@ class Mutation:
             is_safe, msg = FileValidator.validate_file_header(file_path)
             if not is_safe:
                 os.remove(file_path)
+                await SingleFlight.release_async([content_key, idem_key], task_id)
+                SUBMISSIONS_TOTAL.labels(doc_type, "REJECTED").inc()
                 return OCRTaskResponse(task_id="", status="FAILED", message=f"Archivo inseguro: {msg}")
 
+            # Control de calidad síncrono (milisegundos): el usuario puede repetir la foto sin esperar la cola
+            quality = _sync_quality(file_path, doc_type)
+            if quality and not quality['ok']:
+                from app.services.quality_gate import ImageQualityGate
+                os.remove(file_path)
+                await SingleFlight.release_async([content_key, idem_key], task_id)
+                SUBMISSIONS_TOTAL.labels(doc_type, "LOW_QUALITY").inc()
+                return OCRTaskResponse(
+                    task_id="",
+                    status="LOW_QUALITY",
+                    message=ImageQualityGate.rejection(quality)['meta']['message'],
+                    quality=quality
+                )
+
             # Encolar tarea
-            task = process_document_ton.delay(file_path, doc_type)
+            # enqueued_at permite medir el tiempo de espera en cola desde el worker
+            estimate = await _estimate(queue)
+            await temp_storage.register_uploads_async(file_path)
+            enqueued_at = time.time()
+            task = enqueue_document(
+                file_path, doc_type, task_id=task_id, mode=mode,
+                enqueued_at=enqueued_at, singleflight_key=content_key, profile=profile, deadline=deadline,
+            )
+            await CancellationToken.register_async(task.id)
+            SUBMISSIONS_TOTAL.labels(doc_type, "QUEUED").inc()
             
             return OCRTaskResponse(
                 task_id=task.id,
                 status="PROCESSING", # Estado inicial
-                message="Documento encolado."
+                message="Documento encolado.",
+                **estimate
             )
 
         except Exception as e:
             if os.path.exists(file_path):
                 os.remove(file_path)
+            if content_key:
+                await SingleFlight.release_async([content_key, idem_key], task_id)
+            return OCRTaskResponse(task_id="", status="FAILED", message=str(e))
+
+    @strawberry.mutation
+    async def cancel_ocr_task(self, task_id: str) -> OCRTaskResponse:
+        """
+        Cancela una tarea: si sigue en cola el worker la descarta al tomarla; si se está ejecutando se detiene
+        en el siguiente punto de control entre etapas. El resultado queda con status CANCELLED.
+        Sus reservas single-flight se liberan: un reenvío del mismo archivo encola una tarea nueva.
+        Un bundle cancela también sus documentos. Un id que la API no encoló (o ya expiró) retorna NOT_FOUND.
+        """
+        meta = await ResultStore.fetch_async(task_id)
+        if ResultStore.is_ready(meta):
+            return OCRTaskResponse(task_id=task_id, status="FAILED", message="La tarea ya terminó")
+        try:
+            # Un bundle propaga la cancelación a los documentos del header (cada uno revisa su propia bandera)
+            members = await CancellationToken.members_async(task_id)
+            if members is None and meta is None:
+                return OCRTaskResponse(task_id=task_id, status="NOT_FOUND", message="Tarea no encontrada")
+            await CancellationToken.request_async(task_id, members or ())
+        except Exception as e:
+            return OCRTaskResponse(task_id=task_id, status="FAILED", message=f"No se pudo cancelar: {e}")
+        await SingleFlight.release_task_async(task_id)
+        return OCRTaskResponse(task_id=task_id, status="CANCELLING", message="Cancelación solicitada.")
+
+    @strawberry.mutation
+    async def reparse_document(self, info: Info, task_id: Optional[str] = None, content_hash: Optional[str] = None,
+                               doc_type: Optional[str] = None) -> OCRTaskResponse:
+        """
+        Re-extrae un documento ya procesado sin repetir el OCR: parsers y scoring sobre la captura guardada
+        (texto nativo o layout OCR). Se identifica por el task_id original o por meta.contentHash.
+        doc_type permite reinterpretar la captura con otro parser; el resultado se consulta con getOcrResult.
+        """
+        if task_id and not content_hash:
+            meta = await ResultStore.fetch_async(task_id)
+            if not ResultStore.is_ready(meta) or not isinstance(meta.get('result'), dict):
+                return OCRTaskResponse(task_id="", status="FAILED", message="Resultado no disponible para ese task_id")
+            content_hash = (meta['result'].get('meta') or {}).get('contentHash')
+
+        if doc_type is not None and doc_type not in VALID_DOC_TYPES:
+            return OCRTaskResponse(task_id="", status="FAILED", message="Tipo de documento inválido")
+        if not LayoutStore.is_valid_hash(content_hash) or not layout_store.exists(content_hash):
+            SUBMISSIONS_TOTAL.labels("REPARSE", "FAILED").inc()
+            return OCRTaskResponse(task_id="", status="FAILED", message="No hay captura guardada para este documento")
+
+        rejection = await _admit(info, "REPARSE")
+        if rejection:
+            return rejection
+
+        task = enqueue_reparse(content_hash, doc_type, task_id=str(uuid.uuid4()))
+        await CancellationToken.register_async(task.id)
+        SUBMISSIONS_TOTAL.labels("REPARSE", "QUEUED").inc()
+        return OCRTaskResponse(task_id=task.id, status="PROCESSING", message="Re-extracción encolada.")
+
+    @strawberry.mutation
+    async def scan_bundle(self, info: Info, dpi_front: Upload, dpi_back: Upload, rtu: Upload,
+                          patente: Optional[Upload] = None) -> OCRTaskResponse:
+        """
+        Onboarding de comercio: procesa DPI, RTU y Patente en paralelo (chord de Celery).
+        El task_id retornado corresponde al resultado agregado con validaciones cruzadas.
+        """
+        uploads = {'DPI_FRONT': dpi_front, 'DPI_BACK': dpi_back, 'RTU': rtu}
+        if patente is not None:
+            uploads['PATENTE'] = patente
+
+        # Cada documento del bundle consume un token del cliente
+        rejection = await _admit(info, "BUNDLE", cost=len(uploads))
+        if rejection:
+            return rejection
+
+        incoming = sum(getattr(f, "size", None) or 0 for f in uploads.values())
+        if not await run_in_threadpool(temp_storage.has_capacity, incoming):
+            SUBMISSIONS_TOTAL.labels("BUNDLE", "BUSY").inc()
+            return OCRTaskResponse(task_id="", status="BUSY", message="Servicio saturado, reintente en unos segundos",
+                                   retry_after_seconds=settings.ADMISSION_BUSY_RETRY_S)
+
+        saved = {}
+        try:
+            for doc_type, upload in uploads.items():
+                file_path = temp_storage.upload_path(_safe_ext(upload.filename))
+                saved[doc_type] = file_path
+                content = await upload.read()
+                async with aiofiles.open(file_path, 'wb') as out_file:
+                    await out_file.write(content)
+
+                is_safe, msg = FileValidator.validate_file_header(file_path)
+                if not is_safe:
+                    for path in saved.values():
+                        if os.path.exists(path):
+                            os.remove(path)
+                    SUBMISSIONS_TOTAL.labels("BUNDLE", "REJECTED").inc()
+                    return OCRTaskResponse(task_id="", status="FAILED", message=f"Archivo inseguro ({doc_type}): {msg}")
+
+            # Fan-out: un documento por worker; fan-in: consolidate_bundle con todos los resultados
+            await temp_storage.register_uploads_async(*saved.values())
+            job, document_ids = enqueue_bundle(saved, enqueued_at=time.time())
+            await CancellationToken.register_async(job.id, document_ids)
+            SUBMISSIONS_TOTAL.labels("BUNDLE", "QUEUED").inc()
+
+            return OCRTaskResponse(
+                task_id=job.id,
+                status="PROCESSING",
+                message=f"Bundle encolado ({len(saved)} documentos)."
+            )
+
+        except Exception as e:
+            for path in saved.values():
+                if os.path.exists(path):
+                    os.remove(path)
             return OCRTaskResponse(task_id="", status="FAILED", message=str(e))
 
 schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
@@ -1,13 +1,31 @@
 from fastapi import FastAPI
 from strawberry.fastapi import GraphQLRouter
+from prometheus_client import make_asgi_app
 from app.graphql.schema import schema
+from app.core.metrics import metrics_registry
+from app.core.queue_stats import QueueStatsCollector
+from app.core.admission import UploadLimitMiddleware
+from app.core.config import settings
 
 app = FastAPI(title="AvanzaOCR Service", version="1.0.0")
 
+# Límite de uploads simultáneos y de tamaño por proceso (antes de bufferizar el multipart)
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT_UPLOADS,
+    max_bytes=settings.ADMISSION_MAX_UPLOAD_MB * 1024 * 1024,
+    retry_after=settings.ADMISSION_MIN_RETRY_S,
+)
+
 # Montar ruta de GraphQL
 graphql_app = GraphQLRouter(schema)
 app.include_router(graphql_app, prefix="/graphql")
 
+# Métricas Prometheus (incluye profundidad/ETA de colas, refrescadas en segundo plano, no en el scrape)
+registry = metrics_registry()
+registry.register(QueueStatsCollector())
+app.mount("/metrics", make_asgi_app(registry=registry))
+
 @app.get("/")
 def root():
     return {"message": "AvanzaOCR Microservice Running"}
\ No newline at end of file
@@ -0,0 +1,221 @@
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import zipfile
+import logging
+import multiprocessing
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.storage import temp_storage
+
+logger = logging.getLogger(__name__)
+
+DOC_TYPES = ('DPI_FRONT', 'DPI_BACK', 'RTU', 'PATENTE', 'DPI_FRONT_REPRESENTANTE', 'DPI_BACK_REPRESENTANTE')
+EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png')
+
+# (id, doc_type, origen): origen es ('file', ruta) o ('zip', ruta_zip, miembro)
+Item = Tuple[str, str, tuple]
+
+# Motor por proceso del pool y modo del lote (se fijan una vez en el initializer)
+_engine = None
+_mode = None
+
+class BulkProcessor:
+    """
+    Procesamiento masivo offline (backfills / re-extracciones) sin GraphQL ni Celery:
+    - Entrada: directorio, ZIP o manifiesto CSV (`path,doc_type`). En directorios y ZIPs el doc_type sale de
+      --doc-type o del nombre de la carpeta contenedora (ej. `archivo/RTU/123.pdf`).
+    - Un pool de procesos, cada uno con su propio OCREngine; el proceso principal no carga paddle.
+    - Los resultados se escriben en JSONL a medida que terminan (orden de llegada, no de entrada).
+    - Reanudación: el propio JSONL es el checkpoint; con --resume se omiten los ids ya escritos.
+    """
+
+    @staticmethod
+    def _doc_type_from_path(path: str, default: Optional[str]) -> Optional[str]:
+        if default:
+            return default
+        folder = os.path.basename(os.path.dirname(path)).upper()
+        return folder if folder in DOC_TYPES else None
+
+    @staticmethod
+    def iter_items(source: str, doc_type: Optional[str] = None) -> Iterator[Item]:
+        """Enumera los documentos de la fuente sin leerlos (los ZIP se leen en cada proceso del pool)."""
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if not name.lower().endswith(EXTENSIONS):
+                        continue
+                    kind = BulkProcessor._doc_type_from_path(path, doc_type)
+                    if kind is None:
+                        logger.warning(f"Sin doc_type, se omite: {path}")
+                        continue
+                    yield os.path.relpath(path, source), kind, ('file', path)
+
+        elif zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(EXTENSIONS):
+                        continue
+                    kind = BulkProcessor._doc_type_from_path(info.filename, doc_type)
+                    if kind is None:
+                        logger.warning(f"Sin doc_type, se omite: {info.filename}")
+                        continue
+                    yield info.filename, kind, ('zip', source, info.filename)
+
+        else:
+            # Manifiesto CSV: rutas relativas al directorio del manifiesto
+            base = os.path.dirname(os.path.abspath(source))
+            with open(source, newline='', encoding='utf-8-sig') as f:
+                for row in csv.DictReader(f):
+                    path = (row.get('path') or '').strip()
+                    kind = (row.get('doc_type') or doc_type or '').strip().upper()
+                    if not path or kind not in DOC_TYPES:
+                        logger.warning(f"Fila inválida en el manifiesto, se omite: {row}")
+                        continue
+                    yield path, kind, ('file', os.path.join(base, path))
+
+    @staticmethod
+    def completed_ids(output_path: str, retry_errors: bool = False) -> Set[str]:
+        """Ids ya presentes en el JSONL de salida (checkpoint). Ignora una última línea truncada."""
+        done: Set[str] = set()
+        if not os.path.exists(output_path):
+            return done
+        with open(output_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if retry_errors and record.get('status') in ('ERROR', 'FAILED'):
+                    continue
+                done.add(record['id'])
+        return done
+
+def _init_worker(overrides: Dict[str, Any], mode: Optional[str] = None) -> None:
+    """Initializer del pool: aplica la configuración del lote y carga el modelo una vez por proceso."""
+    global _engine, _mode
+    _mode = mode
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    # Import diferido: sólo los procesos del pool cargan paddle/OpenCV
+    from app.services.ocr_engine import OCREngine
+    _engine = OCREngine()
+
+def _process(item: Item) -> Dict[str, Any]:
+    item_id, doc_type, origin = item
+    start = time.perf_counter()
+    try:
+        # Copia de trabajo: el pipeline deja intermedios junto al archivo y no debe tocar el archivo original
+        with temp_storage.task_scope() as scope_dir:
+            work_path = os.path.join(scope_dir, 'input' + os.path.splitext(origin[-1])[1].lower())
+            if origin[0] == 'zip':
+                with zipfile.ZipFile(origin[1]) as archive, archive.open(origin[2]) as src, open(work_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                shutil.copyfile(origin[1], work_path)
+            result = _engine.process_document(work_path, doc_type, _mode)
+    except Exception as e:
+        result = {'status': 'ERROR', 'data': {}, 'meta': {'message': str(e)}}
+    return {'id': item_id, 'doc_type': doc_type, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+            **result}
+
+def _progress(done: int, total: int, started: float, latencies: List[float]) -> str:
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else float('inf')
+    p50 = np.percentile(latencies, 50) if latencies else 0.0
+    return (f"{done}/{total} docs | {rate:.2f} docs/s | p50 {p50:.0f} ms/doc | "
+            f"transcurrido {elapsed:.0f}s | restante ~{eta:.0f}s")
+
+def run(source: str, output_path: str, processes: int, doc_type: Optional[str] = None, resume: bool = False,
+        retry_errors: bool = False, near_duplicates: bool = False, quality_gate: bool = True,
+        max_tasks_per_child: Optional[int] = None, report_every: float = 10.0,
+        mode: Optional[str] = None) -> Dict[str, Any]:
+    """Procesa la fuente completa y retorna el resumen (conteo por estado, throughput, percentiles)."""
+    done_ids = BulkProcessor.completed_ids(output_path, retry_errors) if resume else set()
+    items = [item for item in BulkProcessor.iter_items(source, doc_type) if item[0] not in done_ids]
+    total = len(items)
+    print(f"{total} documentos por procesar ({len(done_ids)} ya en {output_path})", file=sys.stderr)
+
+    overrides = {
+        # Núcleos repartidos entre procesos para no sobresuscribir la CPU
+        'OCR_CPU_THREADS': int(os.getenv('OCR_CPU_THREADS') or max(1, (os.cpu_count() or 1) // processes)),
+        # El índice de near-duplicates es una señal de fraude de capturas en vivo: un backfill no debe
+        # reutilizar resultados previos ni poblarlo
+        'PHASH_INDEX_ENABLED': near_duplicates and settings.PHASH_INDEX_ENABLED,
+        'QUALITY_GATE_ENABLED': quality_gate and settings.QUALITY_GATE_ENABLED,
+    }
+
+    statuses: Dict[str, int] = {}
+    latencies: List[float] = []
+    started = last_report = time.time()
+    file_mode = 'a' if resume else 'w'
+    with open(output_path, file_mode, encoding='utf-8') as out:
+        # Una corrida interrumpida puede dejar la última línea a medias
+        if resume and out.tell() > 0:
+            with open(output_path, 'rb') as check:
+                check.seek(-1, os.SEEK_END)
+                if check.read(1) != b'\n':
+                    out.write('\n')
+
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(overrides, mode),
+                                  maxtasksperchild=max_tasks_per_child) as pool:
+            for record in pool.imap_unordered(_process, items, chunksize=1):
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                out.flush()
+                statuses[record['status']] = statuses.get(record['status'], 0) + 1
+                latencies.append(record['elapsed_ms'])
+                if time.time() - last_report >= report_every:
+                    print(_progress(len(latencies), total, started, latencies), file=sys.stderr)
+                    last_report = time.time()
+
+    elapsed = time.time() - started
+    summary = {
+        'processed': len(latencies),
+        'skipped': len(done_ids),
+        'statuses': statuses,
+        'elapsed_s': round(elapsed, 1),
+        'throughput_per_s': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'processes': processes,
+        'ocr_cpu_threads': overrides['OCR_CPU_THREADS'],
+        'mode': mode or settings.OCR_MODE_DEFAULT,
+    }
+    if latencies:
+        summary.update({f'p{p}_ms': round(float(np.percentile(latencies, p)), 1) for p in (50, 95, 99)})
+    return summary
+
+def main(argv=None) -> int:
+    """CLI: python -m app.services.bulk_processor <directorio|archivo.zip|manifiesto.csv> -o resultados.jsonl"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Procesamiento masivo offline de documentos a JSONL.")
+    parser.add_argument('source', help="Directorio, ZIP o manifiesto CSV (path,doc_type)")
+    parser.add_argument('-o', '--output', required=True, help="Archivo JSONL de resultados")
+    parser.add_argument('-p', '--processes', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Procesos del pool (cada uno carga su OCREngine)")
+    parser.add_argument('--doc-type', choices=DOC_TYPES, help="doc_type para todos los archivos")
+    parser.add_argument('--mode', choices=settings.OCR_MODES, help="Modo de procesamiento (por defecto OCR_MODE_DEFAULT)")
+    parser.add_argument('--resume', action='store_true', help="Omitir los ids ya presentes en el JSONL")
+    parser.add_argument('--retry-errors', action='store_true', help="Con --resume, reprocesar ERROR/FAILED")
+    parser.add_argument('--near-duplicates', action='store_true', help="Usar el índice pHash (reutilización)")
+    parser.add_argument('--no-quality-gate', dest='quality_gate', action='store_false',
+                        help="No rechazar fotos por calidad")
+    parser.add_argument('--max-tasks-per-child', type=int, help="Reciclar procesos cada N documentos")
+    parser.add_argument('--report-every', type=float, default=10.0, help="Segundos entre reportes de progreso")
+    args = parser.parse_args(argv)
+
+    summary = run(args.source, args.output, args.processes, args.doc_type, args.resume, args.retry_errors,
+                  args.near_duplicates, args.quality_gate, args.max_tasks_per_child, args.report_every,
+                  args.mode)
+    print(json.dumps(summary, indent=2, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+import re
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from rapidfuzz import fuzz
+
+logger = logging.getLogger(__name__)
+
+class BundleValidator:
+    """
+    Consolida los documentos de onboarding de un comercio (DPI, RTU, Patente)
+    y verifica la coherencia entre ellos (CUI, NIT, nombres, vigencia).
+    """
+
+    NAME_MATCH_THRESHOLD = 85
+    MISMATCH_PENALTY = 20
+
+    @staticmethod
+    def consolidate(documents: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        documents: {doc_type: resultado de OCREngine.process_document}
+        Retorna un único resultado agregado con el mismo formato (status, meta, data).
+        """
+        data = {doc_type: result.get('data') or {} for doc_type, result in documents.items()}
+        summary = {
+            doc_type: {
+                'status': result.get('status', 'FAILED'),
+                'score': (result.get('meta') or {}).get('score', 0),
+                'message': (result.get('meta') or {}).get('message'),
+            }
+            for doc_type, result in documents.items()
+        }
+
+        checks = BundleValidator.cross_check(data)
+        failed = [doc_type for doc_type, s in summary.items() if s['status'] != 'SUCCESS']
+        mismatches = [name for name, check in checks.items() if check['match'] is False]
+
+        if failed:
+            status = 'INCOMPLETE'
+        elif mismatches:
+            status = 'INCONSISTENT'
+        else:
+            status = 'SUCCESS'
+
+        doc_score = sum(s['score'] or 0 for s in summary.values()) / max(len(summary), 1)
+        score = max(0, int(doc_score) - BundleValidator.MISMATCH_PENALTY * len(mismatches))
+
+        return {
+            'status': status,
+            'data': data,
+            'meta': {
+                'isValid': status == 'SUCCESS',
+                'score': score,
+                'method': 'BUNDLE_CROSS_CHECK',
+                'documents': summary,
+                'checks': checks,
+                'failedDocuments': failed,
+                'mismatches': mismatches,
+            }
+        }
+
+    @staticmethod
+    def cross_check(data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Cada verificación retorna match True/False, o None si faltan datos para comparar."""
+        dpi = data.get('DPI_FRONT', {})
+        dpi_back = data.get('DPI_BACK', {})
+        rtu = data.get('RTU', {})
+        patente = data.get('PATENTE', {})
+
+        dpi_name = " ".join(x for x in [dpi.get('NOMBRE'), dpi.get('APELLIDO')] if x)
+        is_juridica = rtu.get('TIPO_PERSONA') == 'JURIDICA'
+        # En sociedades el DPI corresponde al representante legal
+        rtu_person = rtu.get('REPRESENTANTE_LEGAL') if is_juridica else rtu.get('NOMBRE_COMPLETO')
+
+        checks = {
+            'CUI_DPI_RTU': BundleValidator._compare_ids(dpi.get('CUI'), None if is_juridica else rtu.get('CUI')),
+            'NOMBRE_DPI_RTU': BundleValidator._compare_names(dpi_name, rtu_person),
+            'NIT_RTU_VALIDO': BundleValidator._check_nit(rtu.get('NIT')),
+            'DPI_VIGENTE': BundleValidator._check_expiry(dpi_back.get('FECHA_VENCIMIENTO')),
+        }
+
+        if patente:
+            if patente.get('TIPO_PATENTE') == 'SOCIEDAD':
+                checks['NOMBRE_PATENTE_RTU'] = BundleValidator._compare_names(patente.get('RAZON_SOCIAL'), rtu.get('RAZON_SOCIAL'))
+            else:
+                comerciales = [e.get('nombre_comercial') for e in rtu.get('ESTABLECIMIENTOS') or []]
+                comerciales.append(rtu.get('NOMBRE_COMERCIAL'))
+                checks['NOMBRE_PATENTE_RTU'] = BundleValidator._compare_best(patente.get('NOMBRE_EMPRESA'), comerciales)
+                checks['PROPIETARIO_PATENTE_DPI'] = BundleValidator._compare_names(patente.get('PROPIETARIO'), dpi_name)
+
+        return checks
+
+    @staticmethod
+    def _compare_ids(a: Optional[str], b: Optional[str]) -> Dict[str, Any]:
+        clean_a = re.sub(r'\D', '', a or '')
+        clean_b = re.sub(r'\D', '', b or '')
+        if not clean_a or not clean_b:
+            return {'match': None, 'values': [a, b]}
+        return {'match': clean_a == clean_b, 'values': [a, b]}
+
+    @staticmethod
+    def _compare_names(a: Optional[str], b: Optional[str]) -> Dict[str, Any]:
+        if not a or not b:
+            return {'match': None, 'values': [a, b]}
+        # token_set_ratio tolera nombres incompletos (ej. DPI sin segundo apellido)
+        ratio = fuzz.token_set_ratio(a.upper(), b.upper())
+        return {'match': ratio >= BundleValidator.NAME_MATCH_THRESHOLD, 'ratio': ratio, 'values': [a, b]}
+
+    @staticmethod
+    def _compare_best(a: Optional[str], candidates) -> Dict[str, Any]:
+        candidates = [c for c in candidates if c]
+        if not a or not candidates:
+            return {'match': None, 'values': [a, candidates]}
+        best = max(candidates, key=lambda c: fuzz.token_set_ratio(a.upper(), c.upper()))
+        return BundleValidator._compare_names(a, best)
+
+    @staticmethod
+    def _check_nit(nit: Optional[str]) -> Dict[str, Any]:
+        """Dígito verificador del NIT (módulo 11 de SAT, 'K' representa 10)."""
+        clean = re.sub(r'[^0-9K]', '', (nit or '').upper())
+        if len(clean) < 2 or not clean[:-1].isdigit():
+            return {'match': None, 'values': [nit]}
+
+        body, check = clean[:-1], clean[-1]
+        total = sum(int(d) * w for d, w in zip(body, range(len(body) + 1, 1, -1)))
+        expected = (11 - total % 11) % 11
+        expected_char = 'K' if expected == 10 else str(expected)
+        return {'match': check == expected_char, 'values': [nit]}
+
+    @staticmethod
+    def _check_expiry(fecha: Optional[str]) -> Dict[str, Any]:
+        if not fecha:
+            return {'match': None, 'values': [fecha]}
+        m = re.search(r'(\d{2})/(\d{2})/(\d{4})', fecha)
+        if not m:
+            return {'match': None, 'values': [fecha]}
+        try:
+            vence = datetime(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+        except ValueError:
+            return {'match': None, 'values': [fecha]}
+        return {'match': vence >= datetime.now(), 'values': [fecha]}
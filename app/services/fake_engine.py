@@ -0,0 +1,44 @@
+import random
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import DOCUMENT_SECONDS, DOCUMENTS_TOTAL, collect_timings, stage
+
+class FakeOCREngine:
+    """
+    Sustituto de OCREngine para pruebas de carga: no carga modelos ni lee el archivo, sólo duerme
+    la latencia configurada y retorna un resultado con la forma del pipeline real.
+    Permite medir la ruta API -> broker -> worker -> backend sin el costo (ni la variabilidad) del OCR.
+    El worker lo usa cuando OCR_FAKE_ENGINE=true.
+    """
+
+    def __init__(self, latency_ms: float = 500.0, jitter_ms: float = 0.0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    def process_document(self, file_path: str, doc_type: str, mode: Optional[str] = None) -> Dict[str, Any]:
+        with collect_timings(doc_type) as timings:
+            with stage('fake_ocr'):
+                # time.sleep libera el GIL: se comporta como la inferencia frente al pool `threads`
+                time.sleep(max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+            failed = self._rng.random() < self.failure_rate
+
+        result = {
+            'status': 'FAILED' if failed else 'SUCCESS',
+            'data': {} if failed else {'DOC_TYPE': doc_type},
+            'meta': {
+                'isValid': not failed,
+                'score': 0 if failed else 100,
+                'method': 'FAKE_ENGINE',
+                'message': 'Falla simulada' if failed else 'Resultado simulado',
+                'timings_ms': timings.as_dict(),
+                'mode': mode or settings.OCR_MODE_DEFAULT,
+            }
+        }
+        DOCUMENT_SECONDS.labels(doc_type, 'FAKE_ENGINE').observe(timings.elapsed)
+        DOCUMENTS_TOTAL.labels(doc_type, result['status'], 'FAKE_ENGINE').inc()
+        return result
@@ -0,0 +1,82 @@
+import logging
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.core.metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# PIL lanza DecompressionBombError por encima de 2x este valor al abrir la cabecera
+Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+
+class ImageTooLargeError(ValueError):
+    """La imagen excede el presupuesto de píxeles permitido (posible decompression bomb)."""
+
+class ImageDecoder:
+    """
+    Capa de decodificación con memoria acotada.
+    1. Lee dimensiones desde la cabecera (sin decodificar píxeles).
+    2. Rechaza imágenes por encima de IMAGE_MAX_PIXELS.
+    3. Si supera IMAGE_TARGET_PIXELS decodifica directamente a escala reducida (1/2, 1/4, 1/8).
+       En JPEG la reducción se hace en el dominio DCT: nunca se materializa la resolución completa.
+    """
+
+    # Factor de reducción -> flag de OpenCV (color y escala de grises)
+    REDUCED_FLAGS = {
+        1: (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE),
+        2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+        4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+        8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    }
+
+    @staticmethod
+    def read_dimensions(image_path: str) -> Optional[Tuple[int, int]]:
+        """Retorna (ancho, alto) leyendo sólo la cabecera, o None si no es una imagen reconocible."""
+        try:
+            with Image.open(image_path) as img:
+                return img.size
+        except Image.DecompressionBombError as e:
+            raise ImageTooLargeError(str(e))
+        except Exception as e:
+            logger.warning(f"ImageDecoder: cabecera ilegible en {image_path}: {e}")
+            return None
+
+    @staticmethod
+    def reduction_factor(width: int, height: int, target_pixels: int) -> int:
+        """Menor factor (1, 2, 4, 8) que deja la imagen dentro del objetivo de píxeles."""
+        pixels = width * height
+        for factor in (1, 2, 4):
+            if pixels / (factor * factor) <= target_pixels:
+                return factor
+        return 8
+
+    @staticmethod
+    @timed_stage("decode")
+    def decode(image_path: str, grayscale: bool = False,
+               target_pixels: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Decodifica respetando el presupuesto de memoria.
+        Raises:
+            ImageTooLargeError: si la cabecera declara más de IMAGE_MAX_PIXELS.
+        """
+        dims = ImageDecoder.read_dimensions(image_path)
+        if dims is None:
+            return None
+
+        width, height = dims
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ImageTooLargeError(
+                f"Imagen de {width}x{height} ({width * height / 1e6:.1f} MP) excede el límite de "
+                f"{settings.IMAGE_MAX_PIXELS / 1e6:.0f} MP"
+            )
+
+        factor = ImageDecoder.reduction_factor(width, height, target_pixels or settings.IMAGE_TARGET_PIXELS)
+        if factor > 1:
+            logger.info(f"ImageDecoder: {width}x{height} decodificada a escala 1/{factor}")
+
+        color_flag, gray_flag = ImageDecoder.REDUCED_FLAGS[factor]
+        return cv2.imread(image_path, gray_flag if grayscale else color_flag)
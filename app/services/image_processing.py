@@ -1,7 +1,9 @@
 import cv2
 import numpy as np
 import imutils
-from skimage.filters import threshold_local
+
+from app.core.metrics import timed_stage
+from app.services.image_decoder import ImageDecoder
 
 class ImagePreprocessor:
     @staticmethod
@@ -56,13 +58,28 @@ class ImagePreprocessor:
         """
         Intenta detectar el documento, recortarlo y binarizarlo para OCR de alta precisión.
         Si falla la detección de bordes, devuelve una versión preprocesada estándar.
+        Versión en disco de `enhance_image`: escribe el resultado junto a la imagen original.
         """
-        image = cv2.imread(image_path)
+        image = ImageDecoder.decode(image_path)
         if image is None:
             return None, False
 
+        processed, perspective_fixed = ImagePreprocessor.enhance_image(image)
+        processed_path = image_path + (".warped.jpg" if perspective_fixed else ".proc.jpg")
+        cv2.imwrite(processed_path, processed)
+        return processed_path, perspective_fixed
+
+    @staticmethod
+    @timed_stage("preprocess")
+    def enhance_image(image, denoise: bool = True):
+        """
+        Preprocesamiento en memoria sobre una imagen BGR ya decodificada.
+        denoise=False omite fastNlMeansDenoising en el fallback (modo FAST: es la operación más cara).
+        Retorna: (imagen en escala de grises, bool perspectiva corregida)
+        """
         ratio = image.shape[0] / 500.0
-        orig = image.copy()
+        # imutils.resize devuelve un array nuevo: no hace falta copiar el original a resolución completa
+        orig = image
         image = imutils.resize(image, height=500)
 
         # 1. Detección de bordes
@@ -70,8 +87,8 @@ class ImagePreprocessor:
         gray = cv2.GaussianBlur(gray, (5, 5), 0)
         edged = cv2.Canny(gray, 75, 200)
 
-        # 2. Encontrar contornos
-        cnts = cv2.findContours(edged.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        # 2. Encontrar contornos (OpenCV >= 4 no modifica la imagen de entrada)
+        cnts = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
         cnts = imutils.grab_contours(cnts)
         cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
 
@@ -90,19 +107,25 @@ class ImagePreprocessor:
             # Aplicar transformación de perspectiva
             warped = ImagePreprocessor.four_point_transform(orig, screenCnt.reshape(4, 2) * ratio)
             
-            # Post-procesamiento (Binarización adaptativa para resaltar texto negro sobre fondo claro)
-            warped_gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
-            T = threshold_local(warped_gray, 11, offset=10, method="gaussian")
-            warped_bw = (warped_gray > T).astype("uint8") * 255
-            
-            # Guardar temporalmente para depuración o uso
-            processed_path = image_path + ".warped.jpg"
-            cv2.imwrite(processed_path, warped_gray) # Usamos escala de grises, es más seguro para OCR
-            return processed_path, True
+            # Escala de grises: es más segura para OCR que la versión binarizada (threshold_local)
+            return cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY), True
         else:
             # Fallback: Procesamiento simple si no encontramos bordes claros
             gray = cv2.cvtColor(orig, cv2.COLOR_BGR2GRAY)
-            gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-            processed_path = image_path + ".proc.jpg"
-            cv2.imwrite(processed_path, gray)
-            return processed_path, False
\ No newline at end of file
+            if denoise:
+                gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+            return gray, False
+
+    @staticmethod
+    @timed_stage("phash")
+    def perceptual_hash(gray) -> int:
+        """
+        pHash de 64 bits de la imagen normalizada (escala de grises, perspectiva corregida).
+        DCT de 32x32 y se conservan las frecuencias bajas 8x8: robusto a reencuadres leves,
+        cambios de iluminación y recompresión. Comparar con distancia de Hamming.
+        """
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].flatten()
+        # El coeficiente DC (brillo medio) no participa en la mediana
+        bits = low > np.median(low[1:])
+        return int(sum(1 << i for i, bit in enumerate(bits) if bit))
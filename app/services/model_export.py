@@ -0,0 +1,91 @@
+import os
+import sys
+import shutil
+import subprocess
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+class ModelExporter:
+    """
+    Genera los modelos que esperan OCR_BACKEND=onnx y OCR_QUANTIZED (ver OCREngine._resolve_model_dir):
+    - <OCR_MODELS_DIR>/onnx_fp32/<det|rec|cls>.onnx: exportación con paddle2onnx de los modelos de inferencia
+      de Paddle (por defecto los que PaddleOCR descarga para lang='es').
+    - <OCR_MODELS_DIR>/onnx_int8/<det|rec|cls>.onnx: cuantización dinámica INT8 (pesos) con ONNX Runtime,
+      sin datos de calibración.
+    Los modelos INT8 de Paddle (paddle_int8/) no se generan aquí: requieren cuantización con PaddleSlim
+    o los modelos slim publicados por PaddleOCR (ver README).
+    """
+
+    COMPONENTS = ('det', 'rec', 'cls')
+
+    @staticmethod
+    def default_sources() -> Dict[str, str]:
+        """Directorios de inferencia de Paddle que usa PaddleOCR (los descarga si faltan)."""
+        from paddleocr import PaddleOCR
+        ocr = PaddleOCR(use_angle_cls=True, lang='es', show_log=False)
+        args = ocr.args
+        return {'det': args.det_model_dir, 'rec': args.rec_model_dir, 'cls': args.cls_model_dir}
+
+    @staticmethod
+    def export_onnx(model_dir: str, output_path: str, opset: int = 11) -> str:
+        """Exporta un modelo de inferencia de Paddle (inference.pdmodel/.pdiparams) a ONNX."""
+        if shutil.which('paddle2onnx') is None:
+            raise RuntimeError("paddle2onnx no está instalado (pip install -r requirements.txt)")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        subprocess.run([
+            'paddle2onnx',
+            '--model_dir', model_dir,
+            '--model_filename', 'inference.pdmodel',
+            '--params_filename', 'inference.pdiparams',
+            '--save_file', output_path,
+            '--opset_version', str(opset),
+            '--enable_onnx_checker', 'True',
+        ], check=True)
+        return output_path
+
+    @staticmethod
+    def quantize_int8(input_path: str, output_path: str) -> str:
+        """Cuantización dinámica: pesos INT8, activaciones calculadas en tiempo de ejecución."""
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        quantize_dynamic(input_path, output_path, weight_type=QuantType.QUInt8)
+        return output_path
+
+    @staticmethod
+    def run(models_dir: str, sources: Dict[str, str], quantize: bool = True, opset: int = 11) -> List[str]:
+        written = []
+        for component in ModelExporter.COMPONENTS:
+            model_dir = sources.get(component)
+            if not model_dir:
+                continue
+            fp32_path = os.path.join(models_dir, 'onnx_fp32', f"{component}.onnx")
+            written.append(ModelExporter.export_onnx(model_dir, fp32_path, opset))
+            if quantize:
+                int8_path = os.path.join(models_dir, 'onnx_int8', f"{component}.onnx")
+                written.append(ModelExporter.quantize_int8(fp32_path, int8_path))
+        return written
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """CLI: python -m app.services.model_export [--no-quantize] [--det DIR --rec DIR --cls DIR]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Exporta los modelos OCR a ONNX (fp32 e INT8) en OCR_MODELS_DIR.")
+    parser.add_argument('--models-dir', default=settings.OCR_MODELS_DIR, help="Destino (por defecto OCR_MODELS_DIR)")
+    for component in ModelExporter.COMPONENTS:
+        parser.add_argument(f'--{component}', help=f"Modelo de inferencia Paddle para '{component}' "
+                                                   "(por defecto el de PaddleOCR lang='es')")
+    parser.add_argument('--opset', type=int, default=11)
+    parser.add_argument('--no-quantize', action='store_true', help="Sólo onnx_fp32")
+    args = parser.parse_args(argv)
+
+    sources = {c: getattr(args, c) for c in ModelExporter.COMPONENTS}
+    if not all(sources.values()):
+        defaults = ModelExporter.default_sources()
+        sources = {c: sources[c] or defaults[c] for c in ModelExporter.COMPONENTS}
+
+    for path in ModelExporter.run(args.models_dir, sources, quantize=not args.no_quantize, opset=args.opset):
+        print(path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
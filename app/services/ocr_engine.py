@@ -1,19 +1,27 @@
 import os
-import cv2
 import re
 import logging
-import uuid
-from typing import Dict, Any
+import importlib.util
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 
-from paddleocr import PaddleOCR
+import cv2
 from rapidfuzz import fuzz
 
 # Servicios internos
 from app.services.image_processing import ImagePreprocessor
+from app.services.image_decoder import ImageDecoder, ImageTooLargeError
+from app.services.quality_gate import ImageQualityGate
+from app.services.predictor_pool import PredictorPool
+from app.services.tiling import PageTiler
 from app.services.pdf_parser import PDFParser
 from app.services.qr_service import QREngine
 from app.services.registry_validator import RegistryValidator # <--- NUEVO IMPORT
 from app.core.config import settings
+from app.core.metrics import collect_timings, stage, DOCUMENT_SECONDS, DOCUMENTS_TOTAL, NEAR_DUPLICATES_TOTAL
+from app.core.near_duplicates import NearDuplicateIndex
+from app.core.layout_store import LayoutStore, layout_store
+from app.core.cancellation import checkpoint
 
 # Configuración Logs
 logging.getLogger("ppocr").setLevel(logging.ERROR)
@@ -28,19 +36,65 @@ class OCREngine:
     3. Si es Patente y tiene QR, valida contra el Registro Mercantil.
     """
 
-    def __init__(self):
-        # Cargar modelo personalizado si existe, sino usar default
-        rec_model_dir = './training/output/final_dpi_model'
-        if not os.path.exists(rec_model_dir):
-            rec_model_dir = None
-            
-        self.ocr = PaddleOCR(
-            use_angle_cls=True, 
-            lang='es',
-            rec_model_dir=rec_model_dir, 
-            show_log=False
-        )
-        
+    SUPPORTED_BACKENDS = ('paddle', 'paddle_mkldnn', 'onnx')
+
+    # PDFs escaneados: se procesan páginas hasta tener los campos requeridos y, si aplica,
+    # hasta ver la sección final del documento (hasta PDF_OCR_MAX_PAGES). Sin política: sólo la primera.
+    PAGE_POLICIES = {
+        'RTU': {'required': ('NIT', 'NOMBRE_COMPLETO'), 'end_marker': r'DATOS DEL CONTADOR'},
+    }
+
+    # Cascada OCR: si tras la pasada rápida falta alguno de estos campos, se repite la página completa
+    CASCADE_REQUIRED_FIELDS = {
+        'DPI_FRONT': ('CUI', 'NOMBRE', 'APELLIDO'),
+        'DPI_FRONT_REPRESENTANTE': ('CUI', 'NOMBRE', 'APELLIDO'),
+        'DPI_BACK': ('FECHA_VENCIMIENTO',),
+        'DPI_BACK_REPRESENTANTE': ('FECHA_VENCIMIENTO',),
+        'RTU': ('NIT', 'NOMBRE_COMPLETO'),
+    }
+    # Claves que el parser fija sin leer nada del documento (constantes, método, valor por defecto de
+    # parse_rtu): no cuentan como campos encontrados en el score. Las PAGINAS_* van en meta.
+    SCORE_EXCLUDED_FIELDS = ('TIPO_DOCUMENTO', 'METODO', 'TIPO_PERSONA')
+
+    # Campo que identifica al titular del documento: las repeticiones para revisión de fraude se cuentan
+    # por él (el pHash no distingue tarjetas distintas de la misma plantilla)
+    IDENTITY_FIELDS = {
+        'DPI_FRONT': 'CUI',
+        'DPI_FRONT_REPRESENTANTE': 'CUI',
+        'DPI_BACK': 'MRZ_RAW',
+        'DPI_BACK_REPRESENTANTE': 'MRZ_RAW',
+        'RTU': 'NIT',
+        'PATENTE': 'REGISTRO',
+    }
+
+    # Orden de costo de las pasadas (el documento reporta la más cara que usó alguna página)
+    OCR_PASSES = ('fast', 'refined', 'full')
+
+    # Modos por request (scanDocument `mode`), de menor a mayor precisión:
+    # - max_side:  resolución objetivo antes del preprocesamiento (None = original)
+    # - denoise:   fastNlMeansDenoising en el preprocesamiento
+    # - ocr:       'fast' sólo la pasada rápida, 'cascade' cascada con escalamiento,
+    #              'accurate' página completa con el predictor preciso + relectura de regiones dudosas
+    # - angle_cls: clasificador de orientación de líneas
+    # - registry_online: validación de la patente contra el Registro Mercantil en línea (False = sólo índice local)
+    MODE_PROFILES = {
+        'FAST': {'max_side': settings.OCR_FAST_MODE_MAX_SIDE, 'denoise': False, 'ocr': 'fast',
+                 'angle_cls': False, 'registry_online': False},
+        'BALANCED': {'max_side': None, 'denoise': True, 'ocr': 'cascade',
+                     'angle_cls': settings.OCR_USE_ANGLE_CLS, 'registry_online': True},
+        'ACCURATE': {'max_side': None, 'denoise': True, 'ocr': 'accurate',
+                     'angle_cls': True, 'registry_online': True},
+    }
+
+    def __init__(self, load_models: bool = True):
+        """load_models=False: motor sólo de parsers y scoring (reparse), sin cargar paddle."""
+        self.ocr = self.fast_ocr = None
+        # Predictor del modo ACCURATE: se carga con la primera tarea que lo pide (ver _accurate_predictor)
+        self.accurate_ocr = None
+        self._accurate_lock = threading.Lock()
+        if load_models:
+            self._load_models()
+
         self.STOP_LABELS = [
             'NOMBRE', 'NOMBRES', 'APELLIDO', 'APELLIDOS',
             'NACIONALIDAD', 'SEXO', 'GENERO', 'FECHA', 'NACIMIENTO',
@@ -51,10 +105,49 @@ class OCREngine:
             'AFILIACIONES', 'VEHICULOS', 'CONTADOR', 'REPRESENTANTE'
         ]
 
-    def process_document(self, file_path: str, doc_type: str) -> Dict[str, Any]:
-        processed_path = None 
-        temp_image_path = None 
-        
+    def _load_models(self) -> None:
+        # Import diferido: importar el módulo (ej. para PAGE_POLICIES) no carga paddle
+        from paddleocr import PaddleOCR
+
+        # Pools de predictores con pesos compartidos (mismo `.ocr(...)` que PaddleOCR, seguros entre hilos)
+        pool_size = settings.OCR_PREDICTOR_POOL_SIZE
+        self.ocr = PredictorPool(PaddleOCR(**self._build_inference_kwargs()), pool_size)
+        # Pasada rápida de la cascada: los mismos predictores con menor límite del detector (sin otro modelo en RAM).
+        # Sólo un reconocedor liviano explícito (OCR_FAST_REC_MODEL_DIR) carga un segundo PaddleOCR.
+        if settings.OCR_CASCADE_ENABLED and settings.OCR_FAST_REC_MODEL_DIR:
+            self.fast_ocr = PredictorPool(PaddleOCR(**self._build_inference_kwargs('fast')), pool_size)
+        elif settings.OCR_CASCADE_ENABLED:
+            self.fast_ocr = self.ocr.with_det_limit(settings.OCR_FAST_DET_LIMIT_SIDE_LEN)
+
+    def process_document(self, file_path: str, doc_type: str, mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Ejecuta el pipeline completo y adjunta el desglose de tiempos por etapa en meta.timings_ms.
+        mode: FAST / BALANCED / ACCURATE (ver MODE_PROFILES); por defecto OCR_MODE_DEFAULT.
+        """
+        mode = (mode or settings.OCR_MODE_DEFAULT).upper()
+        if mode not in self.MODE_PROFILES:
+            return {'status': 'ERROR', 'data': {}, 'meta': {'message': f"Modo inválido: {mode}"}}
+
+        with collect_timings(doc_type) as timings:
+            # sha256 del archivo: reutilización de duplicados exactos y clave de la captura cruda (reparseDocument)
+            content_hash = LayoutStore.content_hash(file_path) if os.path.exists(file_path) else None
+            result = self._run_pipeline(file_path, doc_type, mode, content_hash)
+
+        meta = result.setdefault('meta', {})
+        meta['timings_ms'] = timings.as_dict()
+        meta['mode'] = mode
+        # Sólo si hay captura guardada para reparseDocument (store desactivado, error de escritura, expirada)
+        if content_hash and layout_store.exists(content_hash):
+            meta['contentHash'] = content_hash
+
+        method = meta.get('method', 'NONE')
+        DOCUMENT_SECONDS.labels(doc_type, method).observe(timings.elapsed)
+        DOCUMENTS_TOTAL.labels(doc_type, result.get('status', 'UNKNOWN'), method).inc()
+        return result
+
+    def _run_pipeline(self, file_path: str, doc_type: str, mode: str,
+                      content_hash: Optional[str] = None) -> Dict[str, Any]:
+        profile = self.MODE_PROFILES[mode]
         if not os.path.exists(file_path):
             return {'status': 'ERROR', 'data': {}, 'meta': {'message': 'Archivo no encontrado'}}
 
@@ -63,51 +156,23 @@ class OCREngine:
         # ==========================================================
         if file_path.lower().endswith('.pdf'):
             text_content = PDFParser.extract_text_content(file_path)
+            checkpoint()
             
             # Si hay texto seleccionable
             if len(text_content.strip()) > 50: 
                 try:
-                    data = {}
-                    if doc_type == 'RTU':
-                        data = PDFParser.parse_rtu(text_content)
-                    elif doc_type == 'PATENTE':
-                        data = PDFParser.parse_patente(text_content)
-                        
-                        # --- QR & VALIDACION OFICIAL ---
+                    # --- QR (la validación oficial se hace al interpretar) ---
+                    qr_url = None
+                    if doc_type == 'PATENTE':
                         qr_image = PDFParser.get_page_image(file_path, page_number=0)
                         if qr_image is not None:
                             qr_url = QREngine.scan_qr(qr_image)
-                            if qr_url:
-                                data['QR_URL'] = qr_url
-                                # LLAMADA AL VALIDADOR WEB
-                                validacion = RegistryValidator.validate_patente(data, qr_url)
-                                data['VALIDACION_OFICIAL'] = validacion
-                    
-                    # Validar integridad mínima
-                    has_key_data = (
-                        data.get('NIT') or 
-                        data.get('NOMBRE_COMPLETO') or 
-                        data.get('RAZON_SOCIAL') or 
-                        data.get('REGISTRO')
-                    )
-                    
-                    if data and has_key_data:
-                        # Si la validación oficial dice que coincide, score 100
-                        score = 100
-                        if doc_type == 'PATENTE':
-                             val_info = data.get('VALIDACION_OFICIAL', {})
-                             if val_info.get('COINCIDENCIA_TOTAL') is False:
-                                 score = 60 # Penalizar si el QR dice una cosa y el PDF otra
-                        
-                        return {
-                            'status': 'SUCCESS', 
-                            'data': data, 
-                            'meta': {
-                                'isValid': True, 
-                                'score': score, 
-                                'method': 'NATIVE_PDF_VALIDATED'
-                            }
-                        }
+
+                    capture = {'source': 'NATIVE_PDF', 'text': text_content, 'qr_url': qr_url}
+                    result = self._interpret_native(doc_type, capture, profile['registry_online'])
+                    if result is not None:
+                        self._store_capture(content_hash, doc_type, mode, capture)
+                        return result
                 except Exception as e:
                     logger.error(f"Fallo en parser nativo: {e}. Intentando estrategia OCR.")
 
@@ -115,103 +180,553 @@ class OCREngine:
         # 2. OCR VISUAL (Fallback para Imágenes o Scans)
         # ==========================================================
         try:
-            file_to_process = file_path
-            
-            # Conversión PDF -> Imagen si falló el nativo
-            if file_path.lower().endswith('.pdf'):
+            # Decodificación acotada en memoria: páginas del PDF bajo demanda o la imagen subida
+            is_pdf = file_path.lower().endswith('.pdf')
+            if is_pdf:
                 logger.info("Convirtiendo PDF a Imagen para OCR...")
-                pdf_image = PDFParser.get_page_image(file_path, page_number=0)
-                if pdf_image is not None:
-                    temp_name = f"{uuid.uuid4()}_temp_ocr.jpg"
-                    temp_image_path = os.path.join(settings.TEMP_DIR, temp_name)
-                    cv2.imwrite(temp_image_path, pdf_image)
-                    file_to_process = temp_image_path
-                else:
-                    return {'status': 'FAILED', 'data': {}, 'meta': {'message': 'No se pudo rasterizar el PDF'}}
-
-            # Preprocesamiento
-            processed_path, perspective_fixed = ImagePreprocessor.enhance_document(file_to_process)
-            
-            if not processed_path:
-                 return {'status': 'FAILED', 'data': {}, 'meta': {'message': 'Fallo en preprocesamiento'}}
+                pages = PDFParser.iter_page_images(file_path, max_pages=settings.PDF_OCR_MAX_PAGES)
+            else:
+                image = ImageDecoder.decode(file_path)
+                if image is None:
+                    return {'status': 'FAILED', 'data': {}, 'meta': {'message': 'Fallo en preprocesamiento'}}
+
+                # Control de calidad: rechazar fotos inservibles antes del preprocesamiento y el OCR
+                if settings.QUALITY_GATE_ENABLED:
+                    quality = ImageQualityGate.assess(image, doc_type, ImageDecoder.read_dimensions(file_path))
+                    if not quality['ok']:
+                        return ImageQualityGate.rejection(quality)
+                pages = iter([image])
+                del image
 
-            # --- VALIDACIÓN QR (IMAGEN) ---
+            phash, duplicate = None, None
             qr_url_visual = None
-            if doc_type == 'PATENTE':
-                qr_url_visual = QREngine.scan_qr(processed_path)
+            page_layouts, ocr_passes = [], []
+            try:
+                for page_number, image in enumerate(pages):
+                    # Puntos de control de cancelación/deadline entre etapas (ver app.core.cancellation)
+                    checkpoint()
+                    # Resolución objetivo del modo (FAST): todo el pipeline trabaja sobre la imagen reducida
+                    if profile['max_side'] and max(image.shape[:2]) > profile['max_side']:
+                        scale = profile['max_side'] / max(image.shape[:2])
+                        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+                    # Preprocesamiento en memoria (sin intermedios en disco ni segunda decodificación)
+                    processed, perspective_fixed = ImagePreprocessor.enhance_image(image, denoise=profile['denoise'])
+                    del image
+
+                    if page_number == 0:
+                        # --- CASI-DUPLICADOS (pHash de la tarjeta normalizada, sólo para marcar) ---
+                        if settings.PHASH_INDEX_ENABLED:
+                            phash = ImagePreprocessor.perceptual_hash(processed)
+                            duplicate = NearDuplicateIndex.lookup(doc_type, phash)
+                            reused = self._reuse_duplicate(doc_type, duplicate, content_hash, mode)
+                            if reused:
+                                return reused
+
+                        # --- VALIDACIÓN QR (IMAGEN) ---
+                        if doc_type == 'PATENTE':
+                            qr_url_visual = QREngine.scan_qr(processed)
 
-            # OCR Texto
-            result = self.ocr.ocr(processed_path, cls=True)
-            if not result or not result[0]:
+                    # OCR Texto (cascada: pasada rápida y escalamiento sólo si hace falta)
+                    checkpoint()
+                    layout, ocr_pass = self._ocr_cascade(processed, doc_type, check_fields=page_number == 0,
+                                                         profile=profile)
+                    ocr_passes.append(ocr_pass)
+                    if layout:
+                        page_layouts.append((layout, processed.shape[0]))
+                    del processed
+
+                    # Corte temprano: no rasterizar ni leer páginas que el doc_type no necesita
+                    if is_pdf and self._pages_sufficient(doc_type, page_layouts):
+                        break
+            finally:
+                if is_pdf:
+                    pages.close()  # Libera el documento si hubo corte temprano
+
+            if not page_layouts:
                 return {'status': 'FAILED', 'data': {}, 'meta': {'message': 'OCR no detectó texto'}}
 
-            # Normalizar
-            elements = self._normalize_ocr_result(result[0])
-            full_text = " ".join([e['text'] for e in elements])
-            data = {}
-
-            # Parsing
-            if doc_type == 'DPI_FRONT' or doc_type == 'DPI_FRONT_REPRESENTANTE':
-                data = self._parse_dpi_front(elements, full_text)
-            elif doc_type == 'DPI_BACK' or doc_type == 'DPI_BACK_REPRESENTANTE':
-                spatial = self._parse_dpi_back_spatial(elements)
-                mrz = self._parse_dpi_back_mrz(full_text)
-                data = {**spatial, **mrz}
-                if not data.get('FECHA_VENCIMIENTO') and data.get('FECHA_VENCIMIENTO_MRZ'):
-                    data['FECHA_VENCIMIENTO'] = data['FECHA_VENCIMIENTO_MRZ']
-            elif doc_type == 'RTU':
-                data = self._parse_rtu_image(elements, full_text)
-            elif doc_type == 'PATENTE':
-                # En imágenes de patentes, el parsing nativo no funciona, pero tenemos el QR
-                # Podemos confiar en los datos del QR si el OCR falla en la estructura
-                pass
-            
-            # Integrar Validación Web en Imagen
-            if doc_type == 'PATENTE' and qr_url_visual:
-                data['QR_URL'] = qr_url_visual
-                # Si el OCR de texto falló, podemos usar los datos de la web como primarios
-                validacion = RegistryValidator.validate_patente(data, qr_url_visual) # data puede estar vacía
-                data['VALIDACION_OFICIAL'] = validacion
-                
-                # Si el OCR no leyó nada pero el QR funcionó, rellenamos con datos de la web
-                if validacion.get('ONLINE_CHECK') == 'SUCCESS' and not data.get('REGISTRO'):
-                    web_data = validacion.get('DATOS_OFICIALES_WEB', {})
-                    data['REGISTRO'] = web_data.get('REGISTRO')
-                    data['FOLIO'] = web_data.get('FOLIO')
-                    data['LIBRO'] = web_data.get('LIBRO')
-                    data['NOMBRE_EMPRESA'] = web_data.get('NOMBRE')
-
-            # Scoring
-            is_valid_mrz = data.get('MRZ_VALID', False)
-            has_qr_valid = data.get('VALIDACION_OFICIAL', {}).get('ONLINE_CHECK') == 'SUCCESS'
-            
-            found_fields = len([v for k, v in data.items() if v and 'MRZ' not in k])
-            score = min(100, found_fields * 25)
-            
-            if is_valid_mrz or has_qr_valid: 
-                score = max(score, 95)
-
-            return {
-                'status': 'SUCCESS' if score > 40 else 'UNREADABLE',
-                'data': data,
-                'meta': {
-                    'isValid': score > 40,
-                    'score': score,
-                    'method': 'AI_OCR_ENHANCED'
-                }
-            }
+            checkpoint()
+            result = self._interpret_visual(doc_type, page_layouts, qr_url_visual, is_pdf, ocr_passes,
+                                            profile['registry_online'])
+            self._store_capture(content_hash, doc_type, mode, {
+                'source': 'OCR', 'pages': LayoutStore.compact(page_layouts), 'qr_url': qr_url_visual,
+                'is_pdf': is_pdf, 'ocr_passes': ocr_passes,
+            })
+            if phash is not None:
+                self._register_capture(doc_type, phash, result, duplicate, content_hash, mode)
+            return result
+
+        except ImageTooLargeError as e:
+            logger.warning(f"Imagen rechazada por presupuesto de píxeles: {e}")
+            return {'status': 'FAILED', 'data': {}, 'meta': {'message': str(e)}}
 
         except Exception as e:
             logger.error(f"Error OCR Crítico: {e}", exc_info=True)
             return {'status': 'ERROR', 'meta': {'message': str(e)}, 'data': {}}
+
+    def reparse(self, capture: Dict[str, Any], doc_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Re-extracción sin OCR: vuelve a ejecutar parsers y scoring sobre una captura del LayoutStore.
+        La validación del Registro Mercantil usa sólo el índice local (sin consultas web).
+        """
+        doc_type = doc_type or capture['doc_type']
+        with collect_timings(doc_type) as timings:
+            if capture['source'] == 'NATIVE_PDF':
+                with stage('parse'):
+                    result = self._interpret_native(doc_type, capture, online=False)
+                if result is None:
+                    result = {'status': 'UNREADABLE', 'data': {},
+                              'meta': {'isValid': False, 'score': 0, 'method': 'NATIVE_PDF_VALIDATED',
+                                       'message': 'El parser nativo no encontró datos clave'}}
+            else:
+                result = self._interpret_visual(doc_type, LayoutStore.expand(capture['pages']), capture.get('qr_url'),
+                                                capture.get('is_pdf', False), capture.get('ocr_passes') or ['full'],
+                                                online=False)
+
+        result['meta'].update({'timings_ms': timings.as_dict(), 'mode': capture.get('mode'), 'reparsed': True,
+                               'capturedAt': capture.get('stored_at')})
+        return result
+
+    def _interpret_native(self, doc_type: str, capture: Dict[str, Any], online: bool) -> Optional[Dict[str, Any]]:
+        """Parsers de texto nativo + validación oficial + scoring. None si no hay datos clave (se intenta OCR)."""
+        text_content = capture['text']
+        data = {}
+        if doc_type == 'RTU':
+            data = PDFParser.parse_rtu(text_content)
+        elif doc_type == 'PATENTE':
+            data = PDFParser.parse_patente(text_content)
+
+            # --- VALIDACION OFICIAL ---
+            qr_url = capture.get('qr_url')
+            if qr_url:
+                data['QR_URL'] = qr_url
+                data['VALIDACION_OFICIAL'] = RegistryValidator.validate_patente(data, qr_url, online=online)
+
+        # Validar integridad mínima
+        has_key_data = (
+            data.get('NIT') or 
+            data.get('NOMBRE_COMPLETO') or 
+            data.get('RAZON_SOCIAL') or 
+            data.get('REGISTRO')
+        )
+        if not (data and has_key_data):
+            return None
+
+        # Si la validación oficial dice que coincide, score 100
+        score = 100
+        if doc_type == 'PATENTE':
+            val_info = data.get('VALIDACION_OFICIAL', {})
+            if val_info.get('COINCIDENCIA_TOTAL') is False:
+                score = 60 # Penalizar si el QR dice una cosa y el PDF otra
+
+        return {
+            'status': 'SUCCESS', 
+            'data': data, 
+            'meta': {
+                'isValid': True, 
+                'score': score, 
+                'method': 'NATIVE_PDF_VALIDATED'
+            }
+        }
+
+    def _interpret_visual(self, doc_type: str, page_layouts, qr_url: Optional[str], is_pdf: bool,
+                          ocr_passes: List[str], online: bool) -> Dict[str, Any]:
+        """Parsers espaciales sobre el layout OCR + validación oficial + scoring."""
+        # Normalizar + Parsing (las páginas se fusionan en un único layout antes de parsear)
+        with stage('parse'):
+            elements, full_text, layout_text = self._merge_pages(page_layouts)
+            data = self._parse_elements(doc_type, elements, full_text, layout_text if is_pdf else None)
+
+        # Integrar Validación Web en Imagen
+        if doc_type == 'PATENTE' and qr_url:
+            data['QR_URL'] = qr_url
+            # Si el OCR de texto falló, podemos usar los datos de la web como primarios
+            validacion = RegistryValidator.validate_patente(data, qr_url, online=online) # data puede estar vacía
+            data['VALIDACION_OFICIAL'] = validacion
             
-        finally:
-            if processed_path and processed_path != file_path and os.path.exists(processed_path):
-                try: os.remove(processed_path)
-                except: pass
-            if temp_image_path and os.path.exists(temp_image_path):
-                try: os.remove(temp_image_path)
-                except: pass
+            # Si el OCR no leyó nada pero el QR funcionó, rellenamos con datos de la web
+            if validacion.get('ONLINE_CHECK') == 'SUCCESS' and not data.get('REGISTRO'):
+                web_data = validacion.get('DATOS_OFICIALES_WEB', {})
+                data['REGISTRO'] = web_data.get('REGISTRO')
+                data['FOLIO'] = web_data.get('FOLIO')
+                data['LIBRO'] = web_data.get('LIBRO')
+                data['NOMBRE_EMPRESA'] = web_data.get('NOMBRE')
+
+        # Scoring (INDEX_UNVERIFIED no cuenta: el registro se encontró con las claves del propio PDF, no por el QR)
+        is_valid_mrz = data.get('MRZ_VALID', False)
+        has_qr_valid = data.get('VALIDACION_OFICIAL', {}).get('ONLINE_CHECK') == 'SUCCESS'
+        
+        found_fields = len([v for k, v in data.items() if v and 'MRZ' not in k
+                            and k not in self.SCORE_EXCLUDED_FIELDS and not k.startswith('PAGINAS_')])
+        score = min(100, found_fields * 25)
+        
+        if is_valid_mrz or has_qr_valid: 
+            score = max(score, 95)
+
+        confidences = [e['confidence'] for e in elements]
+        meta = {
+            'isValid': score > 40,
+            'score': score,
+            'method': 'AI_OCR_ENHANCED',
+            'ocr': {
+                'pass': max(ocr_passes, key=self.OCR_PASSES.index),
+                'pages': ocr_passes,
+                'meanConfidence': round(sum(confidences) / len(confidences), 4) if confidences else 0.0,
+                'lowConfidence': sum(1 for c in confidences if c < settings.OCR_CASCADE_MIN_CONFIDENCE),
+            },
+        }
+        if is_pdf:
+            meta['pagesProcessed'] = len(page_layouts)
+        return {
+            'status': 'SUCCESS' if score > 40 else 'UNREADABLE',
+            'data': data,
+            'meta': meta,
+        }
+
+    @staticmethod
+    def _store_capture(content_hash: Optional[str], doc_type: str, mode: str, capture: Dict[str, Any]) -> None:
+        """Persiste la captura cruda (texto nativo o layout OCR) para reparseDocument."""
+        if content_hash:
+            with stage('layout_store'):
+                layout_store.put(content_hash, {**capture, 'doc_type': doc_type, 'mode': mode})
+
+    def _count_identity(self, doc_type: str, result: Dict[str, Any]) -> Optional[int]:
+        """Capturas del mismo titular (IDENTITY_FIELDS) en la ventana del índice; None si no se extrajo."""
+        identity = (result.get('data') or {}).get(self.IDENTITY_FIELDS.get(doc_type, ''))
+        if result.get('status') != 'SUCCESS' or not identity:
+            return None
+        return NearDuplicateIndex.count_identity(doc_type, str(identity))
+
+    @staticmethod
+    def _near_duplicate_meta(duplicate: Dict[str, Any], seen: Optional[int]) -> Dict[str, Any]:
+        return {
+            'hash': duplicate['hash'],
+            'distance': duplicate['distance'],
+            'seen': seen,
+            'firstSeen': duplicate['first_seen'],
+            # Muchas capturas parecidas del mismo titular: posible reutilización de identidad
+            'fraudReview': seen is not None and seen >= settings.PHASH_REVIEW_THRESHOLD,
+        }
+
+    def _reuse_duplicate(self, doc_type: str, duplicate: Optional[Dict[str, Any]], content_hash: Optional[str],
+                         mode: str = 'BALANCED') -> Optional[Dict[str, Any]]:
+        """
+        Si el mismo archivo (sha256 exacto) ya se extrajo con éxito, reutiliza ese resultado sin OCR.
+        Un pHash cercano no basta: tarjetas distintas con la misma plantilla tienen pHash casi iguales.
+        Un resultado de un modo menos preciso no se reutiliza para un modo más exigente.
+        """
+        if not content_hash:
+            return None
+        previous = NearDuplicateIndex.exact(doc_type, content_hash)
+        if not previous or previous.get('status') != 'SUCCESS':
+            return None
+        modes = list(self.MODE_PROFILES)
+        if modes.index(previous.get('meta', {}).get('mode', 'BALANCED')) < modes.index(mode):
+            return None
+
+        NEAR_DUPLICATES_TOTAL.labels(doc_type, 'REUSED').inc()
+        meta = {**previous.get('meta', {}), 'method': 'DUPLICATE_REUSE'}
+        seen = self._count_identity(doc_type, previous)
+        if duplicate:
+            meta['nearDuplicate'] = self._near_duplicate_meta(duplicate, seen)
+        return {'status': previous['status'], 'data': previous.get('data', {}), 'meta': meta}
+
+    def _register_capture(self, doc_type: str, phash: int, result: Dict[str, Any],
+                          duplicate: Optional[Dict[str, Any]], content_hash: Optional[str],
+                          mode: str = 'BALANCED') -> None:
+        """Guarda la captura en el índice y marca el resultado si repite una anterior del mismo titular."""
+        seen = self._count_identity(doc_type, result)
+        if duplicate:
+            near = self._near_duplicate_meta(duplicate, seen)
+            result['meta']['nearDuplicate'] = near
+            NEAR_DUPLICATES_TOTAL.labels(doc_type, 'FLAGGED' if near['fraudReview'] else 'MATCHED').inc()
+
+        reusable = None
+        if result['status'] == 'SUCCESS':
+            reusable = {
+                'status': result['status'],
+                'data': result['data'],
+                'meta': {**{k: result['meta'][k] for k in ('isValid', 'score', 'method')}, 'mode': mode},
+            }
+        NearDuplicateIndex.add(doc_type, phash, content_hash, reusable)
+
+    def _ocr_cascade(self, image, doc_type: str, check_fields: bool = True,
+                     profile: Optional[Dict[str, Any]] = None) -> Tuple[list, str]:
+        """
+        OCR de una página en cascada. Retorna (layout en formato PaddleOCR, pasada usada):
+        - 'fast':    la pasada rápida (imagen reducida, detector con menor límite) fue suficiente.
+        - 'refined': sólo se releyeron a resolución completa las regiones con baja confianza.
+        - 'full':    faltaban campos requeridos (o demasiadas regiones dudosas): página completa.
+        El perfil del modo decide si hay escalamiento (FAST no escala) o si se usa el predictor preciso (ACCURATE).
+        """
+        profile = profile or self.MODE_PROFILES['BALANCED']
+        cls = profile['angle_cls']
+        if profile['ocr'] == 'accurate':
+            predictor = self._accurate_predictor()
+            with stage('ocr'):
+                layout = self._ocr_page(predictor, image, cls, doc_type, settings.OCR_ACCURATE_DET_LIMIT_SIDE_LEN)
+            if any(line[1][1] < settings.OCR_CASCADE_MIN_CONFIDENCE for line in layout):
+                checkpoint()
+                with stage('ocr_refine'):
+                    layout = self._refine_regions(image, layout, predictor)
+            return layout, 'full'
+
+        if self.fast_ocr is None:
+            with stage('ocr'):
+                return self._ocr_page(self.ocr, image, cls, doc_type), 'full'
+
+        scale = min(1.0, settings.OCR_FAST_MAX_SIDE / max(image.shape[:2]))
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+        with stage('ocr_fast'):
+            result = self.fast_ocr.ocr(small, cls=cls)
+        del small
+        # Coordenadas de vuelta a la resolución completa
+        layout = [
+            [[[x / scale, y / scale] for x, y in coords], rec]
+            for coords, rec in ((result[0] if result else None) or [])
+        ]
+
+        if profile['ocr'] == 'fast':
+            # FAST: respuesta aproximada, sin escalamiento
+            return layout, 'fast'
+
+        decision = self._escalation(doc_type, layout, check_fields)
+        if decision:
+            checkpoint()
+        if decision == 'full':
+            with stage('ocr'):
+                return self._ocr_page(self.ocr, image, cls, doc_type), 'full'
+        if decision == 'refined':
+            with stage('ocr_refine'):
+                layout = self._refine_regions(image, layout)
+        return layout, decision or 'fast'
+
+    @staticmethod
+    def _ocr_page(predictor, image, cls: bool, doc_type: str,
+                  det_limit: Optional[int] = None) -> list:
+        """
+        OCR de página completa; las páginas grandes de RTU/PATENTE se procesan por mosaicos (ver PageTiler).
+        det_limit: límite del detector del predictor, que fija el tamaño de los mosaicos.
+        """
+        if PageTiler.should_tile(image, doc_type):
+            return PageTiler.ocr(predictor, image, cls, det_limit or settings.OCR_DET_LIMIT_SIDE_LEN)
+        result = predictor.ocr(image, cls=cls)
+        return (result[0] if result else None) or []
+
+    def _escalation(self, doc_type: str, layout, check_fields: bool) -> Optional[str]:
+        """Decide si la pasada rápida alcanza ('fast' -> None), o si se refinan regiones o la página."""
+        if not layout:
+            return 'full'
+        if check_fields:
+            elements = self._normalize_ocr_result(layout)
+            data = self._parse_elements(doc_type, elements, " ".join(e['text'] for e in elements))
+            if not all(data.get(field) for field in self.CASCADE_REQUIRED_FIELDS.get(doc_type, ())):
+                return 'full'
+
+        low = [line for line in layout if line[1][1] < settings.OCR_CASCADE_MIN_CONFIDENCE]
+        if not low:
+            return None
+        return 'refined' if len(low) <= settings.OCR_CASCADE_MAX_REGIONS else 'full'
+
+    def _refine_regions(self, image, layout, predictor=None) -> list:
+        """
+        Relee sólo el reconocedor (sin detector) sobre los recortes de baja confianza a resolución completa.
+        Todos los recortes van en una sola llamada: el reconocedor los agrupa en lotes de OCR_REC_BATCH_NUM.
+        """
+        predictor = predictor or self.ocr
+        height, width = image.shape[:2]
+        crops, indexes = [], []
+        for index, (coords, (text, confidence)) in enumerate(layout):
+            if confidence < settings.OCR_CASCADE_MIN_CONFIDENCE:
+                xs, ys = [p[0] for p in coords], [p[1] for p in coords]
+                pad = 4
+                x0, x1 = max(int(min(xs)) - pad, 0), min(int(max(xs)) + pad, width)
+                y0, y1 = max(int(min(ys)) - pad, 0), min(int(max(ys)) + pad, height)
+                if x1 > x0 and y1 > y0:
+                    crop = image[y0:y1, x0:x1]
+                    # Con una lista PaddleOCR no convierte gris a BGR como con una imagen suelta
+                    crops.append(cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR) if crop.ndim == 2 else crop)
+                    indexes.append(index)
+
+        refined = [[coords, rec] for coords, rec in layout]
+        if not crops:
+            return refined
+        result = predictor.ocr(crops, det=False, cls=False)
+        for index, (new_text, new_confidence) in zip(indexes, (result[0] if result else None) or []):
+            if new_confidence > refined[index][1][1]:
+                refined[index][1] = (new_text, new_confidence)
+        return refined
+
+    def _merge_pages(self, page_layouts) -> Tuple[List[Dict[str, Any]], str, str]:
+        """
+        Fusiona el resultado OCR de varias páginas en un solo layout: las coordenadas Y de cada página
+        se desplazan por la altura acumulada para que los parsers espaciales vean un documento continuo.
+        Retorna (elementos, texto plano en mayúsculas, texto por líneas con el caso original).
+        """
+        elements, lines, offset = [], [], 0
+        for page_number, (layout, height) in enumerate(page_layouts):
+            for el in self._normalize_ocr_result(layout):
+                el['y_min'] += offset
+                el['y_max'] += offset
+                el['page'] = page_number
+                elements.append(el)
+            lines += [line[1][0] for line in sorted(layout, key=lambda l: min(p[1] for p in l[0]))]
+            offset += height
+        full_text = " ".join(e['text'] for e in elements)
+        return elements, full_text, "\n".join(lines)
+
+    def _pages_sufficient(self, doc_type: str, page_layouts) -> bool:
+        """Política de corte temprano para PDFs escaneados (ver PAGE_POLICIES)."""
+        if not page_layouts:
+            return False
+        policy = self.PAGE_POLICIES.get(doc_type, {})
+        elements, full_text, layout_text = self._merge_pages(page_layouts)
+        marker = policy.get('end_marker')
+        if marker and not re.search(marker, full_text):
+            return False
+        required = policy.get('required', ())
+        if not required:
+            return True
+        data = self._parse_elements(doc_type, elements, full_text, layout_text)
+        return all(data.get(field) for field in required)
+
+    def _parse_elements(self, doc_type: str, elements, full_text: str,
+                        layout_text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Aplica el parser espacial correspondiente al tipo de documento.
+        layout_text (PDFs escaneados): texto por líneas para completar con el parser de texto del RTU
+        las secciones largas (establecimientos, impuestos) que el parser espacial no cubre.
+        """
+        data = {}
+        if doc_type == 'DPI_FRONT' or doc_type == 'DPI_FRONT_REPRESENTANTE':
+            data = self._parse_dpi_front(elements, full_text)
+        elif doc_type == 'DPI_BACK' or doc_type == 'DPI_BACK_REPRESENTANTE':
+            spatial = self._parse_dpi_back_spatial(elements)
+            mrz = self._parse_dpi_back_mrz(full_text)
+            data = {**spatial, **mrz}
+            if not data.get('FECHA_VENCIMIENTO') and data.get('FECHA_VENCIMIENTO_MRZ'):
+                data['FECHA_VENCIMIENTO'] = data['FECHA_VENCIMIENTO_MRZ']
+        elif doc_type == 'RTU':
+            data = self._parse_rtu_image(elements, full_text)
+            if layout_text:
+                text_data = PDFParser.parse_rtu(layout_text)
+                text_data.pop('METODO', None)
+                for key, value in text_data.items():
+                    if value and not data.get(key):
+                        data[key] = value
+        elif doc_type == 'PATENTE':
+            # En imágenes de patentes, el parsing nativo no funciona, pero tenemos el QR
+            # Podemos confiar en los datos del QR si el OCR falla en la estructura
+            pass
+        return data
+
+    def _accurate_predictor(self) -> PredictorPool:
+        """
+        Predictor del modo ACCURATE (OCR_ACCURATE_*). Con el mismo reconocedor y clasificador que el predictor
+        principal se reutiliza self.ocr con el límite del detector de ACCURATE; si no, se carga una sola vez,
+        con la primera tarea ACCURATE.
+        """
+        if not settings.OCR_ACCURATE_REC_MODEL_DIR and settings.OCR_USE_ANGLE_CLS:
+            if settings.OCR_ACCURATE_DET_LIMIT_SIDE_LEN == settings.OCR_DET_LIMIT_SIDE_LEN:
+                return self.ocr
+            return self.ocr.with_det_limit(settings.OCR_ACCURATE_DET_LIMIT_SIDE_LEN)
+        if self.accurate_ocr is None:
+            with self._accurate_lock:
+                if self.accurate_ocr is None:
+                    from paddleocr import PaddleOCR
+                    self.accurate_ocr = PredictorPool(PaddleOCR(**self._build_inference_kwargs('accurate')),
+                                                      settings.OCR_PREDICTOR_POOL_SIZE)
+        return self.accurate_ocr
+
+    # --- CONFIGURACIÓN DE INFERENCIA ---
+    @staticmethod
+    def _build_inference_kwargs(variant: str = 'full') -> Dict[str, Any]:
+        """
+        Traduce la configuración de inferencia (settings.OCR_*) a los argumentos de PaddleOCR.
+        Permite ajustar backend, hilos, límite del detector y batch de reconocimiento por nodo.
+        variant: 'full' (predictor principal), 'fast' (pasada rápida de la cascada, OCR_FAST_*)
+        o 'accurate' (modo ACCURATE, OCR_ACCURATE_*: detector con mayor límite y clasificador de orientación).
+        """
+        backend = settings.OCR_BACKEND
+        if backend not in OCREngine.SUPPORTED_BACKENDS:
+            raise ValueError(
+                f"OCR_BACKEND inválido: '{backend}'. Opciones: {', '.join(OCREngine.SUPPORTED_BACKENDS)}"
+            )
+        if backend == 'onnx' and importlib.util.find_spec('onnxruntime') is None:
+            raise RuntimeError("OCR_BACKEND=onnx requiere onnxruntime (pip install -r requirements.txt)")
+
+        kwargs = {
+            'use_angle_cls': settings.OCR_USE_ANGLE_CLS,
+            'lang': 'es',
+            'show_log': False,
+            'use_onnx': backend == 'onnx',
+            'enable_mkldnn': backend == 'paddle_mkldnn',
+            'cpu_threads': settings.OCR_CPU_THREADS,
+            'det_limit_side_len': settings.OCR_DET_LIMIT_SIDE_LEN,
+            'det_limit_type': settings.OCR_DET_LIMIT_TYPE,
+            'rec_batch_num': settings.OCR_REC_BATCH_NUM,
+        }
+
+        rec_dir = settings.OCR_REC_MODEL_DIR
+        if variant == 'fast':
+            kwargs['det_limit_side_len'] = settings.OCR_FAST_DET_LIMIT_SIDE_LEN
+            rec_dir = settings.OCR_FAST_REC_MODEL_DIR or rec_dir
+        elif variant == 'accurate':
+            kwargs['det_limit_side_len'] = settings.OCR_ACCURATE_DET_LIMIT_SIDE_LEN
+            kwargs['use_angle_cls'] = True
+            rec_dir = settings.OCR_ACCURATE_REC_MODEL_DIR or rec_dir
+
+        components = [('det', settings.OCR_DET_MODEL_DIR), ('rec', rec_dir)]
+        if kwargs['use_angle_cls']:
+            components.append(('cls', settings.OCR_CLS_MODEL_DIR))
+
+        for component, explicit_dir in components:
+            model_dir = OCREngine._resolve_model_dir(component, explicit_dir)
+            if model_dir:
+                kwargs[f'{component}_model_dir'] = model_dir
+            elif backend == 'onnx':
+                # ONNX Runtime no descarga modelos: deben existir los .onnx exportados
+                raise FileNotFoundError(
+                    f"Backend ONNX requiere el modelo '{component}' exportado en {settings.OCR_MODELS_DIR} "
+                    f"(python -m app.services.model_export)"
+                )
+
+        if settings.OCR_QUANTIZED and backend == 'paddle':
+            logger.warning("Modelos INT8 sin MKL-DNN: usar OCR_BACKEND=paddle_mkldnn para aprovechar los kernels cuantizados.")
+
+        logger.info(
+            f"Inferencia OCR{'' if variant == 'full' else f' ({variant})'}: backend={backend}, threads={settings.OCR_CPU_THREADS}, "
+            f"det_limit={kwargs['det_limit_side_len']}, rec_batch={settings.OCR_REC_BATCH_NUM}, "
+            f"int8={settings.OCR_QUANTIZED}"
+        )
+        return kwargs
+
+    @staticmethod
+    def _resolve_model_dir(component: str, explicit_dir: str | None) -> str | None:
+        """
+        Prioridad: ruta explícita > modelos en OCR_MODELS_DIR (onnx/int8) > modelo DPI entrenado (rec).
+        Estructura esperada: <OCR_MODELS_DIR>/<paddle|onnx>_<fp32|int8>/<det|rec|cls>[.onnx]
+        """
+        if explicit_dir:
+            return explicit_dir
+
+        is_onnx = settings.OCR_BACKEND == 'onnx'
+        if is_onnx or settings.OCR_QUANTIZED:
+            variant = f"{'onnx' if is_onnx else 'paddle'}_{'int8' if settings.OCR_QUANTIZED else 'fp32'}"
+            candidate = os.path.join(settings.OCR_MODELS_DIR, variant, f"{component}.onnx" if is_onnx else component)
+            if os.path.exists(candidate):
+                return candidate
+            if settings.OCR_QUANTIZED and not is_onnx:
+                logger.warning(f"Modelo INT8 '{component}' no encontrado en {candidate}. Se usa el modelo por defecto.")
+
+        # Cargar modelo personalizado si existe, sino usar default
+        if component == 'rec' and not is_onnx:
+            custom_rec_dir = './training/output/final_dpi_model'
+            if os.path.exists(custom_rec_dir):
+                return custom_rec_dir
+
+        return None
 
     # --- MÉTODOS PRIVADOS SIN CAMBIOS ---
     def _parse_dpi_front(self, elements, full_text):
@@ -257,8 +772,8 @@ class OCREngine:
         data['NOMBRE_SEGUNDO'] = self._find_key_value(elements, "SEGUNDO NOMBRE")
         data['APELLIDO_PRIMERO'] = self._find_key_value(elements, "PRIMER APELLIDO")
         data['APELLIDO_SEGUNDO'] = self._find_key_value(elements, "SEGUNDO APELLIDO")
-        nom = f"{data.get('NOMBRE_PRIMERO','')} {data.get('NOMBRE_SEGUNDO','')}".strip()
-        ape = f"{data.get('APELLIDO_PRIMERO','')} {data.get('APELLIDO_SEGUNDO','')}".strip()
+        nom = f"{data.get('NOMBRE_PRIMERO') or ''} {data.get('NOMBRE_SEGUNDO') or ''}".strip()
+        ape = f"{data.get('APELLIDO_PRIMERO') or ''} {data.get('APELLIDO_SEGUNDO') or ''}".strip()
         data['NOMBRE_COMPLETO'] = f"{nom} {ape}".strip()
         data['CUI'] = self._find_key_value(elements, "CODIGO UNICO DE IDENTIFICACION")
         data['FECHA_NAC'] = self._find_key_value(elements, "FECHA DE NACIMIENTO")
@@ -310,7 +825,8 @@ class OCREngine:
     def _normalize_ocr_result(self, res):
         els = []
         for line in res:
-            coords, (text, _) = line[0], line[1]
+            coords, (text, confidence) = line[0], line[1]
             xs, ys = [p[0] for p in coords], [p[1] for p in coords]
-            els.append({'text': text.upper(), 'x_min': min(xs), 'x_max': max(xs), 'y_min': min(ys), 'y_max': max(ys)})
+            els.append({'text': text.upper(), 'confidence': float(confidence),
+                        'x_min': min(xs), 'x_max': max(xs), 'y_min': min(ys), 'y_max': max(ys)})
         return sorted(els, key=lambda x: x['y_min'])
\ No newline at end of file
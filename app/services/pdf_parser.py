@@ -1,9 +1,11 @@
 import fitz  # PyMuPDF
 import re
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import numpy as np
 
+from app.core.metrics import timed_stage, stage
+
 logger = logging.getLogger(__name__)
 
 class PDFParser:
@@ -13,6 +15,7 @@ class PDFParser:
     """
 
     @staticmethod
+    @timed_stage("pdf_text")
     def extract_text_content(file_path: str) -> str:
         """Extrae el texto crudo preservando el orden visual (layout)."""
         text_content = ""
@@ -27,6 +30,7 @@ class PDFParser:
             return ""
 
     @staticmethod
+    @timed_stage("pdf_rasterize")
     def get_page_image(file_path: str, page_number: int = 0) -> Optional[np.ndarray]:
         """
         Renderiza una página específica del PDF como una imagen (numpy array BGR).
@@ -36,29 +40,55 @@ class PDFParser:
             with fitz.open(file_path) as doc:
                 if page_number >= len(doc):
                     return None
-                
-                page = doc.load_page(page_number)
-                # Zoom x2 para asegurar que QRs pequeños tengan suficiente resolución
-                mat = fitz.Matrix(2, 2)
-                pix = page.get_pixmap(matrix=mat)
-                
-                # Convertir buffer de bytes a array numpy
-                img_data = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-                
-                # Ajustar espacio de color a BGR (formato estándar OpenCV)
-                import cv2
-                if pix.n == 4: # RGBA
-                    return cv2.cvtColor(img_data, cv2.COLOR_RGBA2BGR)
-                elif pix.n == 3: # RGB
-                    return cv2.cvtColor(img_data, cv2.COLOR_RGB2BGR)
-                
-                return img_data
+                return PDFParser._render_page(doc.load_page(page_number))
 
         except Exception as e:
             logger.error(f"Error renderizando página de PDF: {e}")
             return None
 
     @staticmethod
+    def iter_page_images(file_path: str, max_pages: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Rasteriza las páginas bajo demanda (una a la vez, con el documento abierto una sola vez).
+        Quien consume puede cortar antes: las páginas restantes nunca se renderizan ni ocupan memoria.
+        """
+        try:
+            doc = fitz.open(file_path)
+        except Exception as e:
+            logger.error(f"Error abriendo PDF: {e}")
+            return
+
+        with doc:
+            total = len(doc) if max_pages is None else min(len(doc), max_pages)
+            for page_number in range(total):
+                try:
+                    with stage("pdf_rasterize"):
+                        image = PDFParser._render_page(doc.load_page(page_number))
+                except Exception as e:
+                    logger.error(f"Error renderizando página {page_number} de PDF: {e}")
+                    continue
+                yield image
+
+    @staticmethod
+    def _render_page(page) -> np.ndarray:
+        # Zoom x2 para asegurar que QRs pequeños tengan suficiente resolución
+        mat = fitz.Matrix(2, 2)
+        pix = page.get_pixmap(matrix=mat)
+        
+        # Convertir buffer de bytes a array numpy
+        img_data = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+        
+        # Ajustar espacio de color a BGR (formato estándar OpenCV)
+        import cv2
+        if pix.n == 4: # RGBA
+            return cv2.cvtColor(img_data, cv2.COLOR_RGBA2BGR)
+        elif pix.n == 3: # RGB
+            return cv2.cvtColor(img_data, cv2.COLOR_RGB2BGR)
+        
+        return img_data
+
+    @staticmethod
+    @timed_stage("pdf_parse")
     def parse_rtu(text: str) -> Dict[str, Any]:
         """
         Parsea RTUs de SAT (Soporta estructura de Pequeño Contribuyente y Sociedades).
@@ -304,6 +334,7 @@ class PDFParser:
         return None
 
     @staticmethod
+    @timed_stage("pdf_parse")
     def parse_patente(text: str) -> Dict[str, Any]:
         """Parsea Patentes de Comercio (Empresa y Sociedad)."""
         data = {
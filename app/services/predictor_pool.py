@@ -0,0 +1,86 @@
+import copy
+import queue
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PredictorPool:
+    """
+    Pool de N predictores PaddleOCR dentro de un mismo proceso, con una sola copia de los pesos.
+    - Paddle Inference: cada clon usa `predictor.clone()`, que comparte los parámetros y sólo
+      duplica el scope de ejecución (activaciones).
+    - ONNX Runtime: la InferenceSession es segura para llamadas concurrentes y se comparte tal cual.
+    Ambos runtimes liberan el GIL durante la inferencia: con el pool `threads` de Celery y
+    OCR_PREDICTOR_POOL_SIZE=N un solo proceso aprovecha N núcleos sin N copias del modelo.
+    `with_det_limit` da una vista del mismo pool con otro límite del detector (pasada rápida de la cascada,
+    modo ACCURATE) sin cargar otro modelo: el límite es sólo el redimensionamiento previo a la detección.
+    """
+
+    # Componentes de TextSystem (PaddleOCR 2.x) que mantienen un predictor propio
+    COMPONENTS = ('text_detector', 'text_recognizer', 'text_classifier')
+
+    def __init__(self, base: Any, size: int = 1):
+        self.size = max(1, size)
+        self.det_limit_side_len = None
+        self._available: "queue.Queue[Any]" = queue.Queue()
+        self._available.put(base)
+        for _ in range(self.size - 1):
+            self._available.put(self.clone(base))
+        if self.size > 1:
+            logger.info(f"PredictorPool: {self.size} predictores con pesos compartidos")
+
+    @staticmethod
+    def clone(ocr: Any) -> Any:
+        """Copia superficial del PaddleOCR con predictores propios (mismos pesos)."""
+        cloned = copy.copy(ocr)
+        for name in PredictorPool.COMPONENTS:
+            component = getattr(ocr, name, None)
+            if component is None:
+                continue
+            component = copy.copy(component)
+            if settings.OCR_BACKEND != 'onnx':
+                predictor = component.predictor.clone()
+                component.predictor = predictor
+                component.input_tensor = predictor.get_input_handle(predictor.get_input_names()[0])
+                component.output_tensors = [predictor.get_output_handle(n) for n in predictor.get_output_names()]
+            setattr(cloned, name, component)
+        return cloned
+
+    def with_det_limit(self, det_limit_side_len: int) -> "PredictorPool":
+        """Vista del pool (mismos predictores y cola) cuyo detector redimensiona a `det_limit_side_len`."""
+        view = copy.copy(self)
+        view.det_limit_side_len = det_limit_side_len
+        return view
+
+    @staticmethod
+    def _detector_view(ocr: Any, det_limit_side_len: int) -> Any:
+        """Copia superficial del PaddleOCR con el mismo predictor de detección y otro límite de redimensionamiento."""
+        if getattr(ocr, 'text_detector', None) is None:
+            return ocr
+        view = copy.copy(ocr)
+        detector = copy.copy(ocr.text_detector)
+        detector.preprocess_op = [copy.copy(op) for op in detector.preprocess_op]
+        for op in detector.preprocess_op:
+            if hasattr(op, 'limit_side_len'):  # DetResizeForTest
+                op.limit_side_len = det_limit_side_len
+        view.text_detector = detector
+        return view
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Toma un predictor libre (bloquea si todos están en uso) y lo devuelve al salir."""
+        ocr = self._available.get()
+        try:
+            # El predictor queda tomado en exclusiva: la vista con otro límite comparte sus predictores sin riesgo
+            yield self._detector_view(ocr, self.det_limit_side_len) if self.det_limit_side_len else ocr
+        finally:
+            self._available.put(ocr)
+
+    def ocr(self, *args, **kwargs):
+        """Atajo con la misma firma que PaddleOCR.ocr."""
+        with self.acquire() as ocr:
+            return ocr.ocr(*args, **kwargs)
@@ -4,6 +4,9 @@ from pyzbar.pyzbar import decode
 import logging
 from PIL import Image
 
+from app.core.metrics import timed_stage
+from app.services.image_decoder import ImageDecoder
+
 logger = logging.getLogger(__name__)
 
 class QREngine:
@@ -13,11 +16,12 @@ class QREngine:
     """
 
     @staticmethod
+    @timed_stage("qr_decode")
     def scan_qr(image_input) -> str | None:
         """
         Escanea una imagen en busca de un QR.
         Args:
-            image_input: Puede ser un path (str), un numpy array (cv2) o una imagen PIL.
+            image_input: Puede ser un path (str), un numpy array (cv2, BGR o gris) o una imagen PIL.
         Returns:
             str: URL o contenido del QR decodificado, o None si no encuentra nada.
         """
@@ -25,7 +29,7 @@ class QREngine:
             # 1. Normalización de entrada a Numpy Array
             image = None
             if isinstance(image_input, str):
-                image = cv2.imread(image_input)
+                image = ImageDecoder.decode(image_input, grayscale=True)
             elif isinstance(image_input, Image.Image):
                 image = cv2.cvtColor(np.array(image_input), cv2.COLOR_RGB2BGR)
             elif isinstance(image_input, np.ndarray):
@@ -37,7 +41,7 @@ class QREngine:
 
             # 2. Preprocesamiento
             # Convertir a escala de grises mejora drásticamente la detección
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
             # 3. Estrategia A: Pyzbar (Más robusto para documentos)
             decoded_objects = decode(gray)
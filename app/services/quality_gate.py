@@ -0,0 +1,140 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import imutils
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import timed_stage
+from app.services.image_decoder import ImageDecoder
+
+logger = logging.getLogger(__name__)
+
+class ImageQualityGate:
+    """
+    Control de calidad en milisegundos antes del OCR (sobre una versión reducida de la imagen):
+    - Nitidez: varianza del Laplaciano sobre la tarjeta detectada, dividida por la varianza de intensidad de la
+      tarjeta. Ambas escalan con el contraste al cuadrado: una captura enfocada de bajo contraste (papel gastado,
+      luz pareja) no se confunde con una desenfocada.
+    - Exposición: brillo medio (muy oscura / sobreexpuesta).
+    - Reflejos: fracción de píxeles saturados sobre la tarjeta (sólo DPI, el papel blanco satura legítimamente).
+    - Resolución efectiva: lado mayor de la tarjeta en píxeles de la captura original.
+    Las fotos que fallan se rechazan con motivos accionables para que el usuario repita la captura.
+    """
+
+    # Lado mayor de la imagen de análisis: las métricas son comparables entre capturas de distinto tamaño
+    ANALYSIS_SIDE = 800
+    # Píxeles a decodificar cuando se evalúa desde disco (la decodificación reducida de JPEG es casi gratis)
+    ANALYSIS_PIXELS = 1_000_000
+    CARD_TYPES = ('DPI_FRONT', 'DPI_BACK', 'DPI_FRONT_REPRESENTANTE', 'DPI_BACK_REPRESENTANTE')
+
+    MESSAGES = {
+        'BLURRY': "La foto está desenfocada. Sostenga el teléfono firme y enfoque el documento.",
+        'TOO_DARK': "La foto está muy oscura. Busque un lugar con más luz.",
+        'OVEREXPOSED': "La foto está sobreexpuesta. Evite luz directa sobre el documento.",
+        'GLARE': "Hay reflejos sobre el documento. Incline el documento o apague el flash.",
+        'LOW_RESOLUTION': "El documento se ve muy pequeño. Acerque la cámara para que ocupe toda la foto.",
+    }
+
+    @staticmethod
+    def _find_card(gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Rectángulo (x, y, w, h) del contorno de 4 lados más grande, si ocupa al menos 15% de la imagen."""
+        edged = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 75, 200)
+        cnts = imutils.grab_contours(cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE))
+        min_area = 0.15 * gray.shape[0] * gray.shape[1]
+        for c in sorted(cnts, key=cv2.contourArea, reverse=True)[:5]:
+            approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+            if len(approx) == 4 and cv2.contourArea(approx) >= min_area:
+                return cv2.boundingRect(approx)
+        return None
+
+    @staticmethod
+    @timed_stage("quality_gate")
+    def assess(image: np.ndarray, doc_type: Optional[str] = None,
+               original_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """
+        image: BGR o escala de grises (cualquier tamaño). original_size: (ancho, alto) de la captura
+        si `image` fue decodificada a escala reducida.
+        Retorna {'ok', 'reasons': [{'code', 'message'}], 'metrics': {...}}.
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        scale = ImageQualityGate.ANALYSIS_SIDE / max(height, width)
+        if scale < 1:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        original_long = max(original_size) if original_size else max(height, width)
+        to_original = original_long / max(gray.shape[:2])
+
+        card = ImageQualityGate._find_card(gray)
+        if card is not None:
+            x, y, w, h = card
+            roi = gray[y:y + h, x:x + w]
+            card_long_px = int(max(w, h) * to_original)
+        else:
+            roi = gray
+            card_long_px = int(original_long)
+
+        laplacian_var = float(cv2.Laplacian(roi, cv2.CV_64F).var())
+        contrast = float(roi.std())
+        sharpness = laplacian_var / max(contrast ** 2, 1.0)
+        brightness = float(roi.mean())
+        glare_ratio = float(np.count_nonzero(roi >= 250) / roi.size)
+
+        reasons: List[str] = []
+        if sharpness < settings.QUALITY_MIN_SHARPNESS:
+            reasons.append('BLURRY')
+        if brightness < settings.QUALITY_MIN_BRIGHTNESS:
+            reasons.append('TOO_DARK')
+        elif brightness > settings.QUALITY_MAX_BRIGHTNESS:
+            reasons.append('OVEREXPOSED')
+        if doc_type in ImageQualityGate.CARD_TYPES and glare_ratio > settings.QUALITY_MAX_GLARE:
+            reasons.append('GLARE')
+        if card_long_px < settings.QUALITY_MIN_CARD_PX:
+            reasons.append('LOW_RESOLUTION')
+
+        return {
+            'ok': not reasons,
+            'reasons': [{'code': code, 'message': ImageQualityGate.MESSAGES[code]} for code in reasons],
+            'metrics': {
+                'sharpness': round(sharpness, 4),
+                'laplacian_var': round(laplacian_var, 1),
+                'contrast': round(contrast, 1),
+                'brightness': round(brightness, 1),
+                'glare_ratio': round(glare_ratio, 4),
+                'card_detected': card is not None,
+                'card_long_px': card_long_px,
+            },
+        }
+
+    @staticmethod
+    def assess_file(image_path: str, doc_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Evalúa un archivo decodificándolo a escala reducida. Retorna None si no es una imagen
+        decodificable (la decisión queda para el worker).
+        Raises:
+            ImageTooLargeError: si la cabecera excede IMAGE_MAX_PIXELS.
+        """
+        dims = ImageDecoder.read_dimensions(image_path)
+        if dims is None:
+            return None
+        image = ImageDecoder.decode(image_path, grayscale=True, target_pixels=ImageQualityGate.ANALYSIS_PIXELS)
+        if image is None:
+            return None
+        return ImageQualityGate.assess(image, doc_type, original_size=dims)
+
+    @staticmethod
+    def rejection(quality: Dict[str, Any]) -> Dict[str, Any]:
+        """Resultado estándar del pipeline para una captura rechazada."""
+        return {
+            'status': 'LOW_QUALITY',
+            'data': {},
+            'meta': {
+                'isValid': False,
+                'score': 0,
+                'method': 'QUALITY_GATE',
+                'message': " ".join(r['message'] for r in quality['reasons']),
+                'quality': quality,
+            }
+        }
@@ -0,0 +1,175 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RegistryIndex:
+    """
+    Índice local (SQLite) de registros del Registro Mercantil.
+    - Clave: registro/folio/libro (normalizados sin ceros a la izquierda); también se busca por expediente y URL del QR.
+      Sólo la búsqueda por URL identifica el registro independientemente del documento: las claves leídas del
+      propio PDF coinciden consigo mismas, así que el resultado indica por qué se encontró (`match`).
+    - Se alimenta con cada scrape exitoso y con importaciones masivas (CSV o JSONL).
+    - Una entrada más antigua que REGISTRY_INDEX_MAX_AGE_S se considera vencida: se reintenta online,
+      pero se sigue usando si el sitio del gobierno no responde.
+    """
+
+    FIELDS = ('REGISTRO', 'FOLIO', 'LIBRO', 'EXPEDIENTE')
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS registry_records (
+            registro   TEXT NOT NULL,
+            folio      TEXT NOT NULL,
+            libro      TEXT NOT NULL,
+            expediente TEXT,
+            url        TEXT,
+            data       TEXT NOT NULL,
+            source     TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (registro, folio, libro)
+        );
+        CREATE INDEX IF NOT EXISTS idx_registry_expediente ON registry_records (expediente);
+        CREATE INDEX IF NOT EXISTS idx_registry_url ON registry_records (url);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo y por proceso (los hijos del prefork no deben heredar la del padre)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.row_factory = sqlite3.Row
+            # WAL: lecturas concurrentes de varios workers mientras otro escribe
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _norm(value: Any) -> str:
+        return str(value or '').strip().lstrip('0')
+
+    def lookup(self, record: Dict[str, Any], url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca por URL del QR, luego por registro/folio/libro y por último por expediente.
+        Retorna {'data', 'source', 'updated_at', 'stale', 'match'} o None;
+        match: 'url', 'keys' (registro/folio/libro del documento) o 'expediente'.
+        """
+        conn = self._conn()
+        row, match = None, 'url'
+        if url:
+            row = conn.execute("SELECT * FROM registry_records WHERE url = ?", (url,)).fetchone()
+
+        registro, folio, libro = (self._norm(record.get(k)) for k in ('REGISTRO', 'FOLIO', 'LIBRO'))
+        if row is None and registro and folio and libro:
+            match = 'keys'
+            row = conn.execute(
+                "SELECT * FROM registry_records WHERE registro = ? AND folio = ? AND libro = ?",
+                (registro, folio, libro),
+            ).fetchone()
+
+        expediente = str(record.get('EXPEDIENTE') or '').strip()
+        if row is None and expediente:
+            match = 'expediente'
+            row = conn.execute(
+                "SELECT * FROM registry_records WHERE expediente = ? ORDER BY updated_at DESC LIMIT 1",
+                (expediente,),
+            ).fetchone()
+
+        if row is None:
+            return None
+        return {
+            'data': json.loads(row['data']),
+            'source': row['source'],
+            'updated_at': row['updated_at'],
+            'stale': time.time() - row['updated_at'] > settings.REGISTRY_INDEX_MAX_AGE_S,
+            'match': match,
+        }
+
+    def upsert(self, data: Dict[str, Any], source: str, url: Optional[str] = None,
+               updated_at: Optional[float] = None) -> bool:
+        """Guarda (o reemplaza) un registro. Sin registro/folio/libro no hay clave: se ignora."""
+        return self.upsert_many([(data, url, updated_at)], source) == 1
+
+    def upsert_many(self, records: Iterable[tuple], source: str) -> int:
+        """records: iterable de (data, url, updated_at). Una sola transacción para importaciones grandes."""
+        now = time.time()
+        rows = []
+        for data, url, updated_at in records:
+            registro, folio, libro = (self._norm(data.get(k)) for k in ('REGISTRO', 'FOLIO', 'LIBRO'))
+            if not (registro and folio and libro):
+                continue
+            rows.append((
+                registro, folio, libro, str(data.get('EXPEDIENTE') or '').strip() or None, url,
+                json.dumps(data, ensure_ascii=False), source, updated_at or now,
+            ))
+
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO registry_records (registro, folio, libro, expediente, url, data, source, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (registro, folio, libro) DO UPDATE SET
+                    expediente = excluded.expediente,
+                    url = COALESCE(excluded.url, registry_records.url),
+                    data = excluded.data,
+                    source = excluded.source,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def import_file(self, path: str) -> int:
+        """
+        Importa una exportación masiva. Formatos:
+        - CSV con encabezados (REGISTRO, FOLIO, LIBRO, EXPEDIENTE, NOMBRE, ESTADO, ..., opcional URL)
+        - JSONL con un objeto por línea con las mismas claves
+        """
+        def records():
+            with open(path, encoding='utf-8') as f:
+                if path.lower().endswith(('.jsonl', '.json')):
+                    rows = (json.loads(line) for line in f if line.strip())
+                else:
+                    rows = csv.DictReader(f)
+                for row in rows:
+                    data = {k.strip().upper(): v for k, v in row.items() if k and v not in (None, '')}
+                    yield data, data.pop('URL', None), None
+
+        imported = self.upsert_many(records(), source='import')
+        logger.info(f"RegistryIndex: {imported} registros importados desde {path}")
+        return imported
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM registry_records").fetchone()[0]
+
+registry_index = RegistryIndex(settings.REGISTRY_INDEX_PATH)
+
+def main(argv=None) -> int:
+    """CLI: python -m app.services.registry_index <exportación.csv|.jsonl> [...]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Importa exportaciones del Registro Mercantil al índice local.")
+    parser.add_argument('files', nargs='+', help="Archivos CSV o JSONL")
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        print(f"{path}: {registry_index.import_file(path)} registros")
+    print(f"Total en índice: {registry_index.count()}")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -4,6 +4,10 @@ import logging
 from rapidfuzz import fuzz
 import re
 
+from app.core.config import settings
+from app.core.metrics import timed_stage, stage
+from app.services.registry_index import registry_index
+
 logger = logging.getLogger(__name__)
 
 class RegistryValidator:
@@ -12,37 +16,94 @@ class RegistryValidator:
     la base de datos pública del Registro Mercantil mediante la URL del QR.
     """
 
+    # Campos que no verifican nada cuando el registro se encontró por ellos mismos (RegistryIndex `match`)
+    SELF_MATCHED_FIELDS = {
+        'keys': ('REGISTRO', 'FOLIO', 'LIBRO'),
+        'expediente': ('EXPEDIENTE',),
+    }
+
     @staticmethod
-    def validate_patente(pdf_data: dict, qr_url: str) -> dict:
+    def validate_patente(pdf_data: dict, qr_url: str, online: bool = True) -> dict:
         """
-        1. Consulta la URL del QR.
-        2. Extrae los datos oficiales de la web del Registro Mercantil.
+        1. Busca el registro en el índice local (RegistryIndex) por la URL del QR.
+        2. Si no está o está vencido, consulta la URL del QR y guarda el resultado en el índice.
+           Con online=False (modo FAST) no se sale a la web: se usa el índice aunque esté vencido
+           o se marca la validación como DEFERRED.
         3. Compara campo por campo con el PDF.
-        4. Retorna los datos oficiales y el resultado de la validación.
+        4. Retorna los datos oficiales, la fuente y el resultado de la validación.
+        Un registro encontrado por las claves del propio PDF (registro/folio/libro o expediente) no verifica el QR:
+        sólo se usa si no se puede consultar en línea, con ONLINE_CHECK INDEX_UNVERIFIED (no cuenta como QR
+        válido en el scoring), FUENTE INDEX_BY_DOCUMENT_KEYS y sin contar en COINCIDENCIA_TOTAL los campos usados
+        para encontrarlo (coincidirían consigo mismos).
         """
-        logger.info(f"Iniciando validación online contra: {qr_url}")
-        
-        # 1. Obtener datos de la web
-        web_data = RegistryValidator._scrape_registry_data(qr_url)
-        
+        cached = RegistryValidator._lookup_index(pdf_data, qr_url)
+        by_document = cached is not None and cached['match'] != 'url'
+        source = 'INDEX'
+        web_data = cached['data'] if cached and not cached['stale'] and not by_document else None
+
+        if web_data is None and not online:
+            if not cached:
+                return {"ONLINE_CHECK": "DEFERRED", "ERROR": "Validación en línea omitida (modo FAST)"}
+            web_data, source = cached['data'], RegistryValidator._fallback_source(cached)
+
+        if web_data is None:
+            logger.info(f"Iniciando validación online contra: {qr_url}")
+            web_data = RegistryValidator._scrape_registry_data(qr_url)
+            source = 'ONLINE'
+            if web_data:
+                RegistryValidator._store_index(web_data, qr_url)
+            elif cached:
+                # Sitio caído o lento: se usa la copia local aunque esté vencida
+                logger.warning("Registro Mercantil no disponible, usando índice local")
+                web_data, source = cached['data'], RegistryValidator._fallback_source(cached)
+
         if not web_data:
             return {
                 "ONLINE_CHECK": "FAILED", 
                 "ERROR": "No se pudo obtener información de la URL del QR"
             }
 
-        # 2. Comparar datos (PDF vs WEB)
-        comparison_result = RegistryValidator._compare_data(pdf_data, web_data)
+        # Comparar datos (PDF vs WEB), sin los campos que sirvieron de clave de búsqueda
+        exclude = RegistryValidator.SELF_MATCHED_FIELDS.get(cached['match'], ()) \
+            if source == 'INDEX_BY_DOCUMENT_KEYS' else ()
+        comparison_result = RegistryValidator._compare_data(pdf_data, web_data, exclude)
 
-        # 3. Retornar fusión de datos
+        # Retornar fusión de datos
         return {
-            "ONLINE_CHECK": "SUCCESS",
+            "ONLINE_CHECK": "INDEX_UNVERIFIED" if source == 'INDEX_BY_DOCUMENT_KEYS' else "SUCCESS",
+            "FUENTE": source,
             "DATOS_OFICIALES_WEB": web_data,
             "VALIDACION_CAMPOS": comparison_result['fields'],
             "COINCIDENCIA_TOTAL": comparison_result['is_match']
         }
 
     @staticmethod
+    def _fallback_source(cached: dict) -> str:
+        return 'INDEX_BY_DOCUMENT_KEYS' if cached['match'] != 'url' else 'INDEX_STALE'
+
+    @staticmethod
+    def _lookup_index(pdf_data: dict, qr_url: str):
+        if not settings.REGISTRY_INDEX_ENABLED:
+            return None
+        try:
+            with stage('registry_index'):
+                return registry_index.lookup(pdf_data, qr_url)
+        except Exception as e:
+            # El índice es una optimización: ante cualquier error se valida online
+            logger.warning(f"Índice de registro no disponible: {e}")
+            return None
+
+    @staticmethod
+    def _store_index(web_data: dict, qr_url: str) -> None:
+        if not settings.REGISTRY_INDEX_ENABLED:
+            return
+        try:
+            registry_index.upsert(web_data, source='scrape', url=qr_url)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el registro en el índice: {e}")
+
+    @staticmethod
+    @timed_stage("registry_http")
     def _scrape_registry_data(url: str) -> dict:
         """Descarga y parsea la página del Registro Mercantil."""
         try:
@@ -113,8 +174,11 @@ class RegistryValidator:
             return None
 
     @staticmethod
-    def _compare_data(pdf: dict, web: dict) -> dict:
-        """Compara los datos extraídos del PDF contra los de la Web."""
+    def _compare_data(pdf: dict, web: dict, exclude: tuple = ()) -> dict:
+        """
+        Compara los datos extraídos del PDF contra los de la Web.
+        exclude: campos que no se comparan (None en el detalle); si no queda ninguno comparable el resultado es None.
+        """
         results = {}
         matches = 0
         total_checks = 0
@@ -132,7 +196,7 @@ class RegistryValidator:
             val_pdf = str(pdf.get(pdf_key, '')).strip().lstrip('0')
             val_web = str(web.get(web_key, '')).strip().lstrip('0')
             
-            if val_pdf and val_web:
+            if pdf_key not in exclude and val_pdf and val_web:
                 total_checks += 1
                 if val_pdf == val_web:
                     results[pdf_key] = True
@@ -157,6 +221,8 @@ class RegistryValidator:
         # 3. Resultado Final
         # Consideramos match si la mayoría de campos numéricos coinciden
         is_total_match = (matches >= (total_checks - 1)) if total_checks > 1 else (matches == total_checks)
+        if exclude and total_checks == 0:
+            is_total_match = None  # Nada independiente que comparar
 
         return {
             "fields": results,
@@ -0,0 +1,161 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (x0, y0, x1, y1) en coordenadas de la página
+Tile = Tuple[int, int, int, int]
+
+class PageTiler:
+    """
+    OCR por mosaicos para páginas grandes (ej. RTU carta escaneado a 300 dpi, ~2550x3300):
+    - Sólo para los doc_types de OCR_TILE_DOC_TYPES (documentos carta); las fotos de DPI se procesan enteras.
+    - La página se divide en mosaicos con solape OCR_TILE_OVERLAP, del tamaño del límite del detector del
+      predictor usado (u OCR_TILE_SIZE): cada mosaico se detecta a resolución nativa (sin perder etiquetas
+      pequeñas) y la memoria por inferencia queda acotada al mosaico, no a la página.
+    - Los mosaicos se procesan en paralelo sobre los predictores libres del PredictorPool.
+    - Las cajas vuelven a coordenadas de página; las repetidas en el solape se descartan y las líneas
+      cortadas por el borde de un mosaico se unen con su continuación en el vecino.
+    """
+
+    # Píxeles al borde interior de un mosaico a partir de los cuales una caja se considera cortada
+    EDGE_MARGIN = 4
+
+    @staticmethod
+    def should_tile(image, doc_type: str) -> bool:
+        return (settings.OCR_TILING_ENABLED and doc_type in settings.OCR_TILE_DOC_TYPES
+                and max(image.shape[:2]) > settings.OCR_TILE_MIN_SIDE)
+
+    @staticmethod
+    def _starts(length: int, size: int, stride: int) -> List[int]:
+        if length <= size:
+            return [0]
+        starts = list(range(0, length - size, stride))
+        return starts + [length - size]  # El último mosaico se alinea al borde (sin mosaicos diminutos)
+
+    @staticmethod
+    def tiles(height: int, width: int, size: int, overlap: Optional[int] = None) -> List[Tile]:
+        overlap = settings.OCR_TILE_OVERLAP if overlap is None else overlap
+        stride = max(size - overlap, 1)
+        return [
+            (x0, y0, min(x0 + size, width), min(y0 + size, height))
+            for y0 in PageTiler._starts(height, size, stride)
+            for x0 in PageTiler._starts(width, size, stride)
+        ]
+
+    @staticmethod
+    def ocr(predictor, image, cls: bool, det_limit: int) -> list:
+        """
+        OCR de la página por mosaicos con la misma salida que `predictor.ocr(image)[0]`.
+        det_limit: det_limit_side_len del predictor (tamaño de mosaico salvo OCR_TILE_SIZE).
+        """
+        height, width = image.shape[:2]
+        tiles = PageTiler.tiles(height, width, settings.OCR_TILE_SIZE or det_limit)
+
+        def run(tile: Tile):
+            x0, y0, x1, y1 = tile
+            # Vista sobre la página (sin copia); el detector sólo redimensiona el mosaico
+            result = predictor.ocr(image[y0:y1, x0:x1], cls=cls)
+            return (result[0] if result else None) or []
+
+        workers = min(len(tiles), getattr(predictor, 'size', 1))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-tile') as pool:
+                tile_layouts = list(pool.map(run, tiles))
+        else:
+            tile_layouts = [run(tile) for tile in tiles]
+        logger.debug(f"OCR por mosaicos: {len(tiles)} mosaicos, {workers} en paralelo")
+        return PageTiler.merge(tiles, tile_layouts, width, height)
+
+    @staticmethod
+    def merge(tiles: List[Tile], tile_layouts: List[list], width: int, height: int) -> list:
+        """Lleva las cajas a coordenadas de página, elimina duplicados del solape y une líneas cortadas."""
+        boxes = []
+        for (x0, y0, x1, y1), layout in zip(tiles, tile_layouts):
+            for coords, (text, confidence) in layout:
+                xs = [p[0] + x0 for p in coords]
+                ys = [p[1] + y0 for p in coords]
+                box = [min(xs), min(ys), max(xs), max(ys)]
+                # Sólo cuentan los bordes interiores: el borde de la página no corta nada
+                cut_left = x0 > 0 and box[0] - x0 <= PageTiler.EDGE_MARGIN
+                cut_right = x1 < width and x1 - box[2] <= PageTiler.EDGE_MARGIN
+                cut_top = y0 > 0 and box[1] - y0 <= PageTiler.EDGE_MARGIN
+                cut_bottom = y1 < height and y1 - box[3] <= PageTiler.EDGE_MARGIN
+                boxes.append({
+                    'coords': [[x, y] for x, y in zip(xs, ys)],
+                    'box': box,
+                    'text': text,
+                    'confidence': confidence,
+                    'cut': cut_left or cut_right or cut_top or cut_bottom,
+                })
+
+        # Duplicados del solape: se conserva la lectura completa (no cortada) o la de mayor área.
+        # Dos tramos cortados de la misma línea no son duplicados: se unen en el paso siguiente.
+        boxes.sort(key=lambda b: (b['cut'], -PageTiler._area(b['box']), -b['confidence']))
+        kept = []
+        for candidate in boxes:
+            if any(PageTiler._overlap_ratio(candidate['box'], k['box']) > 0.5
+                   and (not k['cut'] or PageTiler._contains(k['box'], candidate['box'])) for k in kept):
+                continue
+            kept.append(candidate)
+
+        # Líneas largas cortadas por un borde vertical: se unen con su continuación en la misma línea
+        kept.sort(key=lambda b: (b['box'][1], b['box'][0]))
+        merged = []
+        for candidate in kept:
+            target = next((m for m in merged if (m['cut'] or candidate['cut'])
+                           and PageTiler._same_line(m['box'], candidate['box'])), None)
+            if target is None:
+                merged.append(candidate)
+                continue
+            left, right = sorted((target, candidate), key=lambda b: b['box'][0])
+            x0, y0 = min(left['box'][0], right['box'][0]), min(left['box'][1], right['box'][1])
+            x1, y1 = max(left['box'][2], right['box'][2]), max(left['box'][3], right['box'][3])
+            target.update({
+                'box': [x0, y0, x1, y1],
+                'coords': [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+                'text': PageTiler._join_text(left['text'], right['text']),
+                'confidence': min(left['confidence'], right['confidence']),
+                'cut': left['cut'] and right['cut'],
+            })
+
+        return [[b['coords'], (b['text'], b['confidence'])] for b in merged]
+
+    @staticmethod
+    def _area(box) -> float:
+        return max(box[2] - box[0], 0) * max(box[3] - box[1], 0)
+
+    @staticmethod
+    def _overlap_ratio(a, b) -> float:
+        """Intersección sobre el área de la caja menor (una caja cortada cae dentro de la completa)."""
+        w = min(a[2], b[2]) - max(a[0], b[0])
+        h = min(a[3], b[3]) - max(a[1], b[1])
+        if w <= 0 or h <= 0:
+            return 0.0
+        return (w * h) / max(min(PageTiler._area(a), PageTiler._area(b)), 1e-6)
+
+    @staticmethod
+    def _contains(outer, inner) -> bool:
+        m = PageTiler.EDGE_MARGIN
+        return (inner[0] >= outer[0] - m and inner[1] >= outer[1] - m
+                and inner[2] <= outer[2] + m and inner[3] <= outer[3] + m)
+
+    @staticmethod
+    def _same_line(a, b) -> bool:
+        """Misma línea de texto: solape vertical mayoritario y contacto horizontal (se tocan o se solapan)."""
+        v = min(a[3], b[3]) - max(a[1], b[1])
+        if v <= 0.6 * min(a[3] - a[1], b[3] - b[1]):
+            return False
+        gap = max(a[0], b[0]) - min(a[2], b[2])
+        return gap <= PageTiler.EDGE_MARGIN
+
+    @staticmethod
+    def _join_text(left: str, right: str) -> str:
+        """Une dos lecturas de la misma línea quitando el texto repetido del solape ("CONTRIBU" + "TRIBUYENTE")."""
+        for size in range(min(len(left), len(right)), 2, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        return f"{left} {right}"
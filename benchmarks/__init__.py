@@ -0,0 +1,7 @@
+"""
+Suite de benchmarks reproducibles para el pipeline de AvanzaOCR.
+
+Uso:
+    python -m benchmarks --iterations 20 --output bench.json
+    python -m benchmarks --compare bench_anterior.json --skip-engine
+"""
@@ -0,0 +1,154 @@
+"""
+Calibración de QUALITY_MIN_SHARPNESS sobre el corpus sintético.
+
+Desenfoca DPI sintéticos (frontal y posterior, varias semillas) con kernels gaussianos crecientes, a varios
+contrastes (--contrasts: 1.0 = render original, 0.4 = grises comprimidos hacia el medio), y mide la nitidez
+que reporta ImageQualityGate (normalizada por contraste: debe variar con el desenfoque, no con el contraste).
+Con --ocr además procesa cada imagen con OCREngine (sin control de calidad) y registra si se extraen los campos
+requeridos (OCREngine.CASCADE_REQUIRED_FIELDS); el primer kernel en el que la extracción cae bajo
+--min-parse-rate define el desenfoque ilegible. Sin --ocr ese kernel se indica con --unreadable-kernel.
+
+El umbral recomendado queda entre la nitidez máxima del desenfoque ilegible y la mínima del último legible:
+
+    python -m benchmarks.calibrate_quality --seeds 5 --ocr
+    python -m benchmarks.calibrate_quality --unreadable-kernel 21 --contrasts 1.0,0.4
+"""
+import os
+import sys
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.services.quality_gate import ImageQualityGate
+from benchmarks.synthetic import SyntheticDocuments
+
+KERNELS = (1, 5, 9, 11, 13, 15, 17, 21, 25, 31)
+CONTRASTS = (1.0, 0.4)
+CARDS = {'DPI_FRONT': SyntheticDocuments.dpi_front, 'DPI_BACK': SyntheticDocuments.dpi_back}
+
+def _sigma(kernel: int) -> float:
+    """Sigma que OpenCV deriva del tamaño del kernel cuando sigma=0."""
+    return 0.3 * ((kernel - 1) * 0.5 - 1) + 0.8 if kernel > 1 else 0.0
+
+def _with_contrast(image: np.ndarray, contrast: float) -> np.ndarray:
+    """Comprime los grises hacia el medio (128) por el factor `contrast`."""
+    if contrast == 1.0:
+        return image
+    return np.clip(128 + (image.astype(np.float32) - 128) * contrast, 0, 255).astype(np.uint8)
+
+def sweep(seeds: int, kernels: List[int], contrasts: List[float],
+          engine: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """
+    Una fila por (doc_type, contraste, kernel): nitidez mínima/mediana/máxima, fracción de capturas con la
+    tarjeta detectada y tasa de extracción (si hay motor).
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for doc_type, generate in CARDS.items():
+            required = engine.CASCADE_REQUIRED_FIELDS.get(doc_type, ()) if engine else ()
+            originals = [cv2.imread(generate(os.path.join(tmp, f"{doc_type}_{seed}.jpg"), seed=seed))
+                         for seed in range(seeds)]
+            for contrast in contrasts:
+                for kernel in kernels:
+                    sharpness, detected, parsed = [], [], []
+                    for seed, image in enumerate(originals):
+                        blurred = image if kernel == 1 else cv2.GaussianBlur(image, (kernel, kernel), 0)
+                        path = os.path.join(tmp, f"{doc_type}_{seed}_c{contrast}_k{kernel}.jpg")
+                        cv2.imwrite(path, _with_contrast(blurred, contrast), [cv2.IMWRITE_JPEG_QUALITY, 90])
+                        metrics = ImageQualityGate.assess_file(path, doc_type)['metrics']
+                        sharpness.append(metrics['sharpness'])
+                        detected.append(metrics['card_detected'])
+                        if engine is not None:
+                            data = engine.process_document(path, doc_type).get('data') or {}
+                            parsed.append(all(data.get(field) for field in required))
+                    rows.append({
+                        'doc_type': doc_type,
+                        'contrast': contrast,
+                        'kernel': kernel,
+                        'sigma': round(_sigma(kernel), 2),
+                        'sharpness_min': round(min(sharpness), 4),
+                        'sharpness_median': round(float(np.median(sharpness)), 4),
+                        'sharpness_max': round(max(sharpness), 4),
+                        'card_rate': round(sum(detected) / len(detected), 2),
+                        'parse_rate': round(sum(parsed) / len(parsed), 2) if parsed else None,
+                    })
+    return rows
+
+def recommend(rows: List[Dict[str, Any]], min_parse_rate: float,
+              unreadable_kernel: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    Umbral entre la nitidez del primer desenfoque ilegible y la del último legible (peor caso por doc_type y
+    contraste). Sólo cuentan las capturas con la tarjeta detectada en todas las semillas: sin tarjeta la
+    nitidez se mide sobre el fondo y no describe el documento.
+    """
+    unreadable_max, readable_min = 0.0, float('inf')
+    series = {(r['doc_type'], r['contrast']) for r in rows}
+    for doc_type, contrast in sorted(series):
+        ordered = sorted((r for r in rows if r['doc_type'] == doc_type and r['contrast'] == contrast
+                          and r['card_rate'] == 1.0), key=lambda r: r['kernel'])
+        if not ordered:
+            continue
+        if ordered[0]['parse_rate'] is not None:
+            limit = next((r['kernel'] for r in ordered if r['parse_rate'] < min_parse_rate), None)
+        else:
+            limit = unreadable_kernel
+        if limit is None:
+            continue
+        unreadable = [r for r in ordered if r['kernel'] >= limit]
+        readable = [r for r in ordered if r['kernel'] < limit]
+        unreadable_max = max([unreadable_max] + [r['sharpness_max'] for r in unreadable])
+        readable_min = min([readable_min] + [r['sharpness_min'] for r in readable])
+    if readable_min == float('inf'):
+        return None
+    return {
+        'unreadable_max': unreadable_max,
+        'readable_min': readable_min,
+        'separable': unreadable_max < readable_min,
+        'threshold': round((unreadable_max + readable_min) / 2, 3),
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibra QUALITY_MIN_SHARPNESS desenfocando DPI sintéticos.")
+    parser.add_argument('--seeds', type=int, default=3, help="Tarjetas por doc_type")
+    parser.add_argument('--kernels', default=','.join(map(str, KERNELS)), help="Kernels gaussianos (impares)")
+    parser.add_argument('--contrasts', default=','.join(map(str, CONTRASTS)),
+                        help="Factores de contraste (1.0 = original)")
+    parser.add_argument('--ocr', action='store_true', help="Medir la extracción con OCREngine (requiere Paddle)")
+    parser.add_argument('--min-parse-rate', type=float, default=0.9,
+                        help="Tasa de extracción bajo la cual un desenfoque se considera ilegible")
+    parser.add_argument('--unreadable-kernel', type=int, default=None,
+                        help="Sin --ocr: primer kernel considerado ilegible")
+    args = parser.parse_args(argv)
+
+    engine = None
+    if args.ocr:
+        # El control de calidad y la reutilización de duplicados falsearían la medición
+        settings.QUALITY_GATE_ENABLED = False
+        settings.PHASH_INDEX_ENABLED = False
+        from app.services.ocr_engine import OCREngine
+        engine = OCREngine()
+
+    rows = sweep(args.seeds, [int(k) for k in args.kernels.split(',')],
+                 [float(c) for c in args.contrasts.split(',')], engine)
+    print(f"{'doc_type':<10} {'contr.':>6} {'kernel':>6} {'sigma':>6} {'min':>8} {'mediana':>8} {'max':>8} "
+          f"{'tarjeta':>7} {'extrae':>7}")
+    for r in rows:
+        rate = '-' if r['parse_rate'] is None else f"{r['parse_rate']:.2f}"
+        print(f"{r['doc_type']:<10} {r['contrast']:>6} {r['kernel']:>6} {r['sigma']:>6} {r['sharpness_min']:>8} "
+              f"{r['sharpness_median']:>8} {r['sharpness_max']:>8} {r['card_rate']:>7.2f} {rate:>7}")
+
+    result = recommend(rows, args.min_parse_rate, args.unreadable_kernel)
+    if result is None:
+        print("Sin desenfoque ilegible: use --ocr o --unreadable-kernel", file=sys.stderr)
+        return 1
+    print(f"Ilegible: nitidez <= {result['unreadable_max']}; legible: >= {result['readable_min']}; "
+          f"QUALITY_MIN_SHARPNESS recomendado: {result['threshold']}"
+          + ("" if result['separable'] else " (rangos solapados: revisar la detección de tarjeta)"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
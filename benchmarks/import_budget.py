@@ -0,0 +1,77 @@
+"""
+Presupuesto de importación del proceso de la API.
+
+Importa el módulo indicado (por defecto `app.main`) en un intérprete limpio y falla si el grafo
+de imports arrastra librerías de ML/visión (paddle, OpenCV, PyMuPDF, ...) o excede el tiempo máximo.
+Después pasa una foto de prueba por los controles que scanDocument aplica antes de encolar, de modo que
+también se detectan los imports diferidos (ej. OpenCV con QUALITY_GATE_SYNC=true). Pensado para CI:
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --max-seconds 2.0 --forbid paddle cv2
+    python -m benchmarks.import_budget --no-photo   # sólo el import
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import List, Optional
+
+from app.core.config import settings
+
+# Módulos que sólo deben cargarse en el worker
+FORBIDDEN_MODULES = ('paddle', 'paddleocr', 'cv2', 'fitz', 'skimage', 'pyzbar', 'imutils')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+if {photo}:
+    # Foto JPEG mínima escrita sin OpenCV (PIL ya es dependencia de la API)
+    import os, tempfile
+    from PIL import Image
+    from app.core.security import FileValidator
+    from app.graphql.schema import _sync_quality
+    path = os.path.join(tempfile.mkdtemp(), 'probe.jpg')
+    Image.new('RGB', (640, 400), (200, 200, 200)).save(path, 'JPEG')
+    FileValidator.validate_file_header(path)
+    _sync_quality(path, 'DPI_FRONT')
+    os.remove(path)
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+def probe(module: str, photo: bool = True) -> dict:
+    """Importa `module` (y opcionalmente procesa una foto de prueba) en un subproceso; retorna tiempo y módulos."""
+    out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, photo=photo)], capture_output=True,
+                         text=True, cwd=settings.BASE_DIR, timeout=300)
+    if out.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def check(module: str, forbidden: List[str], max_seconds: Optional[float], photo: bool = True) -> List[str]:
+    """Retorna la lista de violaciones (vacía si el presupuesto se cumple)."""
+    result = probe(module, photo)
+    loaded = set(result['modules'])
+    origin = f"{module} (con foto de prueba)" if photo else module
+    errors = [f"{origin} importa '{name}'" for name in forbidden
+              if name in loaded or any(m.startswith(name + '.') for m in loaded)]
+    if max_seconds is not None and result['seconds'] > max_seconds:
+        errors.append(f"{module} tarda {result['seconds']:.2f}s en importar (máximo {max_seconds:.2f}s)")
+    print(f"{module}: {result['seconds']:.2f}s, {len(loaded)} módulos", file=sys.stderr)
+    return errors
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Verifica que la API no importe dependencias pesadas del worker.")
+    parser.add_argument('--module', default='app.main', help="Módulo raíz a importar")
+    parser.add_argument('--forbid', nargs='*', default=list(FORBIDDEN_MODULES), help="Módulos prohibidos")
+    parser.add_argument('--max-seconds', type=float, default=None, help="Tiempo máximo de importación")
+    parser.add_argument('--no-photo', action='store_true', help="No procesar la foto de prueba (sólo el import)")
+    args = parser.parse_args(argv)
+
+    errors = check(args.module, args.forbid, args.max_seconds, photo=not args.no_photo)
+    for error in errors:
+        print(f"FALLA: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+Prueba de carga end-to-end del servicio GraphQL (API -> Redis -> worker -> backend).
+
+Sube documentos con `scanDocument` a la tasa de llegada indicada, consulta `getOcrResult` hasta el
+estado final y reporta percentiles de latencia end-to-end, espera en cola, tasa de errores y el punto
+de saturación entre escalones de carga. Pensado para correr local contra un Redis en contenedor:
+
+    docker run -d -p 6379:6379 redis:7
+    uvicorn app.main:app --workers 2
+    OCR_FAKE_ENGINE=true OCR_FAKE_LATENCY_MS=800 celery -A worker.celery_app worker --concurrency 4
+    python -m benchmarks.loadtest --rates 1,2,4,8 --stage-seconds 60 --output load.json
+
+Con --rates cada escalón es de lazo abierto (llegadas Poisson) y la latencia se mide desde la llegada
+programada, de modo que el atraso del propio generador no se oculta. Con --rates 0 cada uno de los
+--concurrency clientes envía el siguiente documento al terminar el anterior (lazo cerrado).
+
+--mix reproduce una mezcla registrada (JSONL, una entrada por línea):
+    {"doc_type": "RTU", "path": "muestras/rtu_grande.pdf", "weight": 3}
+    {"doc_type": "RTU", "establishments": 50, "weight": 1}
+    {"doc_type": "DPI_FRONT", "image_width": 4000, "weight": 6}
+Las entradas sin `path` se generan con SyntheticDocuments (el tamaño se controla con
+`image_width` o `establishments`).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+
+from app.core.config import settings
+from benchmarks.runner import PERCENTILES, git_revision
+from benchmarks.synthetic import SyntheticDocuments
+
+SCAN_MUTATION = """
+mutation($file: Upload!, $docType: String!) {
+  scanDocument(file: $file, docType: $docType) { taskId status message estimatedSeconds }
+}
+"""
+RESULT_QUERY = "query($taskId: String!) { getOcrResult(taskId: $taskId) { status meta } }"
+QUEUE_QUERY = "{ queueStats { queue depth active slots } }"
+
+# Estados de scanDocument que no generan tarea
+REJECTED = ('BUSY', 'LOW_QUALITY', 'RATE_LIMITED')
+# Estados finales que indican una falla del servicio (INCORRECT es un resultado válido del pipeline)
+ERRORS = ('FAILED', 'ERROR', 'TIMEOUT', 'HTTP_ERROR')
+
+class GraphQLClient:
+    """Cliente mínimo del endpoint GraphQL (multipart para uploads), con una sesión HTTP por hilo."""
+
+    def __init__(self, url: str, timeout: float = 30.0, api_key: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {settings.ADMISSION_API_KEY_HEADER: api_key} if api_key else {}
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def execute(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = self.session.post(self.url, json={'query': query, 'variables': variables or {}},
+                                     headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return self._data(response.json())
+
+    def scan(self, content: bytes, filename: str, doc_type: str) -> Dict[str, Any]:
+        # GraphQL multipart request spec: operations + map + archivo
+        operations = {'query': SCAN_MUTATION, 'variables': {'file': None, 'docType': doc_type}}
+        response = self.session.post(self.url, headers=self.headers, timeout=self.timeout, data={
+            'operations': json.dumps(operations),
+            'map': json.dumps({'0': ['variables.file']}),
+        }, files={'0': (filename, content)})
+        # Límite de uploads simultáneos de la API (UploadLimitMiddleware): rechazo reintentable
+        if response.status_code == 503:
+            return {'status': 'BUSY', 'taskId': ''}
+        response.raise_for_status()
+        return self._data(response.json())['scanDocument']
+
+    def result(self, task_id: str) -> Dict[str, Any]:
+        return self.execute(RESULT_QUERY, {'taskId': task_id})['getOcrResult']
+
+    def queue_stats(self) -> List[Dict[str, Any]]:
+        return self.execute(QUEUE_QUERY)['queueStats']
+
+    @staticmethod
+    def _data(payload: Dict[str, Any]) -> Dict[str, Any]:
+        if payload.get('errors'):
+            raise RuntimeError(payload['errors'][0].get('message', 'Error GraphQL'))
+        return payload['data']
+
+def load_mix(mix_path: Optional[str], workdir: str, seed: int) -> List[Dict[str, Any]]:
+    """Retorna [{'doc_type', 'filename', 'content', 'weight'}] desde el JSONL o el corpus sintético estándar."""
+    if mix_path is None:
+        corpus = SyntheticDocuments.build_corpus(workdir, seed=seed)
+        entries = [{'doc_type': doc_type, 'path': path} for path, doc_type in corpus.values()]
+    else:
+        with open(mix_path, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for i, entry in enumerate(entries):
+        path = entry.get('path') or _synthesize(entry, workdir, seed, i)
+        with open(path, 'rb') as f:
+            content = f.read()
+        items.append({'doc_type': entry['doc_type'], 'filename': os.path.basename(path),
+                      'content': content, 'weight': float(entry.get('weight', 1))})
+    return items
+
+def _synthesize(entry: Dict[str, Any], workdir: str, seed: int, index: int) -> str:
+    doc_type = entry['doc_type']
+    base = os.path.join(workdir, f"mix_{index}_{doc_type.lower()}")
+    if doc_type.startswith('DPI_FRONT'):
+        return SyntheticDocuments.dpi_front(base + '.jpg', seed + index, int(entry.get('image_width', 2400)))
+    if doc_type.startswith('DPI_BACK'):
+        return SyntheticDocuments.dpi_back(base + '.jpg', seed + index, int(entry.get('image_width', 2400)))
+    if doc_type == 'RTU':
+        return SyntheticDocuments.rtu_pdf(base + '.pdf', entry.get('tipo', 'INDIVIDUAL'),
+                                          int(entry.get('establishments', 1)), seed + index)
+    if doc_type == 'PATENTE':
+        return SyntheticDocuments.patente_pdf(base + '.pdf', entry.get('tipo', 'EMPRESA'), seed + index)
+    raise ValueError(f"Entrada de mezcla sin path ni generador sintético: {entry}")
+
+def unique_payload(content: bytes) -> bytes:
+    """
+    Agrega bytes al final del archivo (JPEG/PNG/PDF los ignoran) para que cada envío sea distinto:
+    de lo contrario el single-flight de scanDocument colapsa los envíos repetidos en una sola tarea.
+    """
+    return content + b'\n%' + uuid.uuid4().hex.encode()
+
+def run_document(client: GraphQLClient, item: Dict[str, Any], scheduled_at: float,
+                 args: argparse.Namespace) -> Dict[str, Any]:
+    """Envía un documento y consulta hasta el estado final. Los tiempos se miden desde `scheduled_at`."""
+    sample: Dict[str, Any] = {'doc_type': item['doc_type'], 'start_delay_ms': (time.time() - scheduled_at) * 1000}
+    content = unique_payload(item['content']) if args.unique else item['content']
+    try:
+        submit_start = time.time()
+        response = client.scan(content, item['filename'], item['doc_type'])
+        sample['submit_ms'] = (time.time() - submit_start) * 1000
+        if response['status'] != 'PROCESSING':
+            sample['status'] = response['status']
+            return sample
+
+        deadline = scheduled_at + args.timeout
+        while time.time() < deadline:
+            time.sleep(args.poll_interval)
+            result = client.result(response['taskId'])
+            if result and result['status'] != 'PROCESSING':
+                sample['status'] = result['status']
+                sample['e2e_ms'] = (time.time() - scheduled_at) * 1000
+                queue_wait = (result.get('meta') or {}).get('timings_ms', {}).get('queue_wait')
+                if queue_wait is not None:
+                    sample['queue_wait_ms'] = queue_wait
+                return sample
+        sample['status'] = 'TIMEOUT'
+    except Exception as e:
+        sample['status'] = 'HTTP_ERROR'
+        sample['error'] = str(e)
+    return sample
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    data = np.array(values)
+    summary = {f'p{p}_ms': round(float(np.percentile(data, p)), 1) for p in PERCENTILES}
+    summary['mean_ms'] = round(float(data.mean()), 1)
+    summary['max_ms'] = round(float(data.max()), 1)
+    return summary
+
+def summarize(samples: List[Dict[str, Any]], offered_rate: Optional[float], stage_seconds: float,
+              wall: float, queue_samples: List[int]) -> Dict[str, Any]:
+    """
+    arrival_rate: envíos realizados por segundo de escalón (con llegadas Poisson difiere de la ofrecida).
+    throughput: documentos terminados por segundo, incluido el drenaje de los pendientes al cerrar el escalón.
+    """
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[s['status']] = statuses.get(s['status'], 0) + 1
+    completed = [s for s in samples if 'e2e_ms' in s]
+    errors = sum(n for status, n in statuses.items() if status in ERRORS)
+    rejected = sum(n for status, n in statuses.items() if status in REJECTED)
+    return {
+        'offered_rate_per_s': offered_rate,
+        'submitted': len(samples),
+        'arrival_rate_per_s': round(len(samples) / stage_seconds, 3) if stage_seconds else None,
+        'completed': len(completed),
+        'throughput_per_s': round(len(completed) / wall, 3) if wall else None,
+        'error_rate': round(errors / len(samples), 4) if samples else None,
+        'rejected_rate': round(rejected / len(samples), 4) if samples else None,
+        'statuses': statuses,
+        'e2e': _percentiles([s['e2e_ms'] for s in completed]),
+        'submit': _percentiles([s['submit_ms'] for s in samples if 'submit_ms' in s]),
+        'queue_wait': _percentiles([s['queue_wait_ms'] for s in completed if 'queue_wait_ms' in s]),
+        'start_delay': _percentiles([s['start_delay_ms'] for s in samples]),
+        'max_queue_depth': max(queue_samples) if queue_samples else None,
+        'wall_s': round(wall, 2),
+        'errors_sample': list(dict.fromkeys(s['error'] for s in samples if 'error' in s))[:5],
+    }
+
+def _sample_queues(client: GraphQLClient, stop: threading.Event, out: List[int], interval: float) -> None:
+    """Profundidad total de las colas (queueStats) durante el escalón."""
+    while not stop.wait(interval):
+        try:
+            out.append(sum(q['depth'] for q in client.queue_stats()))
+        except Exception:
+            pass
+
+def run_stage(client: GraphQLClient, items: List[Dict[str, Any]], rate: float,
+              args: argparse.Namespace, rng: random.Random) -> Dict[str, Any]:
+    """Un escalón de carga: lazo abierto a `rate` documentos/s, o lazo cerrado si rate == 0."""
+    weights = [item['weight'] for item in items]
+    pick = lambda: rng.choices(items, weights=weights)[0]
+    samples: List[Dict[str, Any]] = []
+    queue_samples: List[int] = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_queues, args=(client, stop, queue_samples, args.queue_interval),
+                               daemon=True)
+    sampler.start()
+
+    start = time.time()
+    end = start + args.stage_seconds
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        if rate > 0:
+            futures = []
+            next_at = start
+            while True:
+                next_at += rng.expovariate(rate)
+                if next_at >= end:
+                    break
+                time.sleep(max(0.0, next_at - time.time()))
+                futures.append(executor.submit(run_document, client, pick(), next_at, args))
+            wait(futures)
+            samples = [f.result() for f in futures]
+        else:
+            lock = threading.Lock()
+            def closed_loop():
+                while time.time() < end:
+                    sample = run_document(client, pick(), time.time(), args)
+                    with lock:
+                        samples.append(sample)
+            for future in [executor.submit(closed_loop) for _ in range(args.concurrency)]:
+                future.result()
+
+    stop.set()
+    sampler.join()
+    return summarize(samples, rate or None, args.stage_seconds, time.time() - start, queue_samples)
+
+def find_saturation(stages: List[Dict[str, Any]], max_error_rate: float) -> Optional[Dict[str, Any]]:
+    """
+    Primer escalón saturado: el throughput no alcanza el 90% de la tasa de llegada, el p95 end-to-end
+    duplica al del primer escalón o la tasa de errores supera el máximo.
+    """
+    base_p95 = stages[0]['e2e'].get('p95_ms') if stages else None
+    for stage in stages:
+        reasons = []
+        arrivals = stage['arrival_rate_per_s']
+        if arrivals and stage['throughput_per_s'] is not None and stage['throughput_per_s'] < 0.9 * arrivals:
+            reasons.append('throughput')
+        p95 = stage['e2e'].get('p95_ms')
+        if base_p95 and p95 and p95 > 2 * base_p95:
+            reasons.append('latency')
+        if stage['error_rate'] and stage['error_rate'] > max_error_rate:
+            reasons.append('errors')
+        if reasons:
+            return {'offered_rate_per_s': stage['offered_rate_per_s'], 'arrival_rate_per_s': arrivals,
+                    'throughput_per_s': stage['throughput_per_s'],
+                    'reasons': reasons}
+    return None
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prueba de carga end-to-end de scanDocument/getOcrResult.")
+    parser.add_argument('--url', default=f"http://localhost:{os.getenv('PORT', '8000')}/graphql", help="Endpoint GraphQL")
+    parser.add_argument('--api-key', help="API key del cliente (ADMISSION_CLIENT_LIMITS define su token bucket)")
+    parser.add_argument('--rates', default='0', help="Tasas de llegada por escalón (docs/s), separadas por coma; 0 = lazo cerrado")
+    parser.add_argument('--concurrency', type=int, default=8, help="Documentos en vuelo como máximo")
+    parser.add_argument('--stage-seconds', type=float, default=60, help="Duración de cada escalón")
+    parser.add_argument('--mix', help="JSONL con la mezcla de doc_types y archivos a reproducir")
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="Intervalo de consulta de getOcrResult")
+    parser.add_argument('--queue-interval', type=float, default=1.0, help="Intervalo de muestreo de queueStats")
+    parser.add_argument('--timeout', type=float, default=300, help="Tiempo máximo por documento")
+    parser.add_argument('--max-error-rate', type=float, default=0.05, help="Tasa de errores que marca saturación")
+    parser.add_argument('--no-unique', dest='unique', action='store_false',
+                        help="Enviar los archivos sin modificar (el single-flight colapsa repetidos)")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla de la mezcla y de las llegadas")
+    parser.add_argument('--output', help="Ruta del JSON de resultados (por defecto stdout)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    rates = [float(r) for r in args.rates.split(',') if r.strip()]
+    client = GraphQLClient(args.url, api_key=args.api_key)
+    rng = random.Random(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix='avanza_load_')
+    try:
+        items = load_mix(args.mix, workdir, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = []
+    for rate in rates:
+        label = f"{rate:g} docs/s" if rate else f"lazo cerrado x{args.concurrency}"
+        print(f"-> escalón {label} ({args.stage_seconds:g}s)", file=sys.stderr)
+        stages.append(run_stage(client, items, rate, args, rng))
+
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'url': args.url,
+            'concurrency': args.concurrency,
+            'stage_seconds': args.stage_seconds,
+            'mix': args.mix or 'synthetic',
+            'doc_types': sorted({item['doc_type'] for item in items}),
+            'seed': args.seed,
+        },
+        'stages': stages,
+        'saturation': find_saturation(stages, args.max_error_rate),
+    }
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
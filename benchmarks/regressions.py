@@ -0,0 +1,99 @@
+"""
+Regresiones de comportamiento sobre el corpus sintético (requiere Redis).
+
+Cada verificación reproduce un error ya corregido y falla si vuelve a aparecer. Pensado para CI:
+
+    python -m benchmarks.regressions
+"""
+import os
+import sys
+import tempfile
+import uuid
+from typing import Callable, List, Optional
+
+from app.core.near_duplicates import NearDuplicateIndex
+from app.core.layout_store import LayoutStore
+from app.core.redis_client import get_redis
+from app.services.image_decoder import ImageDecoder
+from app.services.image_processing import ImagePreprocessor
+from benchmarks.synthetic import SyntheticDocuments
+
+def _card_hashes(path: str):
+    image = ImageDecoder.decode(path)
+    processed, _ = ImagePreprocessor.enhance_image(image)
+    return ImagePreprocessor.perceptual_hash(processed), LayoutStore.content_hash(path)
+
+def distinct_cards_not_reused() -> List[str]:
+    """
+    Dos DPI sintéticos de personas distintas tienen pHash casi iguales (misma plantilla):
+    el segundo puede marcarse como casi-duplicado, pero nunca debe recibir la extracción del primero.
+    """
+    doc_type = f"DPI-regression-{uuid.uuid4().hex[:8]}"
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        first_path = SyntheticDocuments.dpi_front(os.path.join(tmp, 'first.jpg'), seed=1)
+        second_path = SyntheticDocuments.dpi_front(os.path.join(tmp, 'second.jpg'), seed=2)
+        first_phash, first_sha = _card_hashes(first_path)
+        second_phash, second_sha = _card_hashes(second_path)
+        try:
+            NearDuplicateIndex.add(doc_type, first_phash, first_sha, {
+                'status': 'SUCCESS', 'data': {'CUI': 'primera'}, 'meta': {'isValid': True, 'score': 100}})
+            duplicate = NearDuplicateIndex.lookup(doc_type, second_phash)
+            distance = (first_phash ^ second_phash).bit_count()
+            print(f"pHash: distancia {distance}, marcado como casi-duplicado: {duplicate is not None}",
+                  file=sys.stderr)
+            if duplicate and 'result' in duplicate:
+                errors.append("el índice de pHash expone una extracción reutilizable")
+            if NearDuplicateIndex.exact(doc_type, second_sha) is not None:
+                errors.append("la segunda tarjeta reutiliza la extracción de la primera")
+            if NearDuplicateIndex.exact(doc_type, first_sha) is None:
+                errors.append("el mismo archivo no reutiliza su propia extracción")
+        finally:
+            r = get_redis()
+            keys = list(r.scan_iter(f"{NearDuplicateIndex.PREFIX}:{doc_type}:*"))
+            if keys:
+                r.delete(*keys)
+    return errors
+
+def distinct_cards_not_flagged() -> List[str]:
+    """
+    DPI de personas distintas caen dentro de PHASH_MAX_DISTANCE entre sí: el parecido no debe acumular
+    repeticiones (revisión de fraude); sólo las capturas del mismo titular (CUI) cuentan.
+    """
+    doc_type = f"DPI-regression-{uuid.uuid4().hex[:8]}"
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for seed in range(6):
+                phash, _ = _card_hashes(SyntheticDocuments.dpi_front(os.path.join(tmp, f'{seed}.jpg'), seed=seed))
+                duplicate = NearDuplicateIndex.lookup(doc_type, phash)
+                if duplicate and 'seen' in duplicate:
+                    errors.append("el índice de pHash cuenta repeticiones de tarjetas parecidas")
+                seen = NearDuplicateIndex.count_identity(doc_type, f"CUI-{seed}")
+                if seen != 1:
+                    errors.append(f"la tarjeta {seed} acumula {seen} capturas de otros titulares")
+                NearDuplicateIndex.add(doc_type, phash)
+            repeats = [NearDuplicateIndex.count_identity(doc_type, "CUI-0") for _ in range(2)]
+            if repeats != [2, 3]:
+                errors.append(f"las capturas del mismo titular no se cuentan: {repeats}")
+        finally:
+            r = get_redis()
+            keys = list(r.scan_iter(f"{NearDuplicateIndex.PREFIX}:{doc_type}:*"))
+            if keys:
+                r.delete(*keys)
+    return errors
+
+CHECKS: List[Callable[[], List[str]]] = [distinct_cards_not_reused, distinct_cards_not_flagged]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    errors = []
+    for check in CHECKS:
+        found = check()
+        print(f"{check.__name__}: {'FALLA' if found else 'OK'}", file=sys.stderr)
+        errors.extend(f"{check.__name__}: {error}" for error in found)
+    for error in errors:
+        print(f"FALLA: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
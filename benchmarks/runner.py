@@ -0,0 +1,209 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import peak_rss_bytes, reset_peak_rss
+from app.services.image_decoder import ImageDecoder
+from app.services.image_processing import ImagePreprocessor
+from app.services.pdf_parser import PDFParser
+from app.services.qr_service import QREngine
+from app.services.quality_gate import ImageQualityGate
+from app.services.validators import DocumentValidator
+from benchmarks.synthetic import SyntheticDocuments
+
+PERCENTILES = (50, 90, 95, 99)
+
+def peak_rss_mb() -> float:
+    return round(peak_rss_bytes() / (1024 * 1024), 1)
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int,
+            teardown: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Ejecuta fn N veces (tras el calentamiento) y resume latencias, throughput y memoria."""
+    # Pico de RSS por caso (en Linux); en otras plataformas es el histórico del proceso
+    reset_peak_rss()
+    for _ in range(warmup):
+        fn()
+        if teardown: teardown()
+
+    samples = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        if teardown: teardown()
+    wall = time.perf_counter() - wall_start
+
+    latencies_ms = np.array(samples) * 1000
+    summary = {
+        'iterations': iterations,
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'min_ms': round(float(latencies_ms.min()), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(float(np.percentile(latencies_ms, p)), 3)
+    # Throughput sobre el total de latencias (excluye teardown)
+    summary['throughput_per_s'] = round(iterations / sum(samples), 3) if sum(samples) else None
+    summary['wall_s'] = round(wall, 3)
+    summary['peak_rss_mb'] = peak_rss_mb()
+    return summary
+
+def _remove_outputs(image_path: str) -> Callable[[], None]:
+    """Limpia los intermedios que genera enhance_document junto a la imagen de entrada."""
+    def teardown():
+        for suffix in ('.warped.jpg', '.proc.jpg'):
+            if os.path.exists(image_path + suffix):
+                os.remove(image_path + suffix)
+    return teardown
+
+def build_cases(corpus: Dict[str, tuple], with_engine: bool) -> Dict[str, Dict[str, Any]]:
+    """
+    Arma los casos de benchmark: cada servicio por separado y el pipeline completo.
+    Retorna {nombre: {'fn': callable, 'teardown': callable|None}} o {'skipped': motivo}.
+    """
+    cases: Dict[str, Dict[str, Any]] = {}
+
+    for name, (path, doc_type) in corpus.items():
+        if path.endswith('.pdf'):
+            text = PDFParser.extract_text_content(path)
+            cases[f'pdf.extract_text/{name}'] = {'fn': lambda p=path: PDFParser.extract_text_content(p)}
+            cases[f'pdf.get_page_image/{name}'] = {'fn': lambda p=path: PDFParser.get_page_image(p, page_number=0)}
+            cases[f'validator.validate/{name}'] = {'fn': lambda t=text, d=doc_type: DocumentValidator.validate(t, d)}
+            if doc_type == 'RTU':
+                cases[f'pdf.parse_rtu/{name}'] = {'fn': lambda t=text: PDFParser.parse_rtu(t)}
+            elif doc_type == 'PATENTE':
+                cases[f'pdf.parse_patente/{name}'] = {'fn': lambda t=text: PDFParser.parse_patente(t)}
+                page = PDFParser.get_page_image(path, page_number=0)
+                cases[f'qr.scan_qr/{name}'] = {'fn': lambda img=page: QREngine.scan_qr(img)}
+        else:
+            cases[f'image.decode/{name}'] = {'fn': lambda p=path: ImageDecoder.decode(p)}
+            cases[f'image.quality_gate/{name}'] = {'fn': lambda p=path, d=doc_type: ImageQualityGate.assess_file(p, d)}
+            cases[f'image.enhance_document/{name}'] = {
+                'fn': lambda p=path: ImagePreprocessor.enhance_document(p),
+                'teardown': _remove_outputs(path),
+            }
+
+    engine = None
+    skip_reason = None
+    if with_engine:
+        try:
+            from app.services.ocr_engine import OCREngine
+            engine = OCREngine()
+        except Exception as e:  # PaddleOCR no instalado o modelos ausentes
+            skip_reason = f"OCREngine no disponible: {e}"
+    else:
+        skip_reason = "Desactivado con --skip-engine"
+
+    for name, (path, doc_type) in corpus.items():
+        key = f'engine.process_document/{name}'
+        if engine is None:
+            cases[key] = {'skipped': skip_reason}
+        else:
+            cases[key] = {'fn': lambda p=path, d=doc_type: engine.process_document(p, d)}
+
+    return cases
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=settings.BASE_DIR, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = args.workdir or tempfile.mkdtemp(prefix='avanza_bench_')
+    establishments = tuple(int(n) for n in args.establishments.split(',') if n.strip())
+    corpus = SyntheticDocuments.build_corpus(workdir, seed=args.seed, establecimientos=establishments,
+                                             image_width=args.image_width)
+
+    results: Dict[str, Any] = {}
+    try:
+        cases = build_cases(corpus, with_engine=not args.skip_engine)
+        for name, case in cases.items():
+            if args.cases and not any(fnmatch.fnmatch(name, pattern) for pattern in args.cases):
+                continue
+            if 'skipped' in case:
+                results[name] = {'skipped': case['skipped']}
+                continue
+            print(f"-> {name}", file=sys.stderr)
+            results[name] = measure(case['fn'], args.iterations, args.warmup, case.get('teardown'))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'image_width': args.image_width,
+            'establishments': list(establishments),
+            'ocr_backend': settings.OCR_BACKEND,
+            'ocr_cpu_threads': settings.OCR_CPU_THREADS,
+            'ocr_quantized': settings.OCR_QUANTIZED,
+            'ocr_cascade': settings.OCR_CASCADE_ENABLED,
+        },
+        'results': results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Genera un resumen legible de la variación de p50/p95 contra un JSON previo."""
+    lines = [f"{'caso':<60} {'p50 base':>10} {'p50 act':>10} {'Δ%':>7} {'p95 Δ%':>7}"]
+    for name, cur in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'p50_ms' not in cur or 'p50_ms' not in base:
+            continue
+        d50 = (cur['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0.0
+        d95 = (cur['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0.0
+        lines.append(f"{name:<60} {base['p50_ms']:>10.2f} {cur['p50_ms']:>10.2f} {d50:>+7.1f} {d95:>+7.1f}")
+    return lines
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark reproducible del pipeline AvanzaOCR con documentos sintéticos.")
+    parser.add_argument('--iterations', type=int, default=20, help="Iteraciones medidas por caso")
+    parser.add_argument('--warmup', type=int, default=2, help="Iteraciones de calentamiento (no medidas)")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla del generador sintético")
+    parser.add_argument('--establishments', default='1,10', help="Establecimientos por RTU, separados por coma")
+    parser.add_argument('--image-width', type=int, default=2400, help="Ancho en px de las fotos de DPI")
+    parser.add_argument('--cases', nargs='*', help="Patrones glob para filtrar casos (ej. 'pdf.*')")
+    parser.add_argument('--skip-engine', action='store_true', help="No medir OCREngine.process_document")
+    parser.add_argument('--workdir', help="Conservar el corpus generado en este directorio")
+    parser.add_argument('--output', help="Ruta del JSON de resultados (por defecto stdout)")
+    parser.add_argument('--compare', help="JSON de una corrida previa para comparar p50/p95")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)), file=sys.stderr)
+    return 0
@@ -0,0 +1,294 @@
+import os
+import random
+from typing import List, Optional, Tuple
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+# Catálogos para generar datos plausibles (y deterministas con la semilla)
+NOMBRES = ['JUAN', 'MARIA', 'CARLOS', 'ANA', 'JOSE', 'LUCIA', 'PEDRO', 'SOFIA']
+APELLIDOS = ['LOPEZ', 'GARCIA', 'PEREZ', 'MORALES', 'HERNANDEZ', 'CASTILLO', 'RAMIREZ']
+DEPARTAMENTOS = ['GUATEMALA', 'SACATEPEQUEZ', 'QUETZALTENANGO', 'ESCUINTLA', 'PETEN']
+MUNICIPIOS = ['MIXCO', 'VILLA NUEVA', 'ANTIGUA GUATEMALA', 'SAN JUAN SACATEPEQUEZ']
+COMERCIOS = ['TIENDA', 'FERRETERIA', 'FARMACIA', 'LIBRERIA', 'PANADERIA', 'COMEDOR']
+MESES = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SEP', 'OCT', 'NOV', 'DIC']
+
+class SyntheticDocuments:
+    """
+    Generador de documentos guatemaltecos sintéticos para benchmarks reproducibles.
+    Produce DPI (frontal/posterior) como fotografías, RTU y Patentes como PDFs nativos.
+    Con la misma semilla se obtienen exactamente los mismos archivos.
+    """
+
+    CARD_SIZE = (856, 540)  # Proporción CR80 (tarjeta de identificación)
+
+    # ==========================================================
+    # DPI (Imágenes)
+    # ==========================================================
+    @staticmethod
+    def dpi_front(output_path: str, seed: int = 0, width: int = 2400) -> str:
+        """Genera la foto de un DPI frontal sobre un fondo oscuro (cámara de celular)."""
+        rng = random.Random(seed)
+        card = SyntheticDocuments._blank_card(rng)
+        cui = f"{rng.randint(1000, 9999)} {rng.randint(10000, 99999)} {rng.randint(100, 2299):04d}"
+        lines = [
+            ((40, 50), "REPUBLICA DE GUATEMALA", 0.9),
+            ((40, 85), "DOCUMENTO PERSONAL DE IDENTIFICACION", 0.7),
+            ((40, 140), f"CUI {cui}", 0.9),
+            ((330, 200), "NOMBRE", 0.55),
+            ((330, 235), f"{rng.choice(NOMBRES)} {rng.choice(NOMBRES)}", 0.8),
+            ((330, 285), "APELLIDO", 0.55),
+            ((330, 320), f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}", 0.8),
+            ((330, 370), "NACIONALIDAD GTM", 0.6),
+            ((330, 410), f"FECHA DE NACIMIENTO {rng.randint(1, 28):02d}{rng.choice(MESES)}{rng.randint(1950, 2004)}", 0.6),
+            ((330, 450), f"SEXO {rng.choice(['MASCULINO', 'FEMENINO'])}", 0.6),
+        ]
+        for org, text, scale in lines:
+            cv2.putText(card, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), 2, cv2.LINE_AA)
+        # Recuadro de fotografía
+        cv2.rectangle(card, (40, 180), (290, 480), (150, 150, 150), -1)
+        return SyntheticDocuments._photograph(card, output_path, rng, width)
+
+    @staticmethod
+    def dpi_back(output_path: str, seed: int = 0, width: int = 2400) -> str:
+        """Genera la foto de un DPI posterior con zona MRZ."""
+        rng = random.Random(seed)
+        card = SyntheticDocuments._blank_card(rng)
+        vencimiento = f"{rng.randint(1, 28):02d}{rng.choice(MESES)}{rng.randint(2026, 2034)}"
+        lines = [
+            ((40, 50), "LUGAR DE NACIMIENTO", 0.55),
+            ((40, 85), f"{rng.choice(DEPARTAMENTOS)}, {rng.choice(MUNICIPIOS)}", 0.7),
+            ((40, 130), "VECINDAD", 0.55),
+            ((40, 165), f"{rng.choice(DEPARTAMENTOS)}, {rng.choice(MUNICIPIOS)}", 0.7),
+            ((40, 210), "ESTADO CIVIL", 0.55),
+            ((40, 245), rng.choice(['SOLTERO', 'CASADO']), 0.7),
+            ((40, 290), "FECHA DE VENCIMIENTO", 0.55),
+            ((40, 325), vencimiento, 0.7),
+            ((600, 50), "RENAP", 0.8),
+        ]
+        for org, text, scale in lines:
+            cv2.putText(card, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), 2, cv2.LINE_AA)
+
+        # Zona MRZ (3 líneas de 30 caracteres, fuente monoespaciada)
+        doc_num = ''.join(str(rng.randint(0, 9)) for _ in range(9))
+        mrz = [
+            f"IDGTM{doc_num}<<<<<<<<<<<<<<<<"[:30],
+            f"{rng.randint(50, 99)}0101{rng.randint(0, 9)}M{rng.randint(26, 34)}0101{rng.randint(0, 9)}GTM<<<<<<<<<<<"[:30],
+            f"{rng.choice(APELLIDOS)}<<{rng.choice(NOMBRES)}<<<<<<<<<<<<<<<<<<<<"[:30],
+        ]
+        for i, line in enumerate(mrz):
+            cv2.putText(card, line, (40, 410 + i * 40), cv2.FONT_HERSHEY_PLAIN, 2.0, (10, 10, 10), 2, cv2.LINE_AA)
+        return SyntheticDocuments._photograph(card, output_path, rng, width)
+
+    @staticmethod
+    def _blank_card(rng: random.Random) -> np.ndarray:
+        w, h = SyntheticDocuments.CARD_SIZE
+        card = np.full((h, w, 3), (235, 228, 220), dtype=np.uint8)
+        # Franja de seguridad suave para que el fondo no sea plano
+        cv2.rectangle(card, (0, h - 30), (w, h), (rng.randint(180, 210), 200, 230), -1)
+        return card
+
+    @staticmethod
+    def _photograph(card: np.ndarray, output_path: str, rng: random.Random, width: int) -> str:
+        """Coloca la tarjeta con leve perspectiva sobre una mesa oscura y añade ruido de sensor."""
+        height = int(width * 0.75)
+        scene = np.full((height, width, 3), (45, 40, 38), dtype=np.uint8)
+
+        w, h = SyntheticDocuments.CARD_SIZE
+        target_w = width * 0.7
+        scale = target_w / w
+        cx, cy = width / 2, height / 2
+        half_w, half_h = target_w / 2, h * scale / 2
+
+        def jitter() -> float:
+            return rng.uniform(-0.03, 0.03) * target_w
+
+        dst = np.array([
+            [cx - half_w + jitter(), cy - half_h + jitter()],
+            [cx + half_w + jitter(), cy - half_h + jitter()],
+            [cx + half_w + jitter(), cy + half_h + jitter()],
+            [cx - half_w + jitter(), cy + half_h + jitter()],
+        ], dtype="float32")
+        src = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+
+        M = cv2.getPerspectiveTransform(src, dst)
+        cv2.warpPerspective(card, M, (width, height), dst=scene, borderMode=cv2.BORDER_TRANSPARENT)
+
+        noise = np.random.default_rng(rng.randint(0, 2 ** 32 - 1)).normal(0, 6, scene.shape)
+        scene = np.clip(scene.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+        cv2.imwrite(output_path, scene, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return output_path
+
+    # ==========================================================
+    # RTU (PDF nativo)
+    # ==========================================================
+    @staticmethod
+    def rtu_pdf(output_path: str, tipo: str = 'INDIVIDUAL', establecimientos: int = 1, seed: int = 0) -> str:
+        """
+        Genera una Constancia de Inscripción RTU de SAT.
+        tipo: 'INDIVIDUAL' (pequeño contribuyente) o 'SOCIEDAD' (persona jurídica).
+        """
+        rng = random.Random(seed)
+        nit = f"{rng.randint(1000000, 99999999)}-{rng.randint(0, 9)}"
+        lines = [
+            "SUPERINTENDENCIA DE ADMINISTRACION TRIBUTARIA",
+            "CONSTANCIA DE INSCRIPCION Y ACTUALIZACION DE DATOS AL REGISTRO TRIBUTARIO UNIFICADO",
+            f"SAT NIT: {nit}",
+            "",
+            "DATOS DE IDENTIFICACIÓN",
+        ]
+
+        if tipo == 'SOCIEDAD':
+            lines += [
+                "Razón o denominación social:", f"{rng.choice(COMERCIOS)} {rng.choice(APELLIDOS)}, SOCIEDAD ANONIMA",
+                "Nombre del representante:", f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+                "Fecha de constitución:", f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1990, 2020)}",
+            ]
+        else:
+            lines += [
+                "Primer nombre:", rng.choice(NOMBRES),
+                "Segundo nombre:", rng.choice(NOMBRES),
+                "Primer apellido:", rng.choice(APELLIDOS),
+                "Segundo apellido:", rng.choice(APELLIDOS),
+                "Código Único de Identificación:", f"{rng.randint(1000, 9999)}{rng.randint(10000, 99999)}{rng.randint(100, 2299):04d}",
+                "Fecha de Nacimiento:", f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2004)}",
+                "Estado civil:", rng.choice(['SOLTERO', 'CASADO']),
+                "Nacionalidad:", "GUATEMALTECA",
+            ]
+
+        lines += ["", "UBICACIÓN"] + SyntheticDocuments._address_lines(rng)
+        lines += [
+            "", "ACTIVIDAD ECONÓMICA",
+            f"{rng.randint(1000, 9999)}.{rng.randint(10, 99)}", "VENTA AL POR MENOR DE PRODUCTOS DIVERSOS",
+            "Clasificación: PRINCIPAL",
+            "", "ESTABLECIMIENTOS",
+        ]
+
+        for i in range(establecimientos):
+            lines += [
+                "Nombre Comercial:", f"{rng.choice(COMERCIOS)} {rng.choice(APELLIDOS)} {i + 1}",
+                "Número de secuencia de establecimiento:", str(i + 1),
+                "Tipo de establecimiento:", "COMERCIAL",
+                "Clasificación por establecimiento:", "ACTIVO",
+                "Fecha Inicio de Operaciones:", f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2000, 2024)}",
+            ] + SyntheticDocuments._address_lines(rng) + [""]
+
+        lines += ["AFILIACIONES", "Forma de cálculo del IVA:", "PEQUEÑO CONTRIBUYENTE" if tipo != 'SOCIEDAD' else "GENERAL"]
+        for impuesto in ['IMPUESTO AL VALOR AGREGADO', 'IMPUESTO SOBRE LA RENTA', 'IMPUESTO DE SOLIDARIDAD']:
+            lines += ["Nombre de Impuesto:", impuesto, "Régimen:", rng.choice(['GENERAL', 'OPCIONAL SIMPLIFICADO'])]
+
+        lines += ["", "DATOS DEL CONTADOR", f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}"]
+
+        SyntheticDocuments._write_pdf(output_path, lines)
+        return output_path
+
+    @staticmethod
+    def _address_lines(rng: random.Random) -> List[str]:
+        return [
+            "Departamento:", rng.choice(DEPARTAMENTOS),
+            "Municipio:", rng.choice(MUNICIPIOS),
+            "Zona:", str(rng.randint(1, 21)),
+            "Vialidad:", rng.choice(['CALLE', 'AVENIDA']),
+            "Número de vialidad:", str(rng.randint(1, 40)),
+            "Número y letra de casa:", f"{rng.randint(1, 99)}-{rng.randint(1, 99)}",
+            "Colonia o Barrio:", f"COLONIA {rng.choice(APELLIDOS)}",
+        ]
+
+    # ==========================================================
+    # PATENTE (PDF nativo + QR)
+    # ==========================================================
+    @staticmethod
+    def patente_pdf(output_path: str, tipo: str = 'EMPRESA', seed: int = 0,
+                    qr_url: Optional[str] = None) -> str:
+        """
+        Genera una Patente de Comercio (EMPRESA o SOCIEDAD) con el QR del Registro Mercantil.
+        Por defecto el QR apunta a un host local inalcanzable para no golpear el sitio oficial.
+        """
+        rng = random.Random(seed)
+        registro, folio, libro = rng.randint(10000, 999999), rng.randint(1, 500), rng.randint(1, 900)
+        expediente = f"{rng.randint(1000, 99999)}-{rng.randint(2000, 2024)}"
+        qr_url = qr_url or f"http://127.0.0.1:9/registro?registro={registro}&folio={folio}&libro={libro}"
+
+        if tipo == 'SOCIEDAD':
+            lines = [
+                "REGISTRO MERCANTIL GENERAL DE LA REPUBLICA", "Patente de Comercio de Sociedad",
+                "Registro", str(registro), "Folio", str(folio), "Libro", str(libro),
+                "Expediente", expediente,
+                "La Sociedad", f"{rng.choice(COMERCIOS)} {rng.choice(APELLIDOS)}, SOCIEDAD ANONIMA",
+                "Dirección de la Entidad", f"{rng.randint(1, 20)} CALLE {rng.randint(1, 99)}-{rng.randint(1, 99)} ZONA {rng.randint(1, 21)}",
+            ]
+        else:
+            lines = [
+                "REGISTRO MERCANTIL GENERAL DE LA REPUBLICA", "Patente de Comercio de Empresa",
+                "Registro No.", str(registro), "Folio No.", str(folio), "Libro No.", str(libro),
+                "Expediente No.", expediente,
+                "La Empresa Mercantil", f"{rng.choice(COMERCIOS)} {rng.choice(APELLIDOS)}",
+                "Nombre Propietario (s)", f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+                "Dirección comercial", f"{rng.randint(1, 20)} AVENIDA {rng.randint(1, 99)}-{rng.randint(1, 99)} ZONA {rng.randint(1, 21)}",
+            ]
+
+        qr_png = SyntheticDocuments.qr_png(qr_url)
+        SyntheticDocuments._write_pdf(output_path, lines, qr_png=qr_png)
+        return output_path
+
+    @staticmethod
+    def qr_png(content: str, module_px: int = 6) -> bytes:
+        """Codifica un QR con OpenCV y lo devuelve como PNG (con zona de silencio)."""
+        matrix = cv2.QRCodeEncoder.create().encode(content)
+        matrix = cv2.copyMakeBorder(matrix, 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=255)
+        matrix = cv2.resize(matrix, None, fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+        ok, buf = cv2.imencode(".png", matrix)
+        if not ok:
+            raise RuntimeError("No se pudo codificar el QR sintético")
+        return buf.tobytes()
+
+    # ==========================================================
+    # Utilidades PDF
+    # ==========================================================
+    @staticmethod
+    def _write_pdf(output_path: str, lines: List[str], qr_png: Optional[bytes] = None) -> None:
+        """Escribe líneas de texto en páginas carta, paginando automáticamente."""
+        page_w, page_h = fitz.paper_size("letter")
+        margin, line_h, font_size = 50, 13, 9
+
+        doc = fitz.open()
+        page = doc.new_page(width=page_w, height=page_h)
+        if qr_png:
+            page.insert_image(fitz.Rect(page_w - margin - 110, margin, page_w - margin, margin + 110), stream=qr_png)
+
+        y = margin + font_size
+        for line in lines:
+            if y > page_h - margin:
+                page = doc.new_page(width=page_w, height=page_h)
+                y = margin + font_size
+            if line:
+                page.insert_text((margin, y), line, fontname="helv", fontsize=font_size)
+            y += line_h
+
+        doc.save(output_path)
+        doc.close()
+
+    # ==========================================================
+    # Corpus completo
+    # ==========================================================
+    @staticmethod
+    def build_corpus(output_dir: str, seed: int = 0, establecimientos: Tuple[int, ...] = (1, 10),
+                     image_width: int = 2400) -> dict:
+        """
+        Genera el set estándar de documentos y retorna {nombre_caso: (ruta, doc_type)}.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        corpus = {
+            'dpi_front': (SyntheticDocuments.dpi_front(os.path.join(output_dir, 'dpi_front.jpg'), seed, image_width), 'DPI_FRONT'),
+            'dpi_back': (SyntheticDocuments.dpi_back(os.path.join(output_dir, 'dpi_back.jpg'), seed, image_width), 'DPI_BACK'),
+            'patente_empresa': (SyntheticDocuments.patente_pdf(os.path.join(output_dir, 'patente_empresa.pdf'), 'EMPRESA', seed), 'PATENTE'),
+            'patente_sociedad': (SyntheticDocuments.patente_pdf(os.path.join(output_dir, 'patente_sociedad.pdf'), 'SOCIEDAD', seed), 'PATENTE'),
+        }
+        for n in establecimientos:
+            for tipo in ('INDIVIDUAL', 'SOCIEDAD'):
+                name = f"rtu_{tipo.lower()}_{n}est"
+                path = SyntheticDocuments.rtu_pdf(os.path.join(output_dir, f"{name}.pdf"), tipo, n, seed)
+                corpus[name] = (path, 'RTU')
+        return corpus
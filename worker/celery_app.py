@@ -1,5 +1,12 @@
+import time
+import socket
 from celery import Celery
+from kombu import Exchange, Queue
+from celery.signals import worker_ready, worker_process_shutdown, task_prerun, task_postrun, celeryd_after_setup
 from app.core.config import settings
+from app.core.result_store import ResultStore  # Registra los serializadores msgpack_zstd/json_zstd
+from app.core.metrics import start_exporter, mark_process_dead
+from app.core.queue_stats import QueueStats
 
 celery_app = Celery(
     "avanza_ocr_worker",
@@ -11,15 +18,82 @@ celery_app = Celery(
 # Configuración optimizada para IA
 celery_app.conf.update(
     task_serializer="json",
-    result_serializer="json",
+    result_serializer=settings.RESULT_SERIALIZER,
     accept_content=["json"],
+    result_accept_content=["json", "msgpack_zstd", "json_zstd"],
+    result_expires=settings.RESULT_TTL_DEFAULT_S,
     timezone="America/Guatemala",
     enable_utc=True,
     worker_prefetch_multiplier=1, # IMPORTANTE: 1 a la vez para no saturar RAM con la IA
+    # prefork: un modelo por proceso hijo. threads: un proceso con OCR_PREDICTOR_POOL_SIZE predictores compartidos
+    worker_pool=settings.CELERY_WORKER_POOL,
+    worker_concurrency=settings.CELERY_WORKER_CONCURRENCY,
     task_acks_late=True,
     broker_connection_retry_on_startup=True,
     # Aislamiento de Cola
-    task_default_queue="avanza_ocr_queue",
+    task_default_queue=settings.CELERY_DEFAULT_QUEUE,
     task_default_exchange="avanza_ocr_exchange",
-    task_default_routing_key="avanza_ocr_key",
-)
\ No newline at end of file
+    task_default_routing_key=settings.CELERY_DEFAULT_ROUTING_KEY,
+    # Una cola por modo (FAST / BALANCED / ACCURATE): workers dedicados con `-Q <cola>`
+    task_queues=[
+        Queue(queue, Exchange("avanza_ocr_exchange", type="direct"), routing_key=routing_key)
+        for queue, routing_key in QueueStats.mode_routes().values()
+    ],
+    # Janitor del almacenamiento temporal (requiere `celery -A worker.celery_app beat`)
+    beat_schedule={
+        "sweep-temp-storage": {
+            "task": "tasks.sweep_temp_storage",
+            "schedule": settings.TEMP_JANITOR_INTERVAL_S,
+        },
+    },
+)
+
+# Exportador de métricas del worker (en prefork requiere PROMETHEUS_MULTIPROC_DIR)
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    if settings.WORKER_METRICS_PORT:
+        start_exporter(settings.WORKER_METRICS_PORT)
+
+@worker_process_shutdown.connect
+def cleanup_process_metrics(pid=None, **kwargs):
+    if pid:
+        mark_process_dead(pid)
+
+# TTL por doc_type: se aplica sobre la clave ya guardada (result_expires es global)
+@task_postrun.connect
+def apply_result_ttl(task_id=None, task=None, args=None, kwargs=None, **extra):
+    if task is None or task.name != "tasks.process_document_ton":
+        return
+    doc_type = (kwargs or {}).get("doc_type") or (args[1] if args and len(args) > 1 else None)
+    ttl = ResultStore.ttl_for(doc_type)
+    if ttl != settings.RESULT_TTL_DEFAULT_S and hasattr(task.backend, "expire"):
+        task.backend.expire(task.backend.get_key_for_task(task_id), ttl)
+
+# Introspección de colas: capacidad del worker (se hereda en los procesos hijos del prefork)
+_worker_info = {"hostname": socket.gethostname(), "concurrency": 1, "queues": []}
+_task_started: dict = {}
+
+@celeryd_after_setup.connect
+def capture_worker_info(sender=None, instance=None, **kwargs):
+    _worker_info["hostname"] = sender or _worker_info["hostname"]
+    _worker_info["concurrency"] = getattr(instance, "concurrency", None) or 1
+    try:
+        consume_from = instance.app.amqp.queues.consume_from or instance.app.amqp.queues
+        _worker_info["queues"] = list(consume_from.keys())
+    except Exception:
+        _worker_info["queues"] = []
+
+@task_prerun.connect
+def track_task_start(task_id=None, task=None, **kwargs):
+    if task is None or task.name != "tasks.process_document_ton":
+        return
+    _task_started[task_id] = time.monotonic()
+    QueueStats.record_start(QueueStats.queue_for(task.request.delivery_info), task_id,
+                            _worker_info["hostname"], _worker_info["concurrency"], _worker_info["queues"])
+
+@task_postrun.connect
+def track_task_finish(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if task is None or started is None:
+        return
+    QueueStats.record_finish(QueueStats.queue_for(task.request.delivery_info), task_id, time.monotonic() - started)
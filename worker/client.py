@@ -0,0 +1,47 @@
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery import chord
+from celery.canvas import Signature
+from celery.result import AsyncResult
+
+from app.core.queue_stats import QueueStats
+from .celery_app import celery_app
+
+# Cliente liviano para la API: encola por nombre (send_task) sin importar worker.tasks,
+# que arrastra OCREngine y con él paddleocr, OpenCV y PyMuPDF al proceso de FastAPI.
+PROCESS_DOCUMENT = "tasks.process_document_ton"
+CONSOLIDATE_BUNDLE = "tasks.consolidate_bundle"
+REPARSE_DOCUMENT = "tasks.reparse_document"
+
+def enqueue_document(file_path: str, doc_type: str, task_id: Optional[str] = None, mode: Optional[str] = None,
+                     **kwargs: Any) -> AsyncResult:
+    """
+    Encola el procesamiento de un documento (mismos argumentos que tasks.process_document_ton).
+    Con `mode` la tarea va a la cola de ese modo (ver QueueStats.mode_routes); sin él, a la cola por defecto.
+    """
+    if mode is None:
+        return celery_app.send_task(PROCESS_DOCUMENT, args=[file_path, doc_type], kwargs=kwargs, task_id=task_id)
+    queue, routing_key = QueueStats.mode_routes()[mode]
+    return celery_app.send_task(PROCESS_DOCUMENT, args=[file_path, doc_type], kwargs={**kwargs, 'mode': mode},
+                                task_id=task_id, queue=queue, routing_key=routing_key)
+
+def enqueue_reparse(content_hash: str, doc_type: Optional[str] = None, task_id: Optional[str] = None) -> AsyncResult:
+    """Encola la re-extracción sin OCR de una captura guardada (tasks.reparse_document)."""
+    return celery_app.send_task(REPARSE_DOCUMENT, args=[content_hash, doc_type], task_id=task_id)
+
+def document_signature(file_path: str, doc_type: str, **kwargs: Any) -> Signature:
+    return celery_app.signature(PROCESS_DOCUMENT, args=(file_path, doc_type), kwargs=kwargs)
+
+def enqueue_bundle(documents: Dict[str, str], **kwargs: Any) -> Tuple[AsyncResult, List[str]]:
+    """
+    documents: {doc_type: file_path}. Fan-out por documento y consolidación en el callback del chord.
+    Retorna (resultado del callback, task_ids del header): la cancelación del bundle se propaga a cada documento.
+    """
+    header = [document_signature(path, doc_type, **kwargs).set(task_id=str(uuid.uuid4()))
+              for doc_type, path in documents.items()]
+    job = chord(header)(celery_app.signature(CONSOLIDATE_BUNDLE, args=(list(documents.keys()),)))
+    return job, [signature.id for signature in header]
+
+def get_result(task_id: str) -> AsyncResult:
+    return celery_app.AsyncResult(task_id)
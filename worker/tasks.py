@@ -1,19 +1,97 @@
-import os
+import time
+import threading
+from contextlib import nullcontext
 from .celery_app import celery_app
-from app.services.ocr_engine import OCREngine
+from app.services.bundle_validator import BundleValidator
+from app.core.config import settings
+from app.core.storage import temp_storage
+from app.core.result_store import ResultStore
+from app.core.layout_store import layout_store
+from app.core.singleflight import SingleFlight
+from app.core.profiling import DocumentProfiler
+from app.core.cancellation import CancellationToken, TaskCancelled, cancellation_scope
+from app.core.metrics import (QUEUE_WAIT_SECONDS, TASK_PEAK_RSS_BYTES, TEMP_STORAGE_BYTES, TASKS_DROPPED_TOTAL,
+                              reset_peak_rss, peak_rss_bytes)
 
 ocr_engine_instance = None
+# Con el pool `threads` varias tareas pueden llegar a la vez antes de que exista el motor
+_engine_lock = threading.Lock()
 
-@celery_app.task(name="tasks.process_document_ton")
-def process_document_ton(file_path: str, doc_type: str):
+def get_engine():
     global ocr_engine_instance
     if ocr_engine_instance is None:
-        ocr_engine_instance = OCREngine()
+        with _engine_lock:
+            if ocr_engine_instance is None and settings.OCR_FAKE_ENGINE:
+                # Pruebas de carga de la ruta API/broker/backend sin OCR real
+                from app.services.fake_engine import FakeOCREngine
+                ocr_engine_instance = FakeOCREngine(settings.OCR_FAKE_LATENCY_MS, settings.OCR_FAKE_LATENCY_JITTER_MS,
+                                                    settings.OCR_FAKE_FAILURE_RATE)
+            elif ocr_engine_instance is None:
+                # Import diferido: beat y otros procesos que registran las tareas no cargan paddle/OpenCV
+                from app.services.ocr_engine import OCREngine
+                ocr_engine_instance = OCREngine()
+    return ocr_engine_instance
 
+parser_engine_instance = None
+
+def get_parser_engine():
+    """Motor sólo de parsers y scoring (reparse_document): no carga paddle ni depende de OCR_FAKE_ENGINE."""
+    global parser_engine_instance
+    if parser_engine_instance is None:
+        with _engine_lock:
+            if parser_engine_instance is None:
+                from app.services.ocr_engine import OCREngine
+                parser_engine_instance = OCREngine(load_models=False)
+    return parser_engine_instance
+
+@celery_app.task(name="tasks.process_document_ton", bind=True)
+def process_document_ton(self, file_path: str, doc_type: str, enqueued_at: float | None = None,
+                         singleflight_key: str | None = None, profile: bool = False, mode: str | None = None,
+                         deadline: float | None = None):
+    # Tiempo en cola: desde el encolado en la API hasta que el worker toma la tarea
+    queue_wait = max(0.0, time.time() - enqueued_at) if enqueued_at else None
+    if queue_wait is not None:
+        QUEUE_WAIT_SECONDS.labels(doc_type).observe(queue_wait)
+
+    # Cancelación cooperativa: deadline (cliente o SLA) y bandera de cancelOcrTask
+    token = CancellationToken(self.request.id, deadline)
+    phase = 'pickup'
+
+    # El scope elimina el upload al terminar (el pipeline trabaja en memoria, sin intermedios en disco)
     try:
-        # Llamamos al nuevo método unificado
-        result = ocr_engine_instance.process_document(file_path, doc_type)
-        return result
+        # Perfilado opt-in: cProfile + tracemalloc sólo sobre esta tarea
+        profiler = DocumentProfiler(self.request.id) if profile or settings.PROFILE_TASKS else None
+        with temp_storage.upload_scope(file_path):
+            # Tareas canceladas o vencidas mientras esperaban en cola se descartan sin OCR (ni carga del modelo)
+            token.check(force=True)
+            phase = 'running'
+            engine = get_engine()
+            # Pico de RSS por tarea (el modelo ya cargado queda incluido como base).
+            # Con el pool `threads` el pico es del proceso completo (tareas concurrentes incluidas).
+            reset_peak_rss()
+            with cancellation_scope(token), profiler or nullcontext():
+                result = engine.process_document(file_path, doc_type, mode)
+        if profiler is not None:
+            result['meta']['profile'] = profiler.report(settings.PROFILE_TTL_S)
+        if queue_wait is not None:
+            result['meta'].setdefault('timings_ms', {})['queue_wait'] = round(queue_wait * 1000, 2)
+        peak = peak_rss_bytes()
+        TASK_PEAK_RSS_BYTES.labels(doc_type).observe(peak)
+        result['meta']['peak_rss_mb'] = round(peak / (1024 * 1024), 1)
+        # Resultados grandes (ej. RTU con muchos establecimientos) van al blob store
+        return ResultStore.pack(self.request.id, result, doc_type)
+
+    except TaskCancelled as e:
+        TASKS_DROPPED_TOTAL.labels(doc_type, e.status, phase).inc()
+        return {
+            "status": e.status,
+            "meta": {
+                "isValid": False,
+                "score": 0,
+                "message": e.message
+            },
+            "data": {}
+        }
 
     except Exception as e:
         return {
@@ -25,10 +103,49 @@ def process_document_ton(file_path: str, doc_type: str):
             },
             "data": {}
         }
-    
+
     finally:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
\ No newline at end of file
+        # Nuevos envíos del mismo archivo vuelven a encolarse desde aquí
+        SingleFlight.release(singleflight_key, self.request.id)
+
+@celery_app.task(name="tasks.reparse_document", bind=True)
+def reparse_document(self, content_hash: str, doc_type: str | None = None):
+    """Re-extracción sin OCR: parsers y scoring sobre la captura guardada para el hash de contenido."""
+    capture = layout_store.get(content_hash)
+    if capture is None:
+        return {
+            "status": "FAILED",
+            "meta": {"isValid": False, "score": 0, "message": "No hay captura guardada para este documento"},
+            "data": {}
+        }
+    doc_type = doc_type or capture['doc_type']
+    try:
+        result = get_parser_engine().reparse(capture, doc_type)
+    except Exception as e:
+        return {
+            "status": "FAILED",
+            "meta": {"isValid": False, "score": 0, "message": f"Critical Error: {str(e)}"},
+            "data": {}
+        }
+    result['meta']['contentHash'] = content_hash
+    return ResultStore.pack(self.request.id, result, doc_type)
+
+@celery_app.task(name="tasks.consolidate_bundle", bind=True)
+def consolidate_bundle(self, results: list, doc_types: list):
+    """Callback del chord de onboarding: une los resultados y aplica validaciones cruzadas."""
+    try:
+        # cancelOcrTask sobre el bundle marca este id y los del header: no se consolidan documentos descartados
+        CancellationToken(self.request.id).check(force=True)
+    except TaskCancelled as e:
+        return {"status": e.status, "meta": {"isValid": False, "score": 0, "message": e.message}, "data": {}}
+    documents = {doc_type: ResultStore.unpack(result or {}) for doc_type, result in zip(doc_types, results)}
+    return ResultStore.pack(self.request.id, BundleValidator.consolidate(documents), 'BUNDLE')
+
+@celery_app.task(name="tasks.sweep_temp_storage", ignore_result=True)
+def sweep_temp_storage():
+    """Janitor periódico: elimina uploads e intermedios huérfanos por antigüedad, blobs y capturas expiradas."""
+    stats = temp_storage.sweep_orphans(settings.TEMP_ORPHAN_MAX_AGE_S)
+    stats['expired_blobs'] = ResultStore.blobs.sweep_expired()
+    stats['expired_layouts'] = layout_store.sweep_expired(settings.LAYOUT_RETENTION_DAYS * 86400)
+    TEMP_STORAGE_BYTES.set(temp_storage.usage_bytes(fresh=True))
+    return stats
\ No newline at end of file